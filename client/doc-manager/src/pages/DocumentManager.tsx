@@ -61,18 +61,27 @@ export default function DocumentManager() {
       setActiveView(targetView)
 
       try {
-        const response = await fetch(endpoint, {
-          ...(token ? { headers: { Authorization: `Token ${token}` } } : {}),
-        })
+        // Listings come in pages; each names the next in its Link header.
+        const rawData: unknown[] = []
+        let nextUrl: string | null = endpoint
+        while (nextUrl) {
+          const response: Response = await fetch(nextUrl, {
+            ...(token ? { headers: { Authorization: `Token ${token}` } } : {}),
+          })
+
+          if (!response.ok) {
+            setFiles([])
+            setSelectedFile(null)
+            return
+          }
 
-        if (!response.ok) {
-          setFiles([])
-          setSelectedFile(null)
-          return
+          rawData.push(...(await response.json()))
+          const next = response.headers.get('Link')?.match(/<([^>]+)>;\s*rel="next"/)?.[1]
+          // Stay on this origin, which may be a dev proxy in front of the API.
+          const nextLocation = next ? new URL(next, window.location.href) : null
+          nextUrl = nextLocation ? nextLocation.pathname + nextLocation.search : null
         }
 
-        const rawData = await response.json()
-
         const normalisedData: FileItem[] =
           targetView === 'all'
             ? (rawData as AllFilesResponseItem[]).map((item) => ({
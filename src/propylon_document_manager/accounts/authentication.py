@@ -0,0 +1,231 @@
+"""Token authentication that resolves tokens without a query per request.
+
+``CachedTokenAuthentication`` is a drop-in replacement for DRF's
+``TokenAuthentication``. What a request needs of a resolved token, its
+creation time and its user's id, profile and flags (``USER_FIELDS``), is
+kept in a per-process LRU and in the configured cache, so only the first
+request with a token in a while reaches the database. The password hash
+is never cached: every other user field is deferred and loaded from the
+database only if a request reads it.
+
+Every cached entry is stamped with its user's revocation generation and
+a global epoch, both held in the shared cache and read on every hit.
+Deleting a token, logging out, changing a password or saving a user
+bumps only that user's generation and drops their entries from the
+shared cache and this process's LRU; the epoch is bumped only by
+``revoke_all``, for bulk changes that send no signals. Tokens expire
+``AUTH_TOKEN_TTL`` seconds after they were issued.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import random
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Iterable, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+KEY_PREFIX = "authtoken"
+EPOCH_KEY = f"{KEY_PREFIX}:epoch"
+USER_FIELDS = ("id", "email", "name", "is_active", "is_staff", "is_superuser")
+
+
+def token_expired(token: Any, now=None) -> bool:
+    ttl = int(getattr(settings, "AUTH_TOKEN_TTL", 0))
+    return ttl > 0 and token.created + timedelta(seconds=ttl) <= (now or timezone.now())
+
+
+def token_needs_rotation(token: Any) -> bool:
+    """Return whether login should replace ``token`` with a new key."""
+
+    rotate_after = int(getattr(settings, "AUTH_TOKEN_ROTATE_AFTER", 0))
+    return token_expired(token) or (
+        rotate_after > 0 and token.created + timedelta(seconds=rotate_after) <= timezone.now()
+    )
+
+
+def issue_token(user: Any) -> Any:
+    """Return the user's token, replacing it first when it is due for rotation."""
+
+    from rest_framework.authtoken.models import Token
+
+    with transaction.atomic():
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and token_needs_rotation(token):
+            token.delete()
+            token = Token.objects.create(user=user)
+    return token
+
+
+def token_response_data(token: Any) -> dict[str, Any]:
+    data = {"token": token.key}
+    ttl = int(getattr(settings, "AUTH_TOKEN_TTL", 0))
+    if ttl > 0:
+        data["expires_at"] = token.created + timedelta(seconds=ttl)
+    return data
+
+
+class TokenCache:
+    """LRU of resolved tokens in front of the shared cache, both stamped per user.
+
+    Entries are ``{"created": ..., "user": {field: value}}`` dicts, which
+    ``CachedTokenAuthentication`` turns back into a token and a user.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self._max_entries = max_entries
+        # key -> (stamp, fields)
+        self.entries: OrderedDict[str, tuple[tuple[int, int], dict[str, Any]]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return int(getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 10_000))
+
+    @staticmethod
+    def cache_key(key: str) -> str:
+        return f"{KEY_PREFIX}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+    @staticmethod
+    def generation_key(user_id: Any) -> str:
+        return f"{KEY_PREFIX}:user:{user_id}"
+
+    @classmethod
+    def stamp(cls, user_id: Any) -> tuple[int, int]:
+        """Return the current ``(epoch, user generation)`` in one cache read."""
+
+        keys = (EPOCH_KEY, cls.generation_key(user_id))
+        values = cache.get_many(keys)
+        for key in keys:
+            if values.get(key) is None:
+                # A random start keeps an evicted counter from matching old entries.
+                cache.add(key, random.getrandbits(48), None)
+                values[key] = cache.get(key)
+        return values[keys[0]], values[keys[1]]
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        """Return the cached fields of the token ``key`` if its stamp is still current, or ``None``."""
+
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            entry = cache.get(self.cache_key(key))
+            if entry is None:
+                return None
+        stamp, fields = entry
+        if self.stamp(fields["user"]["id"]) != stamp:
+            return None
+        self._remember(key, stamp, fields)
+        return fields
+
+    def put(self, key: str, stamp: tuple[int, int], fields: dict[str, Any]) -> None:
+        """Cache the token's ``fields`` under the stamp read before they were loaded."""
+
+        cache.set(self.cache_key(key), (stamp, fields), int(getattr(settings, "AUTH_TOKEN_CACHE_TIMEOUT", 300)))
+        self._remember(key, stamp, fields)
+
+    def _remember(self, key: str, stamp: tuple[int, int], fields: dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[key] = (stamp, fields)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def revoke(self, user_id: Any, keys: Iterable[str] = ()) -> None:
+        """Make the user's cached tokens stale, now and again once the transaction commits.
+
+        ``keys`` are also dropped from the shared cache. The second bump
+        covers readers that loaded a token before the change was committed.
+        """
+
+        keys = list(keys)
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[1]["user"]["id"] == user_id]:
+                del self.entries[key]
+        cache.delete_many([self.cache_key(key) for key in keys])
+        generation_key = self.generation_key(user_id)
+        self._bump(generation_key)
+        transaction.on_commit(lambda: self._bump(generation_key))
+
+    def revoke_all(self) -> None:
+        """Make every cached token stale, for bulk changes that send no signals."""
+
+        self.clear()
+        self._bump(EPOCH_KEY)
+        transaction.on_commit(lambda: self._bump(EPOCH_KEY))
+
+    @staticmethod
+    def _bump(key: str) -> None:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, random.getrandbits(48), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` with cached lookups and token expiry."""
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        fields = token_cache.get(key)
+        if fields is None:
+            # The stamp is read before the token is loaded, so a revocation
+            # committed in between leaves the cached copy stale.
+            user_id = model.objects.filter(key=key).values_list("user_id", flat=True).first()
+            if user_id is None:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            stamp = token_cache.stamp(user_id)
+            row = model.objects.filter(key=key).values("created", *(f"user__{name}" for name in USER_FIELDS)).first()
+            if row is None:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            fields = {"created": row["created"], "user": {name: row[f"user__{name}"] for name in USER_FIELDS}}
+            token_cache.put(key, stamp, fields)
+
+        # Each request gets its own instances.
+        user = self._from_fields(get_user_model(), fields["user"])
+        token = self._from_fields(model, {"key": key, "user_id": user.pk, "created": fields["created"]})
+        token.user = user
+
+        if token_expired(token):
+            raise exceptions.AuthenticationFailed(_("Token has expired."))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return user, token
+
+    @staticmethod
+    def _from_fields(model, fields: dict[str, Any]) -> Any:
+        """Return a ``model`` instance with ``fields`` loaded and every other field deferred."""
+
+        names = [field.attname for field in model._meta.concrete_fields if field.attname in fields]
+        return model.from_db(None, names, [fields[name] for name in names])
+
+
+__all__ = [
+    "CachedTokenAuthentication",
+    "TokenCache",
+    "USER_FIELDS",
+    "issue_token",
+    "token_cache",
+    "token_expired",
+    "token_needs_rotation",
+    "token_response_data",
+]
@@ -0,0 +1,34 @@
+"""Revoke cached tokens when a token, a password or a user changes."""
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(sender, instance, **kwargs):
+    token_cache.revoke(instance.user_id, [instance.key])
+
+
+@receiver(user_logged_out)
+def delete_tokens_on_logout(sender, request, user, **kwargs):
+    if user is not None:
+        Token.objects.filter(user=user).delete()
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def delete_tokens_on_password_change(sender, instance, raw=False, **kwargs):
+    # ``set_password`` keeps the new raw password until the user is saved.
+    if not raw and instance.pk is not None and getattr(instance, "_password", None) is not None:
+        Token.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_tokens_of_changed_user(sender, instance, created=False, update_fields=None, **kwargs):
+    # Cached tokens carry a copy of the user; logins only touch last_login.
+    if not created and set(update_fields or ()) != {"last_login"}:
+        token_cache.revoke(instance.pk)
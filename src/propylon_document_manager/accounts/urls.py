@@ -1,11 +1,12 @@
 from django.urls import path
 
-from .views import LoginView, RegisterView, UserView
+from .views import LoginView, LogoutView, RegisterView, UserView
 
 app_name = "accounts"
 
 urlpatterns = [
     path("signup/", RegisterView.as_view(), name="signup"),
     path("login/", LoginView.as_view(), name="login"),
+    path("logout/", LogoutView.as_view(), name="logout"),
     path("me/", UserView.as_view(), name="me"),
 ]
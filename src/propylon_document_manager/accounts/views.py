@@ -1,9 +1,11 @@
 from django.contrib.auth import authenticate
 from rest_framework import permissions, status
 from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .authentication import issue_token, token_response_data
 from .serializers import LoginSerializer, RegisterSerializer
 
 
@@ -30,8 +32,7 @@ class LoginView(APIView):
                 password=serializer.validated_data["password"],
             )
             if user:
-                token, _ = Token.objects.get_or_create(user=user)
-                return Response({"token": token.key})
+                return Response(token_response_data(issue_token(user)))
             return Response(
                 {"detail": "Invalid email address or password."},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -39,6 +40,23 @@ class LoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ObtainRotatingAuthToken(ObtainAuthToken):
+    """DRF's ``obtain_auth_token``, issuing tokens the way ``LoginView`` does."""
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(token_response_data(issue_token(serializer.validated_data["user"])))
+
+
+class LogoutView(APIView):
+    """Delete the user's API token; cached copies are revoked with it."""
+
+    def post(self, request):
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class UserView(APIView):
     def get(self, request):
         if request.user.is_authenticated:
@@ -0,0 +1,298 @@
+"""HTTP responses for serving stored blobs."""
+
+import io
+import mimetypes
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from propylon_document_manager.utils.blob_store import INGEST_CHUNK_SIZE, blob_size, is_encoded, open_blob
+
+# More ranges than this in one request are ignored and the whole file is sent,
+# so a client cannot make the server seek around a blob thousands of times.
+MAX_RANGES = 32
+
+Segment = Union[bytes, tuple[int, int]]
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[list[tuple[int, int]]]:
+    """Parse a ``Range: bytes=...`` header against a representation of ``size`` bytes.
+
+    Returns ``None`` when the header is absent, malformed or should be
+    ignored, an empty list when no requested range is satisfiable, and
+    otherwise the sorted, coalesced list of inclusive ``(start, end)`` pairs.
+    """
+
+    if not header:
+        return None
+
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        first, separator, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not separator:
+            return None
+
+        if not first:
+            if not last.isdigit():
+                return None
+            suffix_length = int(last)
+            if suffix_length and size:
+                ranges.append((max(size - suffix_length, 0), size - 1))
+            continue
+
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            end = int(last) if last else size - 1
+            ranges.append((start, min(end, size - 1)))
+
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+class SegmentReader:
+    """Read-only file object over literal byte strings and ranges of a file.
+
+    ``FileResponse`` only needs ``read``, ``seek``, ``tell`` and ``close``,
+    so a range response streams straight from the blob without building the
+    body in memory. There is deliberately no ``fileno``: a WSGI server must
+    not ``sendfile`` the whole underlying blob for a partial response.
+    """
+
+    def __init__(self, file_obj: BinaryIO, segments: list[Segment]):
+        self.file_obj = file_obj
+        self.segments = segments
+        self.length = sum(
+            len(segment) if isinstance(segment, bytes) else segment[1] - segment[0] + 1 for segment in segments
+        )
+        self.position = 0
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.length + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self.position = max(0, self.position)
+        return self.position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        pieces = []
+        offset = 0
+        for segment in self.segments:
+            if size <= 0:
+                break
+            segment_length = len(segment) if isinstance(segment, bytes) else segment[1] - segment[0] + 1
+            if self.position < offset + segment_length:
+                inner = self.position - offset
+                take = min(size, segment_length - inner)
+                if isinstance(segment, bytes):
+                    piece = segment[inner : inner + take]
+                else:
+                    self.file_obj.seek(segment[0] + inner)
+                    piece = self.file_obj.read(take)
+                if not piece:
+                    break
+                pieces.append(piece)
+                self.position += len(piece)
+                size -= len(piece)
+            offset += segment_length
+
+        return b"".join(pieces)
+
+    def close(self) -> None:
+        self.file_obj.close()
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Return whether an ``If-None-Match`` header matches ``etag`` (weak comparison)."""
+
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def not_modified_response(etag: str, cache_control: Optional[str] = None) -> HttpResponse:
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    if cache_control:
+        response["Cache-Control"] = cache_control
+    return response
+
+
+def attachment_disposition(filename: str) -> str:
+    """Return a ``Content-Disposition`` value matching what ``FileResponse`` sends."""
+
+    filename = os.path.basename(filename)
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        return f"attachment; filename*=utf-8''{quote(filename)}"
+    escaped = filename.replace("\\", "\\\\").replace('"', r"\"")
+    return f'attachment; filename="{escaped}"'
+
+
+def offload_response(path: Union[str, Path], filename: str) -> Optional[HttpResponse]:
+    """Return an empty response telling the front proxy to send ``path`` itself.
+
+    ``FILES_OFFLOAD`` selects the header: ``x-accel-redirect`` (nginx, with
+    ``FILES_OFFLOAD_PREFIX`` as an ``internal`` location aliased to
+    ``FILES_ROOT``) or ``x-sendfile`` (Apache/lighttpd, absolute path). The
+    proxy then also handles ``Range``. Returns ``None`` when offloading is
+    disabled.
+    """
+
+    mode = (getattr(settings, "FILES_OFFLOAD", "") or "").lower()
+    if not mode:
+        return None
+
+    response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+    response["Content-Disposition"] = attachment_disposition(filename)
+    blob = Path(path)
+    if mode == "x-accel-redirect":
+        relative = blob.relative_to(Path(settings.FILES_ROOT)).as_posix()
+        prefix = settings.FILES_OFFLOAD_PREFIX.rstrip("/")
+        response["X-Accel-Redirect"] = quote(f"{prefix}/{relative}")
+    elif mode == "x-sendfile":
+        response["X-Sendfile"] = str(blob.resolve())
+    else:
+        raise ValueError(f"Unknown FILES_OFFLOAD mode: {mode!r}")
+    return response
+
+
+def stream_size(file_obj: BinaryIO) -> int:
+    """Return the size of an open blob, which is in memory if it was packed since it was located."""
+
+    try:
+        return os.fstat(file_obj.fileno()).st_size
+    except (AttributeError, io.UnsupportedOperation):
+        position = file_obj.tell()
+        size = file_obj.seek(0, io.SEEK_END)
+        file_obj.seek(position)
+        return size
+
+
+def blob_response(
+    request,
+    path: Union[str, Path],
+    filename: str,
+    etag: Optional[str] = None,
+    cache_control: Optional[str] = None,
+) -> HttpResponse:
+    """Return a download response for the blob at ``path``.
+
+    Compressed and delta blobs are decoded while streaming. ``Range`` requests
+    are honoured. When ``etag`` is given (blobs are
+    content-addressed, so the digest is a strong validator) it is sent as
+    ``ETag``, ``If-None-Match`` yields a 304 and ``If-Range`` must match it
+    for a range to be served.
+    """
+
+    quoted_etag = quote_etag(etag) if etag else None
+    if quoted_etag and etag_matches(request.META.get("HTTP_IF_NONE_MATCH"), quoted_etag):
+        return not_modified_response(quoted_etag, cache_control)
+
+    # The proxy would send a compressed or delta blob's stored bytes, so
+    # those are always decoded here.
+    response = None if is_encoded(path) else offload_response(path, filename)
+    if response is not None:
+        if quoted_etag:
+            response["ETag"] = quoted_etag
+        if cache_control:
+            response["Cache-Control"] = cache_control
+        return response
+
+    file_obj = open_blob(path)
+    size = blob_size(path) if is_encoded(path) else stream_size(file_obj)
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range.strip() != quoted_etag:
+        range_header = None
+    ranges = parse_range_header(range_header, size)
+
+    if ranges == []:
+        file_obj.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif ranges is None:
+        response = FileResponse(file_obj, as_attachment=True, filename=filename)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = FileResponse(
+            SegmentReader(file_obj, [(start, end)]),
+            as_attachment=True,
+            filename=filename,
+            status=206,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        boundary = uuid.uuid4().hex
+        part_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        segments: list[Segment] = []
+        for start, end in ranges:
+            segments.append(
+                (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {part_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode()
+            )
+            segments.append((start, end))
+            segments.append(b"\r\n")
+        segments.append(f"--{boundary}--\r\n".encode())
+        response = FileResponse(
+            SegmentReader(file_obj, segments),
+            as_attachment=True,
+            filename=filename,
+            status=206,
+            content_type=f"multipart/byteranges; boundary={boundary}",
+        )
+
+    if isinstance(response, FileResponse):
+        response.block_size = INGEST_CHUNK_SIZE
+    response["Accept-Ranges"] = "bytes"
+    if quoted_etag:
+        response["ETag"] = quoted_etag
+    if cache_control:
+        response["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,118 @@
+import base64
+import binascii
+import json
+from typing import Any, Callable, Optional
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginate file versions by ``(file_name, version_number, id)``.
+
+    Every request gets a page, of ``page_size`` rows unless it asks for up
+    to ``max_page_size``; ``/api/files/?stream=1`` remains the way to
+    export every row at once. Each page is fetched with
+    a range condition on the composite key instead of an ``OFFSET``, so
+    every page costs the same however deep the client pages. The page body
+    stays a plain list; the next page is advertised in a
+    ``Link: <...>; rel="next"`` header carrying an opaque cursor.
+
+    A view can pass ``first_page``, a callable returning the first ``limit``
+    rows in order, to serve requests without a cursor from a cache.
+    """
+
+    ordering = ("file_name", "version_number", "id")
+    cursor_query_param = "cursor"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None, first_page: Optional[Callable[[int], list]] = None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.next_position: Optional[tuple[Any, ...]] = None
+
+        # One row past the page tells whether there is a next one.
+        limit = self.page_size_value + 1
+        position = self.decode_cursor(request)
+        if position is None and first_page is not None:
+            records = list(first_page(limit))
+        else:
+            if position is not None:
+                queryset = queryset.filter(self.after(position))
+            records = list(queryset.order_by(*self.ordering)[:limit])
+        if len(records) > self.page_size_value:
+            records = records[: self.page_size_value]
+            self.next_position = self.position_of(records[-1])
+
+        return records
+
+    def get_paginated_response(self, data):
+        headers = {}
+        next_link = self.get_next_link()
+        if next_link is not None:
+            headers["Link"] = f'<{next_link}>; rel="next"'
+        return Response(data, headers=headers)
+
+    def get_page_size(self, request) -> int:
+        raw_size = request.query_params.get(self.page_size_query_param)
+        if raw_size is None:
+            return self.page_size
+        try:
+            size = int(raw_size)
+        except ValueError:
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def after(self, position: tuple[Any, ...]) -> Q:
+        """Return the condition selecting rows strictly after ``position``.
+
+        The redundant bound on the first field lets the database seek into
+        an index on the ordering instead of testing the OR from the start.
+        """
+
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            equal = {name: value for name, value in zip(self.ordering[:index], position)}
+            condition |= Q(**equal, **{f"{field}__gt": position[index]})
+        return Q(**{f"{self.ordering[0]}__gte": position[0]}) & condition
+
+    def position_of(self, record) -> tuple[Any, ...]:
+        if isinstance(record, dict):
+            return tuple(record[field] for field in self.ordering)
+        return tuple(getattr(record, field) for field in self.ordering)
+
+    @staticmethod
+    def encode_cursor(position: tuple[Any, ...]) -> str:
+        payload = json.dumps(list(position), separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+    def decode_cursor(self, request) -> Optional[tuple[Any, ...]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            file_name, version_number, record_id = position
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(file_name, str) or not isinstance(version_number, int) or not isinstance(record_id, int):
+            raise NotFound(self.invalid_cursor_message)
+
+        return (file_name, version_number, record_id)
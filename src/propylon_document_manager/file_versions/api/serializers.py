@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
-from ..models import FileVersion, UserFileVersion
+from propylon_document_manager.utils import ChunkedUpload, in_import_roots
+
+from ..models import FileVersion, UploadSession, UserFileVersion
+
 
 class FileVersionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,3 +15,40 @@ class UserFileVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFileVersion
         fields = "__all__"
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    received_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "file_name", "created_at", "updated_at", "received_chunks"]
+        read_only_fields = ["id", "created_at", "updated_at"]
+
+    def get_received_chunks(self, obj) -> list[int]:
+        return ChunkedUpload(obj.id).received_chunks()
+
+
+class DigestReferenceSerializer(serializers.Serializer):
+    digest_hex = serializers.RegexField(r"^[0-9a-f]{64}$")
+    file_name = serializers.CharField(max_length=512, required=False)
+
+
+class DigestPreflightSerializer(serializers.Serializer):
+    items = DigestReferenceSerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class BatchUploadSerializer(serializers.Serializer):
+    filepaths = serializers.ListField(
+        child=serializers.CharField(max_length=512),
+        allow_empty=False,
+        max_length=5000,
+    )
+
+    def validate_filepaths(self, filepaths: list[str]) -> list[str]:
+        outside = [filepath for filepath in filepaths if not in_import_roots(filepath)]
+        if outside:
+            raise serializers.ValidationError(
+                f"Files can only be stored from FILES_IMPORT_ROOTS: {', '.join(outside)}"
+            )
+        return filepaths
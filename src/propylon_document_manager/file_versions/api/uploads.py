@@ -0,0 +1,62 @@
+"""Upload handling that streams request bodies straight into the blob store."""
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from propylon_document_manager.utils import BlobWriter
+from propylon_document_manager.utils.blob_store import INGEST_CHUNK_SIZE
+
+
+class BlobUploadedFile(UploadedFile):
+    """An uploaded file already spooled, and hashed, inside ``FILES_ROOT``.
+
+    Closing it removes the spooled copy unless it was committed, so files the
+    view did not use never linger in the store.
+    """
+
+    def __init__(self, writer: BlobWriter, name, content_type, size, charset, content_type_extra=None):
+        self.writer = writer
+        self.digest_hex = writer.close()
+        super().__init__(writer.temp_path.open("rb"), name, content_type, size, charset, content_type_extra)
+
+    def temporary_file_path(self) -> str:
+        return str(self.writer.temp_path)
+
+    def close(self):
+        try:
+            return super().close()
+        finally:
+            self.writer.discard()
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """Write each uploaded file into a ``BlobWriter`` as its chunks arrive.
+
+    Nothing is buffered in memory and the content is hashed on the way in,
+    so the upload can be finalized without reading it again.
+    """
+
+    chunk_size = INGEST_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.writer = BlobWriter()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        return BlobUploadedFile(
+            self.writer,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        writer = getattr(self, "writer", None)
+        if writer is not None:
+            writer.discard()
@@ -1,21 +1,79 @@
-import os
-from pathlib import Path
+import errno
+import json
 
 from django.conf import settings
-from django.http import FileResponse
-
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.mixins import RetrieveModelMixin, ListModelMixin
+from rest_framework.mixins import CreateModelMixin, DestroyModelMixin, ListModelMixin, RetrieveModelMixin
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.viewsets import GenericViewSet
 from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet
+
+from propylon_document_manager.utils import (
+    ChunkedUpload,
+    ChunkTooLarge,
+    FileDownload,
+    FileUpload,
+    in_import_roots,
+    is_valid_digest,
+    locate_blob,
+)
+from propylon_document_manager.utils.metadata_cache import metadata_cache
+
+from ..models import FileVersion, UploadSession, UserFileVersion
+from .downloads import blob_response, etag_matches, not_modified_response
+from .pagination import KeysetPagination
+from .serializers import (
+    BatchUploadSerializer,
+    DigestPreflightSerializer,
+    DigestReferenceSerializer,
+    FileVersionSerializer,
+    UploadSessionSerializer,
+)
+from .uploads import BlobUploadHandler
+
+STREAM_CHUNK_SIZE = 2000
+
+
+def storage_error_response(exc: OSError, file_name: str) -> Response:
+    """Report a failure to store ``file_name``; a full disk is 507, anything else 500."""
+
+    if exc.errno in (errno.ENOSPC, errno.EDQUOT):
+        code = status.HTTP_507_INSUFFICIENT_STORAGE
+    else:
+        code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    return Response({"detail": f"Error saving {file_name}: {exc}"}, status=code)
+
+
+def finalized_upload_response(writer, file_name, user):
+    """Store a spooled blob as the next version of ``file_name`` for ``user``."""
+
+    try:
+        file_version = FileUpload.finalize(writer, file_name)
+    except OSError as exc:
+        return storage_error_response(exc, file_name)
+
+    if file_version is None:
+        return Response(
+            {"detail": "File already exists.", "digest_hex": writer.digest_hex},
+            status=status.HTTP_200_OK,
+        )
 
-from propylon_document_manager.utils import FileDownload, FileUpload
+    UserFileVersion.objects.create(fileversion=file_version, user=user)
+    return Response(FileVersionSerializer(file_version).data, status=status.HTTP_201_CREATED)
 
-from ..models import FileVersion
-from .serializers import FileVersionSerializer
+
+def ndjson_lines(records):
+    """Yield each record as one line of newline-delimited JSON."""
+
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
 
 
 class FileVersionViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
@@ -23,16 +81,44 @@ class FileVersionViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
     serializer_class = FileVersionSerializer
     queryset = FileVersion.objects.all()
     lookup_field = "id"
+    pagination_class = KeysetPagination
 
     @action(detail=True, methods=["get"], url_path="download")
     def download(self, request, id=None):
-        file_version = self.get_object()
-        base_name, ext = os.path.splitext(file_version.file_name)
-        filename_with_version = f"{base_name}.{file_version.version_number}{ext}"
-        file_path = Path(settings.FILES_ROOT) / filename_with_version
-        if not file_path.exists():
+        try:
+            file_version = FileDownload.get_version(int(id))
+        except (TypeError, ValueError):
+            file_version = None
+        file_path = locate_blob(file_version["digest_hex"]) if file_version is not None else None
+        if file_path is None:
+            return Response({"detail": "File not found."}, status=status.HTTP_404_NOT_FOUND)
+        return blob_response(request, file_path, file_version["file_name"], etag=file_version["digest_hex"])
+
+
+class BlobView(APIView):
+    """Serve a blob by its digest.
+
+    The URL names the content itself, so responses never change and are
+    marked cacheable for as long as ``FILES_BLOB_CACHE_CONTROL`` allows.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, digest, *args, **kwargs):
+        if not is_valid_digest(digest):
+            return Response({"detail": "File not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        cache_control = settings.FILES_BLOB_CACHE_CONTROL
+        etag = f'"{digest}"'
+        if etag_matches(request.META.get("HTTP_IF_NONE_MATCH"), etag):
+            return not_modified_response(etag, cache_control)
+
+        file_name = FileDownload.get_blob_name(digest)
+        file_path = locate_blob(digest) if file_name is not None else None
+        if file_path is None:
             return Response({"detail": "File not found."}, status=status.HTTP_404_NOT_FOUND)
-        return FileResponse(open(file_path, "rb"), as_attachment=True, filename=file_version.file_name)
+
+        return blob_response(request, file_path, file_name, etag=digest, cache_control=cache_control)
 
 
 class FileUploadView(APIView):
@@ -59,21 +145,234 @@ class FileUploadView(APIView):
         except (ValueError, OSError) as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
+        if str(request.data.get("store", "")).lower() in ("1", "true", "yes"):
+            if not in_import_roots(file_upload.filepath):
+                return Response(
+                    {"detail": "Files can only be stored from FILES_IMPORT_ROOTS."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+            message = file_upload.upload()
+            return Response(
+                {"digest_hex": file_upload.digest_hex, "detail": message},
+                status=status.HTTP_200_OK,
+            )
+
         return Response({"digest_hex": file_upload.digest_hex}, status=status.HTTP_200_OK)
 
 
+class FileContentUploadView(APIView):
+    """Accept file bytes as ``multipart/form-data`` and store them as a new version.
+
+    The ``file`` part is hashed and written into ``FILES_ROOT`` while it is
+    received; ``file_name`` defaults to the uploaded file's name.
+    """
+
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be set before anything (including CSRF checks) reads the body.
+        request.upload_handlers = [BlobUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        uploaded = request.FILES.get("file")
+        if uploaded is None:
+            return Response(
+                {"detail": "The file field is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        file_name = request.data.get("file_name") or uploaded.name
+        return finalized_upload_response(uploaded.writer, file_name, request.user)
+
+
+class BatchUploadView(APIView):
+    """Store a list of server-side ``filepaths``, all below ``FILES_IMPORT_ROOTS``, in one request.
+
+    Hashing runs in this process's shared pool of ``FILES_BATCH_UPLOAD_WORKERS``
+    workers, and all new versions and their ownership rows are inserted in
+    one transaction; the response has a result per path.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = BatchUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            results = FileUpload.upload_many(
+                serializer.validated_data["filepaths"],
+                executor=FileUpload.shared_executor(),
+            )
+            created_ids = [result["id"] for result in results if result.get("status") == "created"]
+            UserFileVersion.objects.bulk_create(
+                [UserFileVersion(fileversion_id=fileversion_id, user=request.user) for fileversion_id in created_ids]
+            )
+            if created_ids:
+                metadata_cache.invalidate_users([request.user.pk])
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class DigestPreflightView(APIView):
+    """Report which digests are already stored, before any bytes are sent.
+
+    Accepts ``{"items": [{"digest_hex": ..., "file_name": ...}, ...]}``.
+    Stored content can then be versioned through ``FileReferenceView``.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = DigestPreflightSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["items"]
+
+        stored = FileUpload.stored_digests(item["digest_hex"] for item in items)
+        results = [
+            {
+                "digest_hex": item["digest_hex"],
+                "file_name": item.get("file_name"),
+                "exists": item["digest_hex"] in stored,
+            }
+            for item in items
+        ]
+        return Response({"items": results}, status=status.HTTP_200_OK)
+
+
+class FileReferenceView(APIView):
+    """Create a new version of ``file_name`` from content already in the store."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = DigestReferenceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file_name = serializer.validated_data.get("file_name")
+        if not file_name:
+            return Response(
+                {"detail": "The file_name parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        file_version, created = FileUpload.create_by_reference(serializer.validated_data["digest_hex"], file_name)
+        if file_version is None:
+            return Response({"detail": "File not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        UserFileVersion.objects.get_or_create(fileversion=file_version, user=request.user)
+        return Response(
+            FileVersionSerializer(file_version).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+class UploadSessionViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+    """Resumable uploads sent as numbered chunks.
+
+    Create a session with a ``file_name``, ``PUT`` raw bytes to
+    ``chunks/<index>/`` in any order and concurrently, retry whatever is
+    missing from ``received_chunks`` and finally ``POST`` ``commit/`` with
+    the ``chunk_count``.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadSessionSerializer
+    lookup_field = "id"
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        ChunkedUpload(instance.id).remove()
+        instance.delete()
+
+    @action(detail=True, methods=["put"], url_path=r"chunks/(?P<index>\d+)")
+    def chunk(self, request, id=None, index=None):
+        session = self.get_object()
+        try:
+            index = int(index)
+            # Read the raw body straight from the underlying Django request.
+            size = ChunkedUpload(session.id).write_chunk(index, request._request)
+        except ChunkTooLarge as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except OSError as exc:
+            return storage_error_response(exc, session.file_name)
+
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+        return Response({"index": index, "size": size}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"])
+    def commit(self, request, id=None):
+        session = self.get_object()
+        try:
+            chunk_count = int(request.data.get("chunk_count"))
+        except (TypeError, ValueError):
+            chunk_count = 0
+        upload = ChunkedUpload(session.id)
+        if chunk_count < 1 or chunk_count > upload.max_chunks():
+            return Response(
+                {"detail": f"chunk_count must be a positive integer of at most {upload.max_chunks()}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        missing = upload.missing_chunks(chunk_count)
+        if missing:
+            return Response(
+                {"detail": "Some chunks have not been received.", "missing_chunks": missing},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            writer = upload.assemble(chunk_count)
+        except FileNotFoundError:
+            # A concurrent commit or delete of the session removed its chunks.
+            return Response(
+                {"detail": "The session's chunks were removed while it was being committed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except OSError as exc:
+            return storage_error_response(exc, session.file_name)
+
+        response = finalized_upload_response(writer, session.file_name, request.user)
+        if response.status_code < 500:
+            upload.remove()
+            session.delete()
+        return response
+
+
 class UserFileListView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get(self, request, *args, **kwargs):
         downloader = FileDownload(filepath="placeholder.txt", user=request.user)
-        files = downloader.file_list()
-        return Response(files, status=status.HTTP_200_OK)
+        paginator = self.pagination_class()
+        records = paginator.paginate_queryset(
+            downloader.user_files(), request, view=self, first_page=downloader.first_user_files
+        )
+        files = [downloader.file_list_entry(record) for record in records]
+        return paginator.get_paginated_response(files)
 
 
 class FileListView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get(self, request, *args, **kwargs):
-        files = FileDownload.get_all_files()
-        return Response(files, status=status.HTTP_200_OK)
+        if request.query_params.get("stream", "").lower() in ("1", "true", "yes"):
+            # Export every row as NDJSON; the queryset is read in chunks and
+            # never held in memory as a whole.
+            records = FileDownload.all_files().iterator(chunk_size=STREAM_CHUNK_SIZE)
+            return StreamingHttpResponse(ndjson_lines(records), content_type="application/x-ndjson")
+
+        paginator = self.pagination_class()
+        files = paginator.paginate_queryset(FileDownload.all_files(), request, view=self)
+        return paginator.get_paginated_response(files)
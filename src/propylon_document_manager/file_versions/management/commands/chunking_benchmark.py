@@ -0,0 +1,98 @@
+import hashlib
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.utils.blob_store import locate_blob, open_blob
+from propylon_document_manager.utils.chunking import ChunkingPolicy, iter_chunks
+from propylon_document_manager.utils.file_tree import walk_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure content-defined chunking on the stored versions (or the files below a "
+        "directory): deduplication ratio against whole-file deduplication, and throughput. "
+        "Nothing is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", nargs="?", help="Benchmark these files instead of the store.")
+        parser.add_argument("--min-size", type=int, default=None, help="Defaults to FILES_CHUNK_MIN_SIZE.")
+        parser.add_argument("--avg-size", type=int, default=None, help="Defaults to FILES_CHUNK_AVG_SIZE.")
+        parser.add_argument("--max-size", type=int, default=None, help="Defaults to FILES_CHUNK_MAX_SIZE.")
+
+    def handle(self, *args, **options):
+        configured = ChunkingPolicy.from_settings()
+        policy = ChunkingPolicy(
+            enabled=True,
+            min_size=options["min_size"] or configured.min_size,
+            avg_size=options["avg_size"] or configured.avg_size,
+            max_size=options["max_size"] or configured.max_size,
+        )
+        try:
+            policy.validate()
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        files = total = chunk_count = hash_seconds = 0
+        whole_files: set[str] = set()
+        whole_bytes = 0
+        chunks: dict[str, int] = {}
+        started = time.perf_counter()
+        for file_obj in self._corpus(options["directory"]):
+            file_hasher = hashlib.sha256()
+            size = 0
+            with file_obj:
+                for chunk in iter_chunks(file_obj, policy):
+                    hash_started = time.perf_counter()
+                    file_hasher.update(chunk)
+                    chunks.setdefault(hashlib.sha256(chunk).hexdigest(), len(chunk))
+                    hash_seconds += time.perf_counter() - hash_started
+                    chunk_count += 1
+                    size += len(chunk)
+            files += 1
+            total += size
+            digest_hex = file_hasher.hexdigest()
+            if digest_hex not in whole_files:
+                whole_files.add(digest_hex)
+                whole_bytes += size
+        elapsed = max(time.perf_counter() - started, 1e-9)
+
+        if not files:
+            raise CommandError("No files to benchmark.")
+        chunk_bytes = sum(chunks.values())
+        self.stdout.write(
+            f"chunk sizes: min {policy.min_size}, avg {policy.avg_size}, max {policy.max_size}\n"
+            f"files:       {files} ({total} bytes)\n"
+            f"chunks:      {chunk_count} ({len(chunks)} unique, {total // max(chunk_count, 1)} bytes on average)\n"
+            f"whole-file:  {whole_bytes} bytes stored, {self._ratio(total, whole_bytes)} dedup ratio\n"
+            f"chunked:     {chunk_bytes} bytes stored, {self._ratio(total, chunk_bytes)} dedup ratio"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "%.1f MB/s chunking, %.1f MB/s including hashing"
+                % (total / max(elapsed - hash_seconds, 1e-9) / 1_000_000, total / elapsed / 1_000_000)
+            )
+        )
+
+    def _corpus(self, directory):
+        if directory:
+            root = Path(directory)
+            if not root.is_dir():
+                raise CommandError(f"Directory does not exist: {root}")
+            for path, _ in walk_files(root):
+                yield open(path, "rb")
+            return
+
+        for digest_hex in FileVersion.objects.values_list("digest_hex", flat=True).distinct().iterator():
+            path = locate_blob(digest_hex)
+            if path is None:
+                self.stderr.write(f"Blob not found: {digest_hex}")
+                continue
+            yield open_blob(path)
+
+    @staticmethod
+    def _ratio(total: int, stored: int) -> str:
+        return f"{total / stored if stored else 1.0:.2f}x"
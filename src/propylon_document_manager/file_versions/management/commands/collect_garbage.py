@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.utils.garbage import GarbageCollector
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove stored blobs and chunks that no file version references any more. "
+        "Anything changed within FILES_GC_GRACE_PERIOD seconds is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be removed, remove nothing.")
+        parser.add_argument(
+            "--grace-period",
+            type=float,
+            default=None,
+            help="Keep unreferenced blobs younger than this many seconds (defaults to FILES_GC_GRACE_PERIOD).",
+        )
+        parser.add_argument("--workers", type=int, default=None, help="Threads scanning the store.")
+
+    def handle(self, *args, **options):
+        if options["grace_period"] is not None and options["grace_period"] < 0:
+            raise CommandError("--grace-period cannot be negative.")
+        collector = GarbageCollector(
+            grace_period=options["grace_period"], workers=options["workers"], dry_run=options["dry_run"]
+        )
+        try:
+            report = collector.collect()
+        except OSError as exc:
+            raise CommandError(str(exc)) from exc
+
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(
+            f"live digests:   {report.live}\n"
+            f"loose blobs:    {report.blobs} ({report.blob_bytes} bytes)\n"
+            f"packed entries: {report.packed} ({report.packed_bytes} bytes)\n"
+            f"chunks:         {report.chunks} ({report.chunk_bytes} bytes)\n"
+            f"too recent:     {report.recent}"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {report.blobs + report.packed + report.chunks} blobs "
+                f"({report.blob_bytes + report.packed_bytes + report.chunk_bytes} bytes)"
+            )
+        )
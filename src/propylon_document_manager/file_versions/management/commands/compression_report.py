@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.utils.blob_store import blob_size, is_delta, iter_loose_blobs, open_stored, stored_size
+from propylon_document_manager.utils.chunking import CHUNK_DIRECTORY, is_manifest
+from propylon_document_manager.utils.compression import is_compressed, read_header
+from propylon_document_manager.utils.packs import pack_set, packed_path
+
+
+class Command(BaseCommand):
+    help = "Report how much space per-blob compression, delta storage and chunking save in FILES_ROOT"
+
+    def handle(self, *args, **options):
+        storage_directory = Path(settings.FILES_ROOT)
+        if not storage_directory.is_dir():
+            raise CommandError(f"Storage directory does not exist: {storage_directory}")
+
+        # Loose blobs and packed ones alike; upload sessions and temporary
+        # files are not blobs.
+        paths = [path for _, _, path, _ in iter_loose_blobs(storage_directory)]
+        for pack in pack_set(storage_directory).refresh():
+            paths.extend(packed_path(pack, entry) for entry in pack.entries())
+
+        # codec -> [blobs, uncompressed bytes, stored bytes]
+        totals: dict[str, list[int]] = {}
+        for path in paths:
+            if is_compressed(path):
+                with open_stored(path) as file_obj:
+                    codec = read_header(file_obj)[0]
+            elif is_delta(path):
+                codec = "delta"
+            elif is_manifest(path):
+                codec = "chunked"
+            else:
+                codec = "none"
+            entry = totals.setdefault(codec, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += blob_size(path)
+            entry[2] += stored_size(path)
+
+        # Chunks are counted with the manifests that list them.
+        chunk_bytes = sum(
+            (Path(directory) / file_name).stat().st_size
+            for directory, _, file_names in os.walk(storage_directory / CHUNK_DIRECTORY)
+            for file_name in file_names
+            if not file_name.startswith(".")
+        )
+        if chunk_bytes:
+            totals.setdefault("chunked", [0, 0, 0])[2] += chunk_bytes
+
+        self.stdout.write(f"{'codec':<8} {'blobs':>10} {'original':>16} {'stored':>16} {'ratio':>7}")
+        for codec, (blobs, size, stored) in sorted(totals.items()):
+            self.stdout.write(self._row(codec, blobs, size, stored))
+        all_blobs = sum(entry[0] for entry in totals.values())
+        all_size = sum(entry[1] for entry in totals.values())
+        all_stored = sum(entry[2] for entry in totals.values())
+        self.stdout.write(self.style.SUCCESS(self._row("total", all_blobs, all_size, all_stored)))
+
+    @staticmethod
+    def _row(codec: str, blobs: int, size: int, stored: int) -> str:
+        ratio = size / stored if stored else 1.0
+        return f"{codec:<8} {blobs:>10} {size:>16} {stored:>16} {ratio:>6.2f}x"
@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.utils.delta import DeltaPolicy
+from propylon_document_manager.utils.file_upload import FileUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the previous version of each newly uploaded file as a delta (FILES_DELTA). Uploads never "
+        "do this themselves: run it periodically, e.g. from cron, or keep it running with --interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many versions.")
+        parser.add_argument("--all", action="store_true", help="Ignore the checkpoint and check every version.")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Check again every this many seconds, at low CPU priority, until interrupted.",
+        )
+
+    def handle(self, *args, **options):
+        policy = DeltaPolicy.from_settings()
+        if not policy.enabled:
+            raise CommandError("Delta storage is off; set FILES_DELTA to use it.")
+        if options["limit"] is not None and options["limit"] <= 0:
+            raise CommandError("--limit must be positive.")
+
+        if options["interval"] is None:
+            self._deltify(policy, options["limit"], options["all"])
+            return
+
+        if hasattr(os, "nice"):
+            os.nice(10)
+        try:
+            restart = options["all"]
+            while True:
+                self._deltify(policy, options["limit"], restart)
+                restart = False
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def _deltify(self, policy: DeltaPolicy, limit, restart: bool) -> None:
+        checked, stored = FileUpload.deltify_pending(policy, limit=limit, restart=restart)
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} new versions; stored {stored} deltas"))
@@ -0,0 +1,54 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.models import UploadSession
+from propylon_document_manager.utils import ChunkedUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove upload sessions, and their chunks, that have been idle for longer than "
+        "FILES_UPLOAD_SESSION_TTL. Meant to run periodically, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl",
+            type=int,
+            default=None,
+            help="Idle time in seconds after which a session expires.",
+        )
+
+    def handle(self, *args, **options):
+        ttl = options["ttl"] if options["ttl"] is not None else settings.FILES_UPLOAD_SESSION_TTL
+        cutoff = timezone.now() - timedelta(seconds=ttl)
+
+        expired = 0
+        for session_id in UploadSession.objects.filter(updated_at__lt=cutoff).values_list("id", flat=True).iterator():
+            ChunkedUpload(session_id).remove()
+            UploadSession.objects.filter(id=session_id).delete()
+            expired += 1
+
+        # Chunk directories whose session row is already gone.
+        orphaned = 0
+        sessions_root = ChunkedUpload.sessions_root()
+        if sessions_root.is_dir():
+            known = {str(session_id) for session_id in UploadSession.objects.values_list("id", flat=True)}
+            oldest_allowed = time.time() - ttl
+            with os.scandir(sessions_root) as entries:
+                for entry in entries:
+                    if entry.name in known or entry.stat().st_mtime >= oldest_allowed:
+                        continue
+                    ChunkedUpload(entry.name).remove()
+                    orphaned += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Expired %s upload sessions and removed %s orphaned chunk directories" % (expired, orphaned)
+            )
+        )
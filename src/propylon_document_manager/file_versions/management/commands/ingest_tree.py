@@ -0,0 +1,90 @@
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from propylon_document_manager.file_versions.models import FileStatCache
+from propylon_document_manager.utils import FileUpload
+from propylon_document_manager.utils.file_tree import walk_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Store every file below a directory as a new version. Files whose size, "
+        "modification time and inode match the stat cache are not hashed again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Root of the tree to ingest.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of hashing processes (defaults to the CPU count, 0 hashes inline).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of files hashed and inserted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        root = Path(options["directory"]).resolve()
+        if not root.is_dir():
+            raise CommandError(f"Directory does not exist: {root}")
+
+        batch_size = max(1, options["batch_size"])
+        storage_directory = Path(settings.FILES_ROOT).resolve()
+        self.counts = {"created": 0, "exists": 0, "unchanged": 0, "error": 0}
+        self.hashed_bytes = 0
+        self.started = time.monotonic()
+
+        with FileUpload.batch_executor(options["workers"]) as executor:
+            batch: list[tuple[str, os.stat_result]] = []
+            for entry in walk_files(root, storage_directory):
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    self._ingest(batch, executor)
+                    batch = []
+            if batch:
+                self._ingest(batch, executor)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Ingested %(created)s new files (%(exists)s already stored, "
+                "%(unchanged)s unchanged, %(error)s errors)" % self.counts
+            )
+        )
+
+    def _ingest(self, batch: list[tuple[str, os.stat_result]], executor) -> None:
+        changed = FileStatCache.objects.changed(batch)
+        self.counts["unchanged"] += len(batch) - len(changed)
+
+        if changed:
+            results = FileUpload.upload_many([path for path, _ in changed], executor=executor)
+            seen = []
+            for (path, stat), result in zip(changed, results):
+                self.counts[result["status"]] += 1
+                if result["status"] == "error":
+                    self.stderr.write(result["detail"])
+                    continue
+                self.hashed_bytes += stat.st_size
+                seen.append((path, stat, result["digest_hex"]))
+            with transaction.atomic():
+                FileStatCache.objects.record(seen)
+
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        processed = sum(self.counts.values())
+        self.stdout.write(
+            "%d files, %d hashed: %.1f files/s, %.1f MB/s"
+            % (
+                processed,
+                processed - self.counts["unchanged"],
+                processed / elapsed,
+                self.hashed_bytes / elapsed / 1_000_000,
+            )
+        )
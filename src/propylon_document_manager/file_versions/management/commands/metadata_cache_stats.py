@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.utils.metadata_cache import metadata_cache
+
+
+class Command(BaseCommand):
+    help = "Show the metadata cache hit, miss and wait counters shared by all processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters after showing them.")
+
+    def handle(self, *args, **options):
+        metrics = metadata_cache.metrics()
+        lookups = sum(metrics.values())
+        self.stdout.write(
+            "hits %(hits)s, misses %(misses)s, waits %(waits)s" % metrics
+            + (f" ({(metrics['hits'] + metrics['waits']) / lookups:.1%} served from cache)" if lookups else "")
+        )
+        if options["reset"]:
+            metadata_cache.reset_metrics()
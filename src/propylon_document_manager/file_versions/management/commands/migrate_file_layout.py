@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.utils import blob_path, is_valid_digest
+
+
+def migrate_blob(source: Path, storage_directory: Path) -> str:
+    """Move one flat blob into the fan-out layout.
+
+    Each move is a single atomic rename, so the command can be interrupted
+    and re-run at any point: blobs already moved are simply no longer found
+    at the top level.
+    """
+
+    destination = blob_path(source.name, storage_directory)
+    if destination == source:
+        return "skipped"
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.exists():
+        source.unlink(missing_ok=True)
+        return "deduplicated"
+
+    os.replace(source, destination)
+    return "moved"
+
+
+class Command(BaseCommand):
+    help = "Move blobs stored flat in FILES_ROOT into the configured fan-out layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of concurrent rename workers.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many blobs would be moved.",
+        )
+
+    def handle(self, *args, **options):
+        storage_directory = Path(settings.FILES_ROOT)
+        if not storage_directory.is_dir():
+            raise CommandError(f"Storage directory does not exist: {storage_directory}")
+
+        if not getattr(settings, "FILES_SHARD_DEPTH", 0):
+            self.stdout.write("FILES_SHARD_DEPTH is 0; the flat layout is already in use.")
+            return
+
+        with os.scandir(storage_directory) as entries:
+            flat_blobs = [
+                Path(entry.path)
+                for entry in entries
+                if entry.is_file(follow_symlinks=False) and is_valid_digest(entry.name)
+            ]
+
+        if options["dry_run"]:
+            self.stdout.write(f"{len(flat_blobs)} blobs would be moved.")
+            return
+
+        counts = {"moved": 0, "deduplicated": 0, "skipped": 0}
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            for outcome in executor.map(lambda path: migrate_blob(path, storage_directory), flat_blobs):
+                counts[outcome] += 1
+
+        self.stdout.write(self.style.SUCCESS("Moved %(moved)s blobs (%(deduplicated)s duplicates removed)" % counts))
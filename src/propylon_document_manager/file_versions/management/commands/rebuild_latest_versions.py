@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from propylon_document_manager.file_versions.models import FileVersion, FileVersionHead
+from propylon_document_manager.utils.metadata_cache import metadata_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-file latest-version pointers from the FileVersion table. "
+        "Run it while uploads are paused so no new version is overwritten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of heads written per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        rows = (
+            FileVersion.objects.order_by("file_name", "-version_number")
+            .values_list("id", "file_name", "version_number")
+            .iterator(chunk_size=batch_size)
+        )
+
+        batch: list[FileVersionHead] = []
+        previous_name = None
+        rebuilt = 0
+        for fileversion_id, file_name, version_number in rows:
+            if file_name == previous_name:
+                continue
+            previous_name = file_name
+            batch.append(
+                FileVersionHead(
+                    file_name=file_name,
+                    latest_version=version_number,
+                    fileversion_id=fileversion_id,
+                )
+            )
+            if len(batch) >= batch_size:
+                rebuilt += self._write(batch)
+                batch = []
+
+        if batch:
+            rebuilt += self._write(batch)
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt %s latest-version pointers" % rebuilt))
+
+    @staticmethod
+    def _write(batch: list[FileVersionHead]) -> int:
+        with transaction.atomic():
+            FileVersionHead.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=["file_name"],
+                update_fields=["latest_version", "fileversion"],
+            )
+            metadata_cache.invalidate_files(head.file_name for head in batch)
+        return len(batch)
@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.utils.blob_store import repack
+from propylon_document_manager.utils.packs import PackPolicy
+
+
+class Command(BaseCommand):
+    help = (
+        "Move small loose blobs into packfiles (FILES_PACK_MAX_BLOB_SIZE, FILES_PACK_MIN_AGE). "
+        "Run it periodically, e.g. from cron, or keep it running in the background with --interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--consolidate",
+            action="store_true",
+            help="Also merge packs smaller than FILES_PACK_MAX_SIZE into fewer, larger ones.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=None,
+            help="Only pack blobs unchanged for this many seconds (defaults to FILES_PACK_MIN_AGE).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Repack again every this many seconds, at low CPU priority, until interrupted.",
+        )
+
+    def handle(self, *args, **options):
+        policy = PackPolicy.from_settings()
+        if options["min_age"] is not None:
+            policy = policy._replace(min_age=options["min_age"])
+
+        if options["interval"] is None:
+            self._repack(policy, options["consolidate"])
+            return
+
+        if hasattr(os, "nice"):
+            os.nice(10)
+        try:
+            while True:
+                self._repack(policy, options["consolidate"])
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def _repack(self, policy: PackPolicy, consolidate: bool) -> None:
+        counts = repack(policy=policy, consolidate=consolidate)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Packed %(packed)s loose blobs (%(packed_bytes)s bytes); wrote %(packs_written)s packs "
+                "and removed %(packs_removed)s" % counts
+            )
+        )
@@ -0,0 +1,76 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.models import BlobVerification
+from propylon_document_manager.utils.scrub import Scrubber
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-hash stored blobs to detect corruption, at most FILES_SCRUB_RATE MB/s. Corrupt blobs are "
+        "quarantined and reported. An interrupted pass resumes from its checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=float, default=None, help="MB/s ceiling (defaults to FILES_SCRUB_RATE).")
+        parser.add_argument("--workers", type=int, default=None, help="Defaults to FILES_SCRUB_WORKERS.")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many blobs.")
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start a new pass.")
+        parser.add_argument(
+            "--no-quarantine", action="store_true", help="Only report corrupt blobs, leave them in place."
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Start another pass this many seconds after each one, at low CPU priority, until interrupted.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rate"] is not None and options["rate"] <= 0:
+            raise CommandError("--rate must be positive.")
+        scrubber = Scrubber(
+            rate=None if options["rate"] is None else options["rate"] * 1024 * 1024,
+            workers=options["workers"],
+            quarantine=not options["no_quarantine"],
+        )
+
+        if options["interval"] is None:
+            self._scrub(scrubber, options["restart"], options["limit"])
+            return
+
+        if hasattr(os, "nice"):
+            os.nice(10)
+        try:
+            while True:
+                self._scrub(scrubber, options["restart"], options["limit"])
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def _scrub(self, scrubber: Scrubber, restart: bool, limit) -> None:
+        started = timezone.now()
+        counts = scrubber.run(restart=restart, limit=limit)
+        problems = (
+            BlobVerification.objects.filter(verified_at__gte=started)
+            .exclude(status=BlobVerification.OK)
+            .order_by("digest_hex")
+        )
+        for verification in problems.iterator():
+            self.stderr.write(f"{verification.status}: {verification.digest_hex} {verification.detail}".rstrip())
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Scrubbed %d blobs in %.1fs: %d ok, %d mismatched, %d missing, %d unreadable"
+                % (
+                    sum(counts.values()),
+                    (timezone.now() - started).total_seconds(),
+                    counts[BlobVerification.OK],
+                    counts[BlobVerification.MISMATCH],
+                    counts[BlobVerification.MISSING],
+                    counts[BlobVerification.UNREADABLE],
+                )
+            )
+        )
@@ -0,0 +1,95 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from propylon_document_manager.file_versions.api.pagination import KeysetPagination
+from propylon_document_manager.file_versions.api.views import UserFileListView
+from propylon_document_manager.file_versions.models import FileVersion, User, UserFileVersion
+
+BATCH_SIZE = 10_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Time UserFileListView for users sharing growing numbers of versions: the first page and a page "
+        "from the middle of the listing. The synthetic rows are rolled back afterwards. It only runs "
+        "against an empty scratch database: point DATABASES at one in the settings module it runs with."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--versions", type=int, default=100_000, help="Synthetic versions to create.")
+        parser.add_argument(
+            "--shares", default="1000,10000,100000", help="Comma-separated share counts, one user per count."
+        )
+        parser.add_argument("--page-size", type=int, default=KeysetPagination.page_size)
+        parser.add_argument("--repeat", type=int, default=5, help="Report the best of this many requests.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            share_counts = [int(count) for count in options["shares"].split(",")]
+        except ValueError as exc:
+            raise CommandError("--shares must be a comma-separated list of integers.") from exc
+        if options["versions"] <= 0 or options["page_size"] <= 0 or options["repeat"] <= 0:
+            raise CommandError("--versions, --page-size and --repeat must be positive.")
+        if any(count <= 0 or count > options["versions"] for count in share_counts):
+            raise CommandError("Every share count must be between 1 and --versions.")
+        if FileVersion.objects.exists() or UserFileVersion.objects.exists():
+            raise CommandError(
+                f"The database {connection.settings_dict['NAME']} already holds file versions; "
+                "run the benchmark against an empty scratch database."
+            )
+
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            versions = self._create_versions(options["versions"])
+            self.stdout.write(f"versions: {len(versions)}, page size: {options['page_size']}")
+            for count in share_counts:
+                user = User.objects.create(email=f"listing-benchmark-{count}@example.com")
+                shared = sorted(rng.sample(versions, count))
+                UserFileVersion.objects.bulk_create(
+                    (UserFileVersion(user=user, fileversion_id=version[2]) for version in shared),
+                    batch_size=BATCH_SIZE,
+                )
+                first = self._time(user, options["page_size"], None, options["repeat"])
+                deep = self._time(user, options["page_size"], shared[count // 2], options["repeat"])
+                self.stdout.write(f"shares {count:>9}: first page {first:8.2f} ms, deep page {deep:8.2f} ms")
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _create_versions(count: int) -> list[tuple[str, int, int]]:
+        for start in range(0, count, BATCH_SIZE):
+            FileVersion.objects.bulk_create(
+                FileVersion(file_name=f"listing-benchmark/{index:09d}.txt", version_number=0)
+                for index in range(start, min(start + BATCH_SIZE, count))
+            )
+        return list(
+            FileVersion.objects.filter(file_name__startswith="listing-benchmark/").values_list(
+                *KeysetPagination.ordering
+            )
+        )
+
+    @staticmethod
+    def _time(user, page_size: int, position, repeat: int) -> float:
+        params = {"page_size": page_size}
+        if position is not None:
+            params[KeysetPagination.cursor_query_param] = KeysetPagination.encode_cursor(position)
+        view = UserFileListView.as_view()
+        best = float("inf")
+        # The next link is built from the factory's host, which the settings need not allow.
+        # The cache is off so that every repeat times the query, and nothing is cached
+        # for users that are rolled back.
+        with override_settings(ALLOWED_HOSTS=["testserver"], FILES_METADATA_CACHE_TIMEOUT=0):
+            for _ in range(repeat):
+                request = APIRequestFactory().get("/api/files/user/", params)
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                response = view(request)
+                best = min(best, time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f"Listing failed with status {response.status_code}.")
+        return best * 1000
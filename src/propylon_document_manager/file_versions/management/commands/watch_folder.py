@@ -0,0 +1,46 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.utils.folder_watch import FolderWatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Watch directories with inotify and store every file written or moved into "
+        "them as a new version. Runs until interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directories",
+            nargs="*",
+            help="Directories to watch (defaults to FILES_WATCH_DIRECTORIES).",
+        )
+        parser.add_argument(
+            "--debounce",
+            type=float,
+            default=None,
+            help="Seconds a file must stay quiet before it is stored (defaults to FILES_WATCH_DEBOUNCE).",
+        )
+
+    def handle(self, *args, **options):
+        directories = options["directories"] or settings.FILES_WATCH_DIRECTORIES
+        if not directories:
+            raise CommandError("No directories to watch; pass them or set FILES_WATCH_DIRECTORIES.")
+
+        logging.getLogger("propylon_document_manager.utils.folder_watch").setLevel(
+            logging.INFO if options["verbosity"] >= 1 else logging.WARNING
+        )
+        try:
+            watcher = FolderWatcher(directories, debounce=options["debounce"])
+        except OSError as exc:
+            raise CommandError(f"Cannot start watching: {exc}")
+
+        with watcher:
+            self.stdout.write("Watching %s" % ", ".join(str(root) for root in watcher.roots))
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                watcher.flush(force=True)
@@ -0,0 +1,70 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def renumber_duplicate_versions(apps, schema_editor):
+    """Move rows that share a (file_name, version_number) pair to fresh numbers.
+
+    Concurrent uploads could previously allocate the same version twice; the
+    unique constraint below cannot be added while such rows exist.
+    """
+
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    duplicates = (
+        FileVersion.objects.values("file_name", "version_number")
+        .annotate(row_count=Count("id"))
+        .filter(row_count__gt=1)
+    )
+    for duplicate in duplicates:
+        rows = FileVersion.objects.filter(
+            file_name=duplicate["file_name"],
+            version_number=duplicate["version_number"],
+        ).order_by("id")
+        latest = (
+            FileVersion.objects.filter(file_name=duplicate["file_name"])
+            .aggregate(max_version=Max("version_number"))
+            .get("max_version")
+        )
+        for offset, row in enumerate(rows[1:], start=1):
+            row.version_number = latest + offset
+            row.save(update_fields=["version_number"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0007_fileversion_digest_hex"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileVersionHead",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file_name", models.CharField(max_length=512, unique=True)),
+                ("latest_version", models.IntegerField()),
+            ],
+            options={
+                "db_table": "file_versions_fileversion_head",
+            },
+        ),
+        migrations.RunPython(renumber_duplicate_versions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(fields=["digest_hex"], name="file_versions_digest_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="fileversion",
+            constraint=models.UniqueConstraint(
+                fields=("file_name", "version_number"),
+                name="file_versions_unique_file_version",
+            ),
+        ),
+    ]
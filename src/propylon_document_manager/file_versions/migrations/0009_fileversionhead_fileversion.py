@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0008_fileversion_head_and_constraints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileversionhead",
+            name="fileversion",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="head",
+                to="file_versions.fileversion",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0011_filestatcache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BlobVerification",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest_hex", models.CharField(max_length=64, unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("ok", "OK"),
+                            ("mismatch", "Digest mismatch"),
+                            ("missing", "Missing"),
+                            ("unreadable", "Unreadable"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("detail", models.TextField(blank=True)),
+                ("verified_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "db_table": "file_versions_blob_verification",
+            },
+        ),
+    ]
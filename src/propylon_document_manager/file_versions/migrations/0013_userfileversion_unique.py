@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_shares(apps, schema_editor):
+    UserFileVersion = apps.get_model("file_versions", "UserFileVersion")
+    first_ids = UserFileVersion.objects.values("user_id", "fileversion_id").annotate(first_id=Min("id"))
+    UserFileVersion.objects.exclude(id__in=first_ids.values("first_id")).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0012_blobverification"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="userfileversion",
+            constraint=models.UniqueConstraint(
+                fields=("user", "fileversion"),
+                name="file_versions_unique_user_fileversion",
+            ),
+        ),
+    ]
@@ -1,9 +1,16 @@
-from django.db import models
+import os
+import uuid
+from collections import Counter
+from typing import Any, Sequence
+
 from django.contrib.auth.models import AbstractUser
-from django.db.models import CharField, EmailField
+from django.db import IntegrityError, models, transaction
+from django.db.models import CharField, EmailField, F, Max
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+
 class User(AbstractUser):
     """
     Default custom user model for Propylon Document Manager.
@@ -31,6 +38,65 @@ class User(AbstractUser):
         return reverse("users:detail", kwargs={"pk": self.id})
 
 
+class FileVersionManager(models.Manager):
+    def create_next_version(self, file_name: str, **fields) -> "FileVersion":
+        """Create the next version of ``file_name`` without racing other writers.
+
+        The version number is allocated from the file's ``FileVersionHead``
+        row, which stays locked until the surrounding transaction commits.
+        The head's latest-version pointer is moved in the same transaction.
+        """
+
+        with transaction.atomic():
+            version_number = FileVersionHead.objects.allocate(file_name)
+            file_version = self.create(file_name=file_name, version_number=version_number, **fields)
+            FileVersionHead.objects.filter(file_name=file_name).update(fileversion=file_version)
+            return file_version
+
+    def bulk_create_versions(self, entries: Sequence[tuple[str, dict[str, Any]]]) -> list["FileVersion"]:
+        """Create a new version for each ``(file_name, fields)`` entry in one transaction.
+
+        Entries for the same file get consecutive numbers in the given order.
+        Heads are locked in ``file_name`` order so concurrent batches cannot
+        deadlock, and the rows are written with a single ``bulk_create``,
+        which sends no signals, so the metadata cache is invalidated here.
+        """
+
+        from propylon_document_manager.utils.metadata_cache import metadata_cache
+
+        counts = Counter(file_name for file_name, _ in entries)
+        with transaction.atomic():
+            next_numbers = {
+                file_name: FileVersionHead.objects.allocate(file_name, count)
+                for file_name, count in sorted(counts.items())
+            }
+            rows = []
+            for file_name, fields in entries:
+                rows.append(self.model(file_name=file_name, version_number=next_numbers[file_name], **fields))
+                next_numbers[file_name] += 1
+
+            created = self.bulk_create(rows)
+            if created and created[0].pk is None:
+                # Backends that cannot return primary keys from a bulk insert.
+                ids = {
+                    (file_name, version_number): pk
+                    for pk, file_name, version_number in self.filter(file_name__in=counts.keys()).values_list(
+                        "id", "file_name", "version_number"
+                    )
+                }
+                for row in created:
+                    row.pk = ids[(row.file_name, row.version_number)]
+
+            latest = {row.file_name: row for row in created}
+            heads = list(FileVersionHead.objects.filter(file_name__in=latest.keys()))
+            for head in heads:
+                head.fileversion = latest[head.file_name]
+            FileVersionHead.objects.bulk_update(heads, ["fileversion"])
+            metadata_cache.invalidate_files(latest.keys())
+            metadata_cache.invalidate_versions((row.pk for row in created), {row.digest_hex for row in created})
+            return created
+
+
 class FileVersion(models.Model):
     file_name = models.fields.CharField(max_length=512)
     version_number = models.fields.IntegerField()
@@ -41,6 +107,67 @@ class FileVersion(models.Model):
         help_text="SHA-256 digest for the stored file in hexadecimal format.",
     )
 
+    objects = FileVersionManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["file_name", "version_number"],
+                name="file_versions_unique_file_version",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["digest_hex"], name="file_versions_digest_idx"),
+        ]
+
+
+class FileVersionHeadManager(models.Manager):
+    def allocate(self, file_name: str, count: int = 1) -> int:
+        """Reserve ``count`` consecutive version numbers for ``file_name``.
+
+        Returns the first reserved number. Must be called inside a
+        transaction. The increment is issued as an ``UPDATE`` first so the
+        row is write-locked before it is read; the head is seeded from the
+        existing versions the first time a file is seen.
+        """
+
+        heads = self.filter(file_name=file_name)
+        if not heads.update(latest_version=F("latest_version") + count):
+            current = (
+                FileVersion.objects.filter(file_name=file_name)
+                .aggregate(max_version=Max("version_number"))
+                .get("max_version")
+            )
+            first_version = 0 if current is None else current + 1
+            try:
+                with transaction.atomic():
+                    self.create(file_name=file_name, latest_version=first_version + count - 1)
+                return first_version
+            except IntegrityError:
+                # Another writer seeded the head first; queue behind its lock.
+                heads.update(latest_version=F("latest_version") + count)
+
+        return heads.values_list("latest_version", flat=True).get() - count + 1
+
+
+class FileVersionHead(models.Model):
+    """Per-file row holding the latest version number and a pointer to its row."""
+
+    file_name = models.fields.CharField(max_length=512, unique=True)
+    latest_version = models.fields.IntegerField()
+    fileversion = models.OneToOneField(
+        FileVersion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="head",
+    )
+
+    objects = FileVersionHeadManager()
+
+    class Meta:
+        db_table = "file_versions_fileversion_head"
+
 
 class UserFileVersion(models.Model):
     fileversion = models.ForeignKey(FileVersion, on_delete=models.CASCADE)
@@ -48,3 +175,118 @@ class UserFileVersion(models.Model):
 
     class Meta:
         db_table = "file_versions_user_fileversion"
+        constraints = [
+            # Also the index a user's file listing is joined or probed through.
+            models.UniqueConstraint(
+                fields=["user", "fileversion"],
+                name="file_versions_unique_user_fileversion",
+            ),
+        ]
+
+
+class UploadSession(models.Model):
+    """A chunked upload in progress; the chunks themselves live on disk."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    file_name = models.fields.CharField(max_length=512)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        db_table = "file_versions_upload_session"
+
+
+class FileStatCacheManager(models.Manager):
+    def changed(self, entries: Sequence[tuple[str, os.stat_result]]) -> list[tuple[str, os.stat_result]]:
+        """Return the ``(path, stat)`` entries that do not match their cached stat."""
+
+        cached = {
+            path: (size, mtime_ns, inode)
+            for path, size, mtime_ns, inode in self.filter(path__in=[path for path, _ in entries]).values_list(
+                "path", "size", "mtime_ns", "inode"
+            )
+        }
+        return [
+            (path, stat) for path, stat in entries if cached.get(path) != (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        ]
+
+    def record(self, entries: Sequence[tuple[str, os.stat_result, str]]) -> None:
+        """Store the stat and digest of each ``(path, stat, digest_hex)`` entry."""
+
+        self.bulk_create(
+            [
+                self.model(
+                    path=path,
+                    size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns,
+                    inode=stat.st_ino,
+                    digest_hex=digest_hex,
+                )
+                for path, stat, digest_hex in entries
+            ],
+            update_conflicts=True,
+            unique_fields=["path"],
+            update_fields=["size", "mtime_ns", "inode", "digest_hex", "updated_at"],
+        )
+
+
+class FileStatCache(models.Model):
+    """Last seen ``stat`` of an ingested path and the digest it had then.
+
+    A path whose size, modification time and inode still match is known to
+    hold the same content, so bulk ingestion can skip hashing it again.
+    """
+
+    path = models.fields.CharField(max_length=512, unique=True)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    inode = models.BigIntegerField()
+    digest_hex = models.fields.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = FileStatCacheManager()
+
+    class Meta:
+        db_table = "file_versions_file_stat_cache"
+
+
+class BlobVerificationManager(models.Manager):
+    def record(self, entries: Sequence[tuple[str, str, str]]) -> None:
+        """Store the outcome of each ``(digest_hex, status, detail)`` scrub, timestamped now."""
+
+        verified_at = timezone.now()
+        self.bulk_create(
+            [
+                self.model(digest_hex=digest_hex, status=status, detail=detail, verified_at=verified_at)
+                for digest_hex, status, detail in entries
+            ],
+            update_conflicts=True,
+            unique_fields=["digest_hex"],
+            update_fields=["status", "detail", "verified_at"],
+        )
+
+
+class BlobVerification(models.Model):
+    """When a stored blob was last re-hashed by the scrubber, and the outcome."""
+
+    OK = "ok"
+    MISMATCH = "mismatch"
+    MISSING = "missing"
+    UNREADABLE = "unreadable"
+    STATUS_CHOICES = [
+        (OK, "OK"),
+        (MISMATCH, "Digest mismatch"),
+        (MISSING, "Missing"),
+        (UNREADABLE, "Unreadable"),
+    ]
+
+    digest_hex = models.fields.CharField(max_length=64, unique=True)
+    status = models.fields.CharField(max_length=16, choices=STATUS_CHOICES)
+    detail = models.fields.TextField(blank=True)
+    verified_at = models.DateTimeField(db_index=True)
+
+    objects = BlobVerificationManager()
+
+    class Meta:
+        db_table = "file_versions_blob_verification"
@@ -0,0 +1,44 @@
+"""Keep ``metadata_cache`` in step with ``FileVersion`` and ``UserFileVersion`` writes.
+
+Bulk writes send no signals; the code doing them invalidates explicitly.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from propylon_document_manager.utils.metadata_cache import metadata_cache
+
+from .models import FileVersion, UserFileVersion
+
+
+@receiver(pre_save, sender=FileVersion)
+def remember_file_name(sender, instance, **kwargs):
+    """Note the stored name and digest of an existing row, which an update leaves stale."""
+
+    if instance.pk is not None and not kwargs.get("raw"):
+        stored = FileVersion.objects.filter(pk=instance.pk).values_list("file_name", "digest_hex").first()
+        instance._stored_file_name, instance._stored_digest_hex = stored or (None, None)
+
+
+@receiver(post_save, sender=FileVersion)
+@receiver(post_delete, sender=FileVersion)
+def invalidate_file_version(sender, instance, created=False, **kwargs):
+    file_names = {instance.file_name}
+    stored_file_name = getattr(instance, "_stored_file_name", None)
+    if stored_file_name is not None:
+        file_names.add(stored_file_name)
+    metadata_cache.invalidate_files(file_names)
+    metadata_cache.invalidate_versions(
+        [instance.pk], {instance.digest_hex, getattr(instance, "_stored_digest_hex", None)}
+    )
+    if not created and instance.pk is not None:
+        # Owners' first pages show the name and number of this version.
+        metadata_cache.invalidate_users(
+            UserFileVersion.objects.filter(fileversion_id=instance.pk).values_list("user_id", flat=True).distinct()
+        )
+
+
+@receiver(post_save, sender=UserFileVersion)
+@receiver(post_delete, sender=UserFileVersion)
+def invalidate_user_file_version(sender, instance, **kwargs):
+    metadata_cache.invalidate_users([instance.user_id])
@@ -3,9 +3,15 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
 from propylon_document_manager.file_versions.api.views import (
+    BatchUploadView,
+    BlobView,
+    DigestPreflightView,
+    FileContentUploadView,
     FileListView,
+    FileReferenceView,
     FileUploadView,
     FileVersionViewSet,
+    UploadSessionViewSet,
     UserFileListView,
 )
 
@@ -15,11 +21,17 @@ else:
     router = SimpleRouter()
 
 router.register("file_versions", FileVersionViewSet)
+router.register("upload-sessions", UploadSessionViewSet, basename="upload-session")
 
 
 app_name = "api"
 urlpatterns = router.urls + [
+    path("blobs/<str:digest>/", BlobView.as_view(), name="blob"),
     path("file-uploads/", FileUploadView.as_view(), name="file-upload"),
+    path("file-uploads/batch/", BatchUploadView.as_view(), name="file-upload-batch"),
+    path("file-uploads/content/", FileContentUploadView.as_view(), name="file-content-upload"),
+    path("file-uploads/preflight/", DigestPreflightView.as_view(), name="file-upload-preflight"),
+    path("file-uploads/reference/", FileReferenceView.as_view(), name="file-upload-reference"),
     path("files/user/", UserFileListView.as_view(), name="user-file-list"),
     path("files/", FileListView.as_view(), name="file-list"),
 ]
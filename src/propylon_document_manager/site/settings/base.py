@@ -168,6 +168,85 @@ MEDIA_URL = "/media/"
 
 # Directory for uploaded files
 FILES_ROOT = BASE_DIR.parent.parent / "files"
+# Blobs are fanned out as FILES_ROOT/ab/cd/<digest>: FILES_SHARD_DEPTH directory
+# levels of FILES_SHARD_WIDTH hex characters each. Use 0 for a flat layout.
+FILES_SHARD_DEPTH = env.int("DJANGO_FILES_SHARD_DEPTH", default=2)
+FILES_SHARD_WIDTH = env.int("DJANGO_FILES_SHARD_WIDTH", default=2)
+# Cache-Control sent for digest-addressed /api/blobs/<digest>/ responses. Use
+# "public" instead of "private" to let a shared caching proxy store them.
+FILES_BLOB_CACHE_CONTROL = env(
+    "DJANGO_FILES_BLOB_CACHE_CONTROL",
+    default="private, max-age=31536000, immutable",
+)
+# Hand blob transfers to the front proxy instead of streaming them from a
+# worker: "" (disabled), "x-accel-redirect" (nginx) or "x-sendfile".
+FILES_OFFLOAD = env("DJANGO_FILES_OFFLOAD", default="")
+# Internal nginx location aliased to FILES_ROOT, used by x-accel-redirect.
+FILES_OFFLOAD_PREFIX = env("DJANGO_FILES_OFFLOAD_PREFIX", default="/protected-files/")
+# Directories the API may store files from by server-side path ("store" uploads
+# and batch uploads). Paths are resolved first; leave empty to refuse them all.
+FILES_IMPORT_ROOTS = env.list("DJANGO_FILES_IMPORT_ROOTS", default=[])
+# Chunked upload sessions: largest accepted chunk, most chunks and bytes per
+# session, and how long a session may sit idle before expire_upload_sessions
+# removes it.
+FILES_UPLOAD_MAX_CHUNK_SIZE = env.int("DJANGO_FILES_UPLOAD_MAX_CHUNK_SIZE", default=64 * 1024 * 1024)
+FILES_UPLOAD_MAX_CHUNKS = env.int("DJANGO_FILES_UPLOAD_MAX_CHUNKS", default=10_000)
+FILES_UPLOAD_MAX_SESSION_SIZE = env.int("DJANGO_FILES_UPLOAD_MAX_SESSION_SIZE", default=4 * 1024 * 1024 * 1024)
+FILES_UPLOAD_SESSION_TTL = env.int("DJANGO_FILES_UPLOAD_SESSION_TTL", default=24 * 60 * 60)
+# Processes used to hash batch uploads, in one pool per server process that its
+# requests share; None uses every CPU, 0 hashes inline.
+FILES_BATCH_UPLOAD_WORKERS = env.int("DJANGO_FILES_BATCH_UPLOAD_WORKERS", default=None)
+# How files are copied into and out of the store, tried in order: "reflink",
+# "hardlink" (read-only sources only), "copy_file_range", "sendfile", "copy".
+FILES_COPY_STRATEGIES = env.list(
+    "DJANGO_FILES_COPY_STRATEGIES",
+    default=["reflink", "copy_file_range", "sendfile", "copy"],
+)
+# Per-blob compression: "" (off), "auto" (zstd when installed, otherwise
+# zlib), "zlib", "lzma" or "zstd". Blobs smaller than FILES_COMPRESSION_MIN_SIZE
+# or whose sampled deflate ratio exceeds FILES_COMPRESSION_MAX_RATIO stay raw.
+FILES_COMPRESSION = env("DJANGO_FILES_COMPRESSION", default="")
+FILES_COMPRESSION_MIN_SIZE = env.int("DJANGO_FILES_COMPRESSION_MIN_SIZE", default=4096)
+FILES_COMPRESSION_MAX_RATIO = env.float("DJANGO_FILES_COMPRESSION_MAX_RATIO", default=0.9)
+# Delta storage: the deltify_versions command, run in the background, re-stores
+# the previous version of each newly uploaded file as a delta against the new
+# one, unless the previous version number is a multiple of
+# FILES_DELTA_KEYFRAME_INTERVAL. Blobs over FILES_DELTA_MAX_SIZE
+# stay full, as do deltas larger than FILES_DELTA_MAX_RATIO of the blob.
+# Rebuilt content is kept in a per-process LRU of FILES_DELTA_CACHE_SIZE bytes.
+FILES_DELTA = env.bool("DJANGO_FILES_DELTA", default=False)
+FILES_DELTA_KEYFRAME_INTERVAL = env.int("DJANGO_FILES_DELTA_KEYFRAME_INTERVAL", default=16)
+FILES_DELTA_MAX_SIZE = env.int("DJANGO_FILES_DELTA_MAX_SIZE", default=32 * 1024 * 1024)
+FILES_DELTA_MAX_RATIO = env.float("DJANGO_FILES_DELTA_MAX_RATIO", default=0.5)
+FILES_DELTA_CACHE_SIZE = env.int("DJANGO_FILES_DELTA_CACHE_SIZE", default=64 * 1024 * 1024)
+# Content-defined chunking: blobs of at least twice FILES_CHUNK_AVG_SIZE are split
+# into chunks of FILES_CHUNK_MIN_SIZE to FILES_CHUNK_MAX_SIZE bytes, stored once in
+# FILES_ROOT/chunks and shared by every blob that contains them.
+FILES_CHUNKING = env.bool("DJANGO_FILES_CHUNKING", default=False)
+FILES_CHUNK_MIN_SIZE = env.int("DJANGO_FILES_CHUNK_MIN_SIZE", default=4 * 1024)
+FILES_CHUNK_AVG_SIZE = env.int("DJANGO_FILES_CHUNK_AVG_SIZE", default=16 * 1024)
+FILES_CHUNK_MAX_SIZE = env.int("DJANGO_FILES_CHUNK_MAX_SIZE", default=64 * 1024)
+# Packfiles: repack_blobs moves loose blobs of at most FILES_PACK_MAX_BLOB_SIZE
+# stored bytes that are older than FILES_PACK_MIN_AGE seconds into packs of up to
+# FILES_PACK_MAX_SIZE bytes under FILES_ROOT/packs.
+FILES_PACK_MAX_BLOB_SIZE = env.int("DJANGO_FILES_PACK_MAX_BLOB_SIZE", default=64 * 1024)
+FILES_PACK_MAX_SIZE = env.int("DJANGO_FILES_PACK_MAX_SIZE", default=1024 * 1024 * 1024)
+FILES_PACK_MIN_AGE = env.float("DJANGO_FILES_PACK_MIN_AGE", default=3600.0)
+# collect_garbage leaves unreferenced blobs and chunks alone until they are
+# FILES_GC_GRACE_PERIOD seconds old, so it never races an upload in progress.
+FILES_GC_GRACE_PERIOD = env.float("DJANGO_FILES_GC_GRACE_PERIOD", default=24 * 60 * 60)
+# scrub_blobs re-hashes stored blobs with FILES_SCRUB_WORKERS threads, reading at
+# most FILES_SCRUB_RATE MB/s between them.
+FILES_SCRUB_RATE = env.float("DJANGO_FILES_SCRUB_RATE", default=20.0)
+FILES_SCRUB_WORKERS = env.int("DJANGO_FILES_SCRUB_WORKERS", default=2)
+# Seconds that version metadata and file lists stay in the default cache; writes
+# invalidate them sooner. 0 turns the metadata cache off.
+FILES_METADATA_CACHE_TIMEOUT = env.int("DJANGO_FILES_METADATA_CACHE_TIMEOUT", default=300)
+# watch_folder: directories watched when none are given on the command line, how
+# long a file must stay quiet before it is stored, and names that are ignored.
+FILES_WATCH_DIRECTORIES = env.list("DJANGO_FILES_WATCH_DIRECTORIES", default=[])
+FILES_WATCH_DEBOUNCE = env.float("DJANGO_FILES_WATCH_DEBOUNCE", default=2.0)
+FILES_WATCH_IGNORE = env.list("DJANGO_FILES_WATCH_IGNORE", default=[".*", "~$*", "*~", "*.tmp"])
 
 # TEMPLATES
 # ------------------------------------------------------------------------------
@@ -280,10 +359,19 @@ ACCOUNT_EMAIL_VERIFICATION = "mandatory"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.TokenAuthentication",
+        "propylon_document_manager.accounts.authentication.CachedTokenAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
 }
+# API tokens expire AUTH_TOKEN_TTL seconds after they are issued, and logging in
+# with a token older than AUTH_TOKEN_ROTATE_AFTER issues a new one (0 disables
+# either). Resolved tokens are cached for AUTH_TOKEN_CACHE_TIMEOUT seconds, up to
+# AUTH_TOKEN_CACHE_SIZE of them per process; every request checks in the cache
+# whether its token was revoked.
+AUTH_TOKEN_TTL = env.int("DJANGO_AUTH_TOKEN_TTL", default=7 * 24 * 60 * 60)
+AUTH_TOKEN_ROTATE_AFTER = env.int("DJANGO_AUTH_TOKEN_ROTATE_AFTER", default=24 * 60 * 60)
+AUTH_TOKEN_CACHE_TIMEOUT = env.int("DJANGO_AUTH_TOKEN_CACHE_TIMEOUT", default=300)
+AUTH_TOKEN_CACHE_SIZE = env.int("DJANGO_AUTH_TOKEN_CACHE_SIZE", default=10_000)
 
 # django-cors-headers - https://github.com/adamchainz/django-cors-headers#setup
 CORS_ALLOW_ALL_ORIGINS = True
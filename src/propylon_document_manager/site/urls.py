@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.urls import include, path
-from rest_framework.authtoken.views import obtain_auth_token
+
+from propylon_document_manager.accounts.views import ObtainRotatingAuthToken
 
 from .views import HealthCheckView
 
@@ -10,7 +11,7 @@ urlpatterns = [
     path("api/health/", HealthCheckView.as_view(), name="health"),
     path("api/", include("propylon_document_manager.site.api_router")),
     path("api-auth/", include("rest_framework.urls")),
-    path("auth-token/", obtain_auth_token),
+    path("auth-token/", ObtainRotatingAuthToken.as_view()),
 ]
 
 if settings.DEBUG and "debug_toolbar" in settings.INSTALLED_APPS:
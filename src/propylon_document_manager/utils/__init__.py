@@ -1,6 +1,20 @@
 """Utility helpers for the Propylon Document Manager project."""
 
+from .blob_store import BlobWriter, blob_path, ingest_file, ingest_stream, is_valid_digest, locate_blob
+from .chunked_upload import ChunkedUpload, ChunkTooLarge
 from .file_download import FileDownload
-from .file_upload import FileUpload
+from .file_upload import FileUpload, in_import_roots
 
-__all__ = ["FileDownload", "FileUpload"]
+__all__ = [
+    "BlobWriter",
+    "ChunkTooLarge",
+    "ChunkedUpload",
+    "FileDownload",
+    "FileUpload",
+    "blob_path",
+    "ingest_file",
+    "in_import_roots",
+    "ingest_stream",
+    "is_valid_digest",
+    "locate_blob",
+]
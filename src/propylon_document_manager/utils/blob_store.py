@@ -0,0 +1,844 @@
+"""Utilities for writing content-addressed blobs into the file store."""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Sequence, Union
+
+from django.conf import settings
+
+from .chunking import (
+    CHUNK_DIRECTORY,
+    MANIFEST_SUFFIX,
+    ChunkedBlobReader,
+    ChunkingPolicy,
+    is_manifest,
+    iter_chunks,
+    pack_manifest,
+    read_manifest_size,
+)
+from .compression import (
+    COMPRESSED_SUFFIX,
+    CompressedBlobReader,
+    CompressionPolicy,
+    compress_file,
+    is_compressed,
+    probe,
+    read_header,
+)
+from .delta import DELTA_SUFFIX, DeltaPolicy, encode, pack_delta, read_delta_header, reconstruction_cache, unpack_delta
+from .file_copy import SHARING_STRATEGIES, copy_file, copy_strategies
+from .packs import LOCK_NAME as PACK_LOCK_NAME
+from .packs import PACK_DIRECTORY, PackPolicy, is_packed, pack_set, packed_path, read_packed, remove_pack, write_pack
+
+INGEST_CHUNK_SIZE = 1024 * 1024
+TEMP_PREFIX = ".ingest-"
+DELTA_LOCK_NAME = ".delta.lock"
+# Longest chain of deltas followed when reading; guards against corrupt cycles.
+MAX_DELTA_DEPTH = 256
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+HEADER_PEEK_SIZE = 64
+BLOB_SUFFIXES = ("", COMPRESSED_SUFFIX, DELTA_SUFFIX, MANIFEST_SUFFIX)
+
+
+def is_valid_digest(digest_hex: Optional[str]) -> bool:
+    """Return whether ``digest_hex`` looks like a lowercase SHA-256 hex digest."""
+
+    return bool(digest_hex) and DIGEST_PATTERN.match(digest_hex) is not None
+
+
+def shard_parts(digest_hex: str) -> list[str]:
+    """Return the fan-out directory names for ``digest_hex``.
+
+    The layout is controlled by ``FILES_SHARD_DEPTH`` (number of directory
+    levels) and ``FILES_SHARD_WIDTH`` (hex characters per level), so the
+    default of 2/2 stores a blob at ``ab/cd/abcd...``.
+    """
+
+    depth = int(getattr(settings, "FILES_SHARD_DEPTH", 0))
+    width = int(getattr(settings, "FILES_SHARD_WIDTH", 2))
+    return [digest_hex[level * width : (level + 1) * width] for level in range(depth)]
+
+
+def blob_path(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    """Return where the blob for ``digest_hex`` is stored in the configured layout."""
+
+    if not is_valid_digest(digest_hex):
+        raise ValueError(f"Invalid digest: {digest_hex!r}")
+
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    return root.joinpath(*shard_parts(digest_hex), digest_hex)
+
+
+def compressed_blob_path(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    """Return where the compressed form of the blob for ``digest_hex`` is stored."""
+
+    path = blob_path(digest_hex, storage_directory)
+    return path.with_name(path.name + COMPRESSED_SUFFIX)
+
+
+def delta_blob_path(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    """Return where the blob for ``digest_hex`` is stored as a delta."""
+
+    path = blob_path(digest_hex, storage_directory)
+    return path.with_name(path.name + DELTA_SUFFIX)
+
+
+def manifest_blob_path(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    """Return where the blob for ``digest_hex`` is stored as a chunk manifest."""
+
+    path = blob_path(digest_hex, storage_directory)
+    return path.with_name(path.name + MANIFEST_SUFFIX)
+
+
+def chunk_path(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    """Return where the chunk with ``digest_hex`` is stored, shared by every manifest."""
+
+    if not is_valid_digest(digest_hex):
+        raise ValueError(f"Invalid digest: {digest_hex!r}")
+
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    return root.joinpath(CHUNK_DIRECTORY, *shard_parts(digest_hex), digest_hex)
+
+
+def legacy_blob_path(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    """Return the flat location used before the fan-out layout was introduced."""
+
+    if not is_valid_digest(digest_hex):
+        raise ValueError(f"Invalid digest: {digest_hex!r}")
+
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    return root / digest_hex
+
+
+def locate_blob(digest_hex: Optional[str], storage_directory: Optional[Union[str, Path]] = None) -> Optional[Path]:
+    """Return the path of a stored blob, falling back to the flat layout and packs.
+
+    The path may name a compressed, delta or manifest blob, or be the
+    virtual path of a packed one; read it through ``open_blob``.
+    """
+
+    path = locate_loose_blob(digest_hex, storage_directory)
+    if path is not None or not is_valid_digest(digest_hex):
+        return path
+
+    assert digest_hex is not None
+    found = pack_set(storage_directory).find(digest_hex)
+    if found is not None:
+        return packed_path(*found)
+    return None
+
+
+def locate_loose_blob(
+    digest_hex: Optional[str], storage_directory: Optional[Union[str, Path]] = None
+) -> Optional[Path]:
+    """Return the path of a blob stored as its own file, in any form."""
+
+    if not is_valid_digest(digest_hex):
+        return None
+
+    assert digest_hex is not None
+    for candidate in (
+        blob_path(digest_hex, storage_directory),
+        compressed_blob_path(digest_hex, storage_directory),
+        delta_blob_path(digest_hex, storage_directory),
+        manifest_blob_path(digest_hex, storage_directory),
+        legacy_blob_path(digest_hex, storage_directory),
+    ):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def is_delta(path: Union[str, Path]) -> bool:
+    return str(path).endswith(DELTA_SUFFIX)
+
+
+def is_encoded(path: Union[str, Path]) -> bool:
+    """Return whether the stored bytes at ``path`` differ from the blob content."""
+
+    return is_compressed(path) or is_delta(path) or is_manifest(path) or is_packed(path)
+
+
+def open_stored(path: Union[str, Path]) -> BinaryIO:
+    """Open the bytes stored at ``path``, which may be a packed blob.
+
+    A loose blob packed and removed since it was located is read from its
+    pack instead.
+    """
+
+    if is_packed(path):
+        return io.BytesIO(read_packed(path))
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        name = Path(path).name
+        found = pack_set().find(name[:64]) if is_valid_digest(name[:64]) else None
+        if found is None or found[1].suffix != name[64:]:
+            raise
+        return io.BytesIO(found[0].read(found[1]))
+
+
+def stored_size(path: Union[str, Path]) -> int:
+    """Return how many bytes the blob at ``path`` takes up in the store."""
+
+    if is_packed(path):
+        path = Path(path)
+        found = pack_set(path.parent.parent.parent).find(path.name[:64])
+        if found is None:
+            raise FileNotFoundError(f"Packed blob not found: {path}")
+        return found[1].length
+    return os.stat(path).st_size
+
+
+def open_blob(
+    path: Union[str, Path], storage_directory: Optional[Union[str, Path]] = None, *, cached: bool = True
+) -> BinaryIO:
+    """Open the blob stored at ``path`` for reading its content, whatever its form.
+
+    With ``cached=False`` a delta is rebuilt from disk even when
+    ``reconstruction_cache`` holds its content, and is not added to it.
+    """
+
+    if storage_directory is None and is_packed(path):
+        storage_directory = Path(path).parent.parent.parent
+    if is_delta(path):
+        return io.BytesIO(read_delta_blob(path, storage_directory, cached=cached))
+    if is_compressed(path):
+        return CompressedBlobReader(path, open_stored(path))  # type: ignore[return-value]
+    if is_manifest(path):
+        chunk_paths = partial(chunk_path, storage_directory=storage_directory)
+        return ChunkedBlobReader(path, chunk_paths, open_stored(path))  # type: ignore[return-value]
+    return open_stored(path)
+
+
+def blob_size(path: Union[str, Path]) -> int:
+    """Return the size of the content of the blob stored at ``path``."""
+
+    if is_delta(path):
+        with open_stored(path) as file_obj:
+            return read_delta_header(file_obj.read(HEADER_PEEK_SIZE))[1]
+    if is_compressed(path):
+        with open_stored(path) as file_obj:
+            return read_header(file_obj)[1]
+    if is_manifest(path):
+        with open_stored(path) as file_obj:
+            return read_manifest_size(file_obj)
+    return stored_size(path)
+
+
+def read_blob(
+    digest_hex: str, storage_directory: Optional[Union[str, Path]] = None, _depth: int = 0, *, cached: bool = True
+) -> bytes:
+    """Return the whole content of a stored blob.
+
+    Content rebuilt from deltas is kept in ``reconstruction_cache``, unless
+    ``cached`` is false; see ``open_blob``.
+    """
+
+    content = reconstruction_cache.get(digest_hex) if cached else None
+    if content is not None:
+        return content
+
+    path = locate_blob(digest_hex, storage_directory)
+    if path is None:
+        raise FileNotFoundError(f"Blob not found: {digest_hex}")
+    if is_delta(path):
+        return read_delta_blob(path, storage_directory, _depth, cached=cached)
+    with open_blob(path, storage_directory) as file_obj:
+        return file_obj.read()
+
+
+def read_delta_blob(
+    path: Union[str, Path],
+    storage_directory: Optional[Union[str, Path]] = None,
+    _depth: int = 0,
+    *,
+    cached: bool = True,
+) -> bytes:
+    if _depth > MAX_DELTA_DEPTH:
+        raise OSError(f"Delta chain too long at {path}")
+
+    digest_hex = Path(path).name[: -len(DELTA_SUFFIX)]
+    content = reconstruction_cache.get(digest_hex) if cached else None
+    if content is not None:
+        return content
+
+    with open_stored(path) as file_obj:
+        data = file_obj.read()
+    try:
+        base_digest, _ = read_delta_header(data)
+        content = unpack_delta(data, read_blob(base_digest, storage_directory, _depth + 1, cached=cached))
+    except (ValueError, zlib.error) as exc:
+        raise OSError(f"Corrupt delta blob {path}: {exc}") from exc
+    if cached:
+        reconstruction_cache.put(digest_hex, content)
+    return content
+
+
+def delta_chain(digest_hex: str, storage_directory: Optional[Union[str, Path]] = None) -> list[str]:
+    """Return the digests a blob's content depends on, nearest base first."""
+
+    chain: list[str] = []
+    path = locate_blob(digest_hex, storage_directory)
+    while path is not None and is_delta(path) and len(chain) <= MAX_DELTA_DEPTH:
+        with open_stored(path) as file_obj:
+            base_digest, _ = read_delta_header(file_obj.read(HEADER_PEEK_SIZE))
+        chain.append(base_digest)
+        path = locate_blob(base_digest, storage_directory)
+    return chain
+
+
+@contextmanager
+def store_lock(name: str, storage_directory: Optional[Union[str, Path]] = None) -> Iterator[None]:
+    """Hold an exclusive ``flock`` on the lock file ``name`` in the store's root."""
+
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / name, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _delta_candidate(
+    digest_hex: str,
+    base_digest: str,
+    policy: DeltaPolicy,
+    storage_directory: Optional[Union[str, Path]] = None,
+) -> Optional[Path]:
+    """Return where ``digest_hex`` is stored if ``deltify`` may replace it, else ``None``."""
+
+    path = locate_blob(digest_hex, storage_directory)
+    base_path = locate_blob(base_digest, storage_directory)
+    if path is None or base_path is None or is_delta(path) or is_manifest(path):
+        return None
+    if blob_size(path) > policy.max_size or blob_size(base_path) > policy.max_size:
+        return None
+    chain = delta_chain(base_digest, storage_directory)
+    if digest_hex in chain or len(chain) + 1 >= max(policy.keyframe_interval, 1):
+        return None
+    return path
+
+
+def deltify(
+    digest_hex: str,
+    base_digest: str,
+    policy: DeltaPolicy,
+    storage_directory: Optional[Union[str, Path]] = None,
+) -> bool:
+    """Replace the full blob for ``digest_hex`` with a delta against ``base_digest``.
+
+    Nothing changes, and ``False`` is returned, when the blob is already a
+    delta or chunked, either blob is larger than ``policy.max_size``, the
+    base's chain is already ``policy.keyframe_interval`` long or leads back
+    to the blob, or the delta would not be smaller than ``policy.max_ratio``
+    of what is stored now. A packed blob gets a loose delta, which wins in
+    ``locate_blob``; ``repack`` drops the packed copy when it consolidates.
+
+    The delta is computed without any lock held. The checks are repeated
+    under ``DELTA_LOCK_NAME`` before the delta replaces the blob, so two
+    deltas can never point at each other.
+    """
+
+    if digest_hex == base_digest:
+        return False
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    path = _delta_candidate(digest_hex, base_digest, policy, storage_directory)
+    if path is None:
+        return False
+
+    try:
+        stored = stored_size(path)
+    except FileNotFoundError:
+        # Packed since it was located: look for it again.
+        path = _delta_candidate(digest_hex, base_digest, policy, storage_directory)
+        if path is None:
+            return False
+        stored = stored_size(path)
+    with open_blob(path, storage_directory) as file_obj:
+        content = file_obj.read()
+    operations = encode(read_blob(base_digest, storage_directory), content, max_size=len(content))
+    if operations is None:
+        return False
+    data = pack_delta(base_digest, len(content), operations)
+    if len(data) > stored * policy.max_ratio:
+        return False
+
+    file_descriptor, temp_name = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=root)
+    try:
+        with os.fdopen(file_descriptor, "wb") as file_obj:
+            file_obj.write(data)
+        with store_lock(DELTA_LOCK_NAME, root):
+            if _delta_candidate(digest_hex, base_digest, policy, storage_directory) is None:
+                return False
+            os.replace(temp_name, delta_blob_path(digest_hex, storage_directory))
+            for full_path in (
+                blob_path(digest_hex, storage_directory),
+                compressed_blob_path(digest_hex, storage_directory),
+                legacy_blob_path(digest_hex, storage_directory),
+            ):
+                full_path.unlink(missing_ok=True)
+    finally:
+        Path(temp_name).unlink(missing_ok=True)
+    return True
+
+
+def move_into_place(temp_path: Union[str, Path], destination_path: Union[str, Path]) -> bool:
+    """Atomically rename a spooled file onto its blob path.
+
+    Returns ``False`` and removes the spooled file when a blob is already
+    stored at the destination.
+    """
+
+    destination = Path(destination_path)
+    if destination.exists():
+        Path(temp_path).unlink(missing_ok=True)
+        return False
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temp_path, destination)
+    return True
+
+
+def store_chunks(
+    temp_path: Union[str, Path],
+    policy: ChunkingPolicy,
+    storage_directory: Optional[Union[str, Path]] = None,
+) -> Path:
+    """Split a spooled blob into chunks and return a spooled manifest for it.
+
+    Chunks not stored yet are written under ``chunks/``; the rest are
+    shared. The raw spooled file is removed once the manifest exists.
+    """
+
+    raw_path = Path(temp_path)
+    root = raw_path.parent if storage_directory is None else Path(storage_directory)
+    chunks: list[tuple[str, int]] = []
+    size = 0
+    with open(raw_path, "rb") as file_obj:
+        for chunk in iter_chunks(file_obj, policy):
+            digest_hex = hashlib.sha256(chunk).hexdigest()
+            chunks.append((digest_hex, len(chunk)))
+            size += len(chunk)
+            destination = chunk_path(digest_hex, root)
+            try:
+                # Refresh shared chunks so garbage collection's grace period
+                # covers them until this manifest is stored and recorded.
+                os.utime(destination)
+                continue
+            except FileNotFoundError:
+                pass
+            file_descriptor, chunk_temp = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=root)
+            try:
+                with os.fdopen(file_descriptor, "wb") as chunk_file:
+                    chunk_file.write(chunk)
+                move_into_place(chunk_temp, destination)
+            except BaseException:
+                Path(chunk_temp).unlink(missing_ok=True)
+                raise
+
+    file_descriptor, manifest_temp = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=root)
+    try:
+        with os.fdopen(file_descriptor, "wb") as manifest_file:
+            manifest_file.write(pack_manifest(size, chunks))
+    except BaseException:
+        Path(manifest_temp).unlink(missing_ok=True)
+        raise
+    raw_path.unlink()
+    return Path(manifest_temp)
+
+
+def prepare_blob(
+    temp_path: Union[str, Path],
+    policy: CompressionPolicy,
+    chunking: Optional[ChunkingPolicy] = None,
+    storage_directory: Optional[Union[str, Path]] = None,
+) -> tuple[Path, str]:
+    """Chunk or compress a spooled blob when the policies say it is worth it.
+
+    Returns the file to move into place and its blob suffix: ``""`` for a
+    raw blob, ``.z`` for a compressed one and ``.m`` for a chunk manifest.
+    Chunking takes precedence; chunks themselves are stored raw. The raw
+    spooled file is removed once its replacement exists.
+    """
+
+    raw_path = Path(temp_path)
+    if chunking is not None and chunking.should_chunk(raw_path.stat().st_size):
+        return store_chunks(raw_path, chunking, storage_directory), MANIFEST_SUFFIX
+    if not probe(raw_path, policy):
+        return raw_path, ""
+
+    assert policy.codec is not None
+    compressed_path = compress_file(raw_path, raw_path.parent, policy.codec)
+    if compressed_path.stat().st_size >= raw_path.stat().st_size:
+        compressed_path.unlink()
+        return raw_path, ""
+
+    raw_path.unlink()
+    return compressed_path, COMPRESSED_SUFFIX
+
+
+def store_blob(
+    temp_path: Union[str, Path],
+    digest_hex: str,
+    storage_directory: Optional[Union[str, Path]] = None,
+    suffix: str = "",
+) -> bool:
+    """Move a prepared blob with the given ``suffix`` into place under ``digest_hex``.
+
+    Returns ``False`` and removes the spooled file when the digest is
+    already stored, in any form.
+    """
+
+    try:
+        if locate_blob(digest_hex, storage_directory) is not None:
+            Path(temp_path).unlink(missing_ok=True)
+            return False
+        path = blob_path(digest_hex, storage_directory)
+        return move_into_place(temp_path, path.with_name(path.name + suffix))
+    except OSError:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+def parse_blob_name(file_name: str) -> Optional[tuple[str, str]]:
+    """Return ``(digest, suffix)`` for the file name of a loose blob, else ``None``."""
+
+    digest_hex, suffix = file_name[:64], file_name[64:]
+    if suffix not in BLOB_SUFFIXES or not is_valid_digest(digest_hex):
+        return None
+    return digest_hex, suffix
+
+
+def iter_loose_blobs(
+    storage_directory: Optional[Union[str, Path]] = None,
+) -> Iterator[tuple[str, str, Path, os.stat_result]]:
+    """Yield ``(digest, suffix, path, stat)`` for every blob stored as its own file.
+
+    Temporary files, upload sessions, chunks and packs are skipped.
+    """
+
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    for directory, subdirectories, file_names in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+        if Path(directory) == root:
+            subdirectories[:] = [name for name in subdirectories if name not in (CHUNK_DIRECTORY, PACK_DIRECTORY)]
+        for file_name in file_names:
+            parsed = parse_blob_name(file_name)
+            if parsed is None:
+                continue
+            digest_hex, suffix = parsed
+            path = Path(directory) / file_name
+            try:
+                yield digest_hex, suffix, path, path.stat()
+            except FileNotFoundError:
+                continue
+
+
+def repack_lock(storage_directory: Optional[Union[str, Path]] = None):
+    """Hold the lock that keeps packs from being rewritten by two processes at once."""
+
+    return store_lock(PACK_LOCK_NAME, storage_directory)
+
+
+def repack(
+    storage_directory: Optional[Union[str, Path]] = None,
+    policy: Optional[PackPolicy] = None,
+    consolidate: bool = False,
+) -> dict[str, int]:
+    """Move small loose blobs into new packs, and optionally merge small packs.
+
+    Blobs of at most ``policy.max_blob_size`` stored bytes that have not
+    changed for ``policy.min_age`` seconds are packed, which keeps blobs
+    that are still being written, renamed or replaced by a delta out of the
+    packs. The loose files are removed only once the pack is on disk. With
+    ``consolidate``, packs smaller than ``policy.max_pack_size`` are merged,
+    dropping entries that also exist loose, such as blobs deltified after
+    they were packed. Returns counts of what was done.
+
+    ``DELTA_LOCK_NAME`` is held throughout, so ``deltify`` cannot remove a
+    loose blob between it being batched and packed.
+    """
+
+    policy = PackPolicy.from_settings() if policy is None else policy
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    counts = {"packed": 0, "packed_bytes": 0, "packs_written": 0, "packs_removed": 0}
+
+    batch: list[tuple[str, str, Union[bytes, Path]]] = []
+    batch_size = 0
+
+    def flush() -> None:
+        nonlocal batch, batch_size
+        # Loose blobs replaced by a delta since the scan are left out.
+        batch = [item for item in batch if not isinstance(item[2], Path) or item[2].exists()]
+        if write_pack(batch, root) is not None:
+            counts["packs_written"] += 1
+        for _, _, source in batch:
+            if isinstance(source, Path):
+                counts["packed"] += 1
+                counts["packed_bytes"] += source.stat().st_size
+                source.unlink()
+        batch, batch_size = [], 0
+
+    with repack_lock(root), store_lock(DELTA_LOCK_NAME, root):
+        packs = pack_set(root)
+        cutoff = time.time() - policy.min_age
+        for digest_hex, suffix, path, stat in iter_loose_blobs(root):
+            if stat.st_size > policy.max_blob_size or stat.st_mtime > cutoff or packs.find(digest_hex):
+                continue
+            batch.append((digest_hex, suffix, path))
+            batch_size += stat.st_size
+            if batch_size >= policy.max_pack_size:
+                flush()
+        flush()
+
+        if consolidate:
+            small = [pack for pack in packs.refresh() if pack.path.stat().st_size < policy.max_pack_size]
+            if len(small) > 1:
+                for pack in small:
+                    for entry in pack.entries():
+                        # Loose copies win in ``locate_blob``, so packed ones are dead.
+                        if locate_loose_blob(entry.digest_hex, root) is not None:
+                            continue
+                        batch.append((entry.digest_hex, entry.suffix, pack.read(entry)))
+                        batch_size += entry.length
+                        if batch_size >= policy.max_pack_size:
+                            flush()
+                flush()
+                for pack in small:
+                    remove_pack(pack)
+                    counts["packs_removed"] += 1
+    return counts
+
+
+class BlobWriter:
+    """Stream bytes into a temporary file while computing their SHA-256 digest.
+
+    The temporary file is created inside the storage directory so that the
+    final rename onto the digest name is atomic and never crosses a
+    filesystem boundary.
+    """
+
+    def __init__(self, storage_directory: Optional[Union[str, Path]] = None):
+        self.storage_directory = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+        self.storage_directory.mkdir(parents=True, exist_ok=True)
+
+        file_descriptor, temp_name = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.storage_directory)
+        self.temp_path = Path(temp_name)
+        self._file_obj: Optional[BinaryIO] = os.fdopen(file_descriptor, "wb")
+        self._hasher = hashlib.sha256()
+        self.size = 0
+        self.digest_hex: Optional[str] = None
+        self.committed = False
+
+    def write(self, chunk: Union[bytes, bytearray, memoryview]) -> int:
+        """Append a chunk to the temporary file and feed it to the hasher."""
+
+        if self._file_obj is None:
+            raise ValueError("Cannot write to a closed blob writer.")
+
+        self._hasher.update(chunk)
+        written = self._file_obj.write(chunk)
+        self.size += written
+        return written
+
+    def close(self) -> str:
+        """Flush the temporary file and return the digest of its content."""
+
+        if self._file_obj is not None:
+            self._file_obj.close()
+            self._file_obj = None
+            self.digest_hex = self._hasher.hexdigest()
+
+        assert self.digest_hex is not None
+        return self.digest_hex
+
+    def copy_from(self, filepath: Union[str, Path], strategies: Sequence[str]) -> Optional[str]:
+        """Fill the empty writer from ``filepath`` with a ``copy_file`` strategy.
+
+        The digest is computed from the copy, so it matches the stored bytes
+        even if the source changes meanwhile. Returns the strategy used, or
+        ``None`` (leaving the writer empty and open) when none applies.
+        """
+
+        if self._file_obj is None or self.size:
+            raise ValueError("Can only copy into an empty, open blob writer.")
+
+        strategy = copy_file(filepath, self.temp_path, strategies)
+        if strategy is None:
+            return None
+
+        self._file_obj.close()
+        self._file_obj = None
+        with open(self.temp_path, "rb", buffering=0) as file_obj:
+            view = memoryview(bytearray(INGEST_CHUNK_SIZE))
+            while True:
+                read = file_obj.readinto(view)
+                if not read:
+                    break
+                self._hasher.update(view[:read])
+                self.size += read
+        self.digest_hex = self._hasher.hexdigest()
+        return strategy
+
+    def commit(self, destination_path: Union[str, Path]) -> bool:
+        """Atomically move the blob to ``destination_path``.
+
+        Returns ``False`` (and discards the temporary file) when a blob is
+        already stored at the destination.
+        """
+
+        self.close()
+        try:
+            stored = move_into_place(self.temp_path, destination_path)
+        except OSError:
+            self.discard()
+            raise
+        # Either way the temporary name is gone and may be reused by another
+        # writer, so ``discard`` must no longer touch it.
+        self.committed = True
+        return stored
+
+    def store(self, policy: Optional[CompressionPolicy] = None, chunking: Optional[ChunkingPolicy] = None) -> bool:
+        """Move the blob to its digest path, chunked or compressed if the policies say so.
+
+        ``policy`` and ``chunking`` default to the ``FILES_COMPRESSION`` and
+        ``FILES_CHUNKING`` settings. Returns ``False`` (and discards the
+        temporary file) when the digest is already stored.
+        """
+
+        digest_hex = self.close()
+        if policy is None:
+            policy = CompressionPolicy.from_settings()
+        if chunking is None:
+            chunking = ChunkingPolicy.from_settings()
+        if locate_blob(digest_hex, self.storage_directory) is not None:
+            self.discard()
+            return False
+
+        try:
+            path, suffix = prepare_blob(self.temp_path, policy, chunking, self.storage_directory)
+        except OSError:
+            self.discard()
+            raise
+        # ``store_blob`` removes whichever file it was given on failure.
+        self.committed = True
+        return store_blob(path, digest_hex, self.storage_directory, suffix)
+
+    def discard(self) -> None:
+        """Close and remove the temporary file unless it was committed."""
+
+        if self._file_obj is not None:
+            self._file_obj.close()
+            self._file_obj = None
+        if not self.committed:
+            self.temp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "BlobWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None:
+            self.discard()
+
+
+def ingest_stream(
+    source: BinaryIO,
+    storage_directory: Optional[Union[str, Path]] = None,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+) -> BlobWriter:
+    """Copy ``source`` into the store in a single pass, hashing as it goes.
+
+    The returned writer is closed and holds the digest; the caller decides
+    whether to ``commit`` or ``discard`` it.
+    """
+
+    writer = BlobWriter(storage_directory)
+
+    with writer:
+        if hasattr(source, "readinto"):
+            view = memoryview(bytearray(chunk_size))
+            while True:
+                read = source.readinto(view)
+                if not read:
+                    break
+                writer.write(view[:read])
+        else:
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                writer.write(chunk)
+        writer.close()
+
+    return writer
+
+
+def ingest_file(
+    filepath: Union[str, Path],
+    storage_directory: Optional[Union[str, Path]] = None,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    strategies: Optional[Sequence[str]] = None,
+) -> BlobWriter:
+    """Copy ``filepath`` into the store and hash it.
+
+    The strategies among ``strategies`` (default ``FILES_COPY_STRATEGIES``)
+    that share data with the source are tried first, since the copy then
+    costs no more than the read that hashes it. Otherwise the file is
+    opened unbuffered and streamed in a single pass: copying it in the
+    kernel and reading it back to hash would read it twice.
+    """
+
+    sharing = [
+        name for name in (copy_strategies() if strategies is None else strategies) if name in SHARING_STRATEGIES
+    ]
+    if sharing:
+        writer = BlobWriter(storage_directory)
+        with writer:
+            if writer.copy_from(filepath, sharing) is not None:
+                return writer
+        writer.discard()
+
+    with open(filepath, "rb", buffering=0) as file_obj:
+        return ingest_stream(file_obj, storage_directory, chunk_size=chunk_size)
+
+
+__all__ = [
+    "BlobWriter",
+    "INGEST_CHUNK_SIZE",
+    "blob_path",
+    "blob_size",
+    "chunk_path",
+    "compressed_blob_path",
+    "delta_blob_path",
+    "delta_chain",
+    "deltify",
+    "ingest_file",
+    "ingest_stream",
+    "is_delta",
+    "is_encoded",
+    "is_valid_digest",
+    "iter_loose_blobs",
+    "legacy_blob_path",
+    "locate_blob",
+    "locate_loose_blob",
+    "manifest_blob_path",
+    "move_into_place",
+    "open_blob",
+    "open_stored",
+    "parse_blob_name",
+    "prepare_blob",
+    "read_blob",
+    "repack",
+    "repack_lock",
+    "store_blob",
+    "store_chunks",
+    "stored_size",
+]
@@ -0,0 +1,135 @@
+"""Utilities for storing the chunks of resumable upload sessions on disk."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from django.conf import settings
+
+from .blob_store import INGEST_CHUNK_SIZE, BlobWriter, store_lock
+
+SESSIONS_DIRECTORY = ".upload-sessions"
+SESSION_LOCK_NAME = ".lock"
+
+
+class ChunkTooLarge(ValueError):
+    """Raised when a chunk exceeds ``FILES_UPLOAD_MAX_CHUNK_SIZE``, or would
+    take its session past ``FILES_UPLOAD_MAX_SESSION_SIZE``."""
+
+
+class ChunkedUpload:
+    """Chunk files of one upload session, kept under ``FILES_ROOT``.
+
+    Every chunk is written to a temporary name and renamed into place, so a
+    chunk file is either absent or complete. Concurrent uploads and retries
+    of the same chunk are therefore safe, and the state survives restarts.
+    Chunks stream in concurrently; only the session size check and the
+    rename are serialized, by a lock file in the session's directory.
+    """
+
+    def __init__(self, session_id: object, storage_directory: Optional[Union[str, Path]] = None):
+        self.storage_directory = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+        self.directory = self.sessions_root(self.storage_directory) / str(session_id)
+
+    @staticmethod
+    def sessions_root(storage_directory: Optional[Union[str, Path]] = None) -> Path:
+        root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+        return root / SESSIONS_DIRECTORY
+
+    @staticmethod
+    def max_chunks() -> int:
+        return int(getattr(settings, "FILES_UPLOAD_MAX_CHUNKS", 10_000))
+
+    def chunk_path(self, index: int) -> Path:
+        if index < 0:
+            raise ValueError("Chunk index must be a non-negative integer.")
+        if index >= self.max_chunks():
+            raise ValueError(f"Chunk index must be below {self.max_chunks()}.")
+        return self.directory / str(index)
+
+    def stored_bytes(self, exclude: Optional[int] = None) -> int:
+        """Return the size of the session's chunks, leaving out chunk ``exclude``."""
+
+        if not self.directory.is_dir():
+            return 0
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.directory)
+            if entry.name.isdigit() and entry.name != str(exclude)
+        )
+
+    def write_chunk(self, index: int, source: BinaryIO) -> int:
+        """Stream ``source`` into chunk ``index`` and return its size."""
+
+        max_size = int(getattr(settings, "FILES_UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024))
+        max_session_size = int(getattr(settings, "FILES_UPLOAD_MAX_SESSION_SIZE", 4 * 1024 * 1024 * 1024))
+        destination = self.chunk_path(index)
+        # A retried chunk replaces its earlier copy, so that copy does not count.
+        remaining = max_session_size - self.stored_bytes(exclude=index)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        file_descriptor, temp_name = tempfile.mkstemp(prefix=f".{index}-", dir=self.directory)
+        size = 0
+        try:
+            with os.fdopen(file_descriptor, "wb") as file_obj:
+                for chunk in iter(lambda: source.read(INGEST_CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ChunkTooLarge(f"Chunks may not exceed {max_size} bytes.")
+                    if size > remaining:
+                        raise ChunkTooLarge(f"Upload sessions may not exceed {max_session_size} bytes.")
+                    file_obj.write(chunk)
+            with store_lock(SESSION_LOCK_NAME, self.directory):
+                # Chunks written concurrently may have used up the budget since.
+                if self.stored_bytes(exclude=index) + size > max_session_size:
+                    raise ChunkTooLarge(f"Upload sessions may not exceed {max_session_size} bytes.")
+                os.replace(temp_name, destination)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+        return size
+
+    def received_chunks(self) -> list[int]:
+        """Return the indexes of the chunks stored so far, in order."""
+
+        if not self.directory.is_dir():
+            return []
+        return sorted(int(entry.name) for entry in os.scandir(self.directory) if entry.name.isdigit())
+
+    def missing_chunks(self, chunk_count: int) -> list[int]:
+        """Return the indexes below ``chunk_count`` that have not been received.
+
+        Gaps are searched for only up to the highest chunk received; every
+        index above it is missing. ``chunk_count`` must not exceed
+        ``max_chunks()``.
+        """
+
+        received = self.received_chunks()
+        highest = min(chunk_count, received[-1] + 1 if received else 0)
+        present = set(received)
+        return [index for index in range(highest) if index not in present] + list(range(highest, chunk_count))
+
+    def assemble(self, chunk_count: int) -> BlobWriter:
+        """Concatenate chunks ``0..chunk_count-1`` into a new, hashed blob.
+
+        The returned writer is closed; the caller commits or discards it.
+        """
+
+        writer = BlobWriter(self.storage_directory)
+        with writer:
+            for index in range(chunk_count):
+                with self.chunk_path(index).open("rb") as chunk_file:
+                    for chunk in iter(lambda: chunk_file.read(INGEST_CHUNK_SIZE), b""):
+                        writer.write(chunk)
+            writer.close()
+        return writer
+
+    def remove(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+__all__ = ["ChunkTooLarge", "ChunkedUpload"]
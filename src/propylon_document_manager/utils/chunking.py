@@ -0,0 +1,272 @@
+"""Content-defined chunking and chunked (manifest) blobs.
+
+Large blobs can be split at content-defined boundaries, so an edit only
+changes the chunks around it and every other chunk is shared with earlier
+versions and other files. Chunks are stored once under
+``FILES_ROOT/chunks/`` by their own SHA-256; the blob itself becomes a
+manifest, ``<digest>.m``, listing its chunks in order.
+
+Boundaries follow FastCDC: no cut before ``min_size``, a harder cut
+condition until ``avg_size`` and an easier one after it (normalized
+chunking), and a forced cut at ``max_size``. The rolling hash is a gear
+hash whose table maps every byte to one bit, and a cut point is where the
+last few bits spell a fixed pattern. That lets ``bytes.translate`` and
+``bytearray.find`` do the per-byte work in C instead of a Python loop.
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import io
+import struct
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional, Union
+
+from django.conf import settings
+
+MANIFEST_SUFFIX = ".m"
+CHUNK_DIRECTORY = "chunks"
+HEADER = struct.Struct(">4sBQI")
+ENTRY = struct.Struct(">32sI")
+MAGIC = b"PDMC"
+FORMAT_VERSION = 1
+READ_SIZE = 1024 * 1024
+# The pattern must fit after ``min_size`` bytes of a chunk.
+MIN_CHUNK_SIZE = 64
+
+# Both tables are fixed forever: changing them moves every boundary and
+# stops new chunks from matching stored ones.
+_gear_order = sorted(range(256), key=lambda value: hashlib.sha256(b"gear%d" % value).digest())
+GEAR_BITS = bytes(1 if _gear_order.index(value) < 128 else 0 for value in range(256))
+_pattern_seed = hashlib.sha256(b"cut pattern").digest()
+CUT_PATTERN = bytes((_pattern_seed[index // 8] >> (index % 8)) & 1 for index in range(32))
+
+
+class ChunkingPolicy(NamedTuple):
+    """Whether large blobs are chunked, and the chunk size bounds."""
+
+    enabled: bool
+    min_size: int = 4 * 1024
+    avg_size: int = 16 * 1024
+    max_size: int = 64 * 1024
+
+    @classmethod
+    def from_settings(cls) -> "ChunkingPolicy":
+        policy = cls(
+            enabled=bool(getattr(settings, "FILES_CHUNKING", False)),
+            min_size=int(getattr(settings, "FILES_CHUNK_MIN_SIZE", 4 * 1024)),
+            avg_size=int(getattr(settings, "FILES_CHUNK_AVG_SIZE", 16 * 1024)),
+            max_size=int(getattr(settings, "FILES_CHUNK_MAX_SIZE", 64 * 1024)),
+        )
+        policy.validate()
+        return policy
+
+    def validate(self) -> None:
+        if not MIN_CHUNK_SIZE <= self.min_size < self.avg_size < self.max_size:
+            raise ValueError(
+                f"Chunk sizes must satisfy {MIN_CHUNK_SIZE} <= min < avg < max, got "
+                f"{self.min_size}/{self.avg_size}/{self.max_size}."
+            )
+
+    @property
+    def patterns(self) -> tuple[bytes, bytes]:
+        """Return the cut patterns used before and after ``avg_size``."""
+
+        bits = max(self.avg_size.bit_length() - 1, 4)
+        return CUT_PATTERN[: bits + 2], CUT_PATTERN[: bits - 2]
+
+    def should_chunk(self, size: int) -> bool:
+        """Return whether a blob of ``size`` bytes is worth chunking.
+
+        Blobs shorter than two average chunks gain little over whole-file
+        deduplication and would only add a manifest.
+        """
+
+        return self.enabled and size >= 2 * self.avg_size
+
+
+def cut_point(bits: Union[bytes, bytearray], start: int, end: int, policy: ChunkingPolicy) -> int:
+    """Return where the chunk starting at ``start`` ends.
+
+    ``bits`` is the data passed through ``GEAR_BITS``; ``end`` is the end of
+    the data available, which must reach ``max_size`` past ``start`` unless
+    the input is exhausted.
+    """
+
+    if end - start <= policy.min_size:
+        return end
+    small, large = policy.patterns
+    normal = min(start + policy.avg_size, end)
+    limit = min(start + policy.max_size, end)
+
+    found = bits.find(small, start + policy.min_size - len(small) + 1, normal)
+    if found >= 0:
+        return found + len(small)
+    found = bits.find(large, normal - len(large) + 1, limit)
+    if found >= 0:
+        return found + len(large)
+    return limit
+
+
+def iter_chunks(file_obj: BinaryIO, policy: ChunkingPolicy, read_size: int = READ_SIZE) -> Iterator[bytes]:
+    """Yield the content-defined chunks of ``file_obj``, in order."""
+
+    read_size = max(read_size, policy.max_size)
+    data = bytearray()
+    bits = bytearray()
+    start = 0
+    eof = False
+    while True:
+        if not eof and len(data) - start < policy.max_size:
+            del data[:start]
+            del bits[:start]
+            start = 0
+            block = file_obj.read(read_size)
+            if block:
+                data += block
+                bits += block.translate(GEAR_BITS)
+            else:
+                eof = True
+            continue
+        if start >= len(data):
+            return
+        end = cut_point(bits, start, len(data), policy)
+        yield bytes(data[start:end])
+        start = end
+
+
+def pack_manifest(size: int, chunks: list[tuple[str, int]]) -> bytes:
+    """Return a manifest for content of ``size`` bytes made of ``(digest, length)`` chunks."""
+
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, size, len(chunks))]
+    parts.extend(ENTRY.pack(bytes.fromhex(digest_hex), length) for digest_hex, length in chunks)
+    return b"".join(parts)
+
+
+def read_manifest(file_obj: BinaryIO) -> tuple[int, list[tuple[str, int]]]:
+    """Read a manifest and return ``(content size, [(chunk digest, length), ...])``."""
+
+    header = file_obj.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError("Not a chunk manifest.")
+    magic, version, size, count = HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Not a chunk manifest.")
+    data = file_obj.read(ENTRY.size * count)
+    if len(data) != ENTRY.size * count:
+        raise ValueError("Chunk manifest is truncated.")
+    chunks = [(digest.hex(), length) for digest, length in ENTRY.iter_unpack(data)]
+    if sum(length for _, length in chunks) != size:
+        raise ValueError("Chunk manifest sizes do not add up.")
+    return size, chunks
+
+
+def read_manifest_size(file_obj: BinaryIO) -> int:
+    magic, _, size, _ = HEADER.unpack(file_obj.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a chunk manifest.")
+    return size
+
+
+def is_manifest(path: Union[str, Path]) -> bool:
+    return str(path).endswith(MANIFEST_SUFFIX)
+
+
+class ChunkedBlobReader(io.RawIOBase):
+    """Seekable, read-only view of the content of a ``.m`` blob.
+
+    Chunks are opened one at a time as the position reaches them, so a
+    download streams with constant memory. ``file_obj`` supplies the
+    manifest when it is not a plain file at ``path``.
+    """
+
+    def __init__(self, path: Union[str, Path], chunk_path: Callable[[str], Path], file_obj: Optional[BinaryIO] = None):
+        super().__init__()
+        self.name = str(path)
+        manifest = open(path, "rb") if file_obj is None else file_obj
+        with manifest:
+            try:
+                self.size, self.chunks = read_manifest(manifest)
+            except ValueError as exc:
+                raise OSError(f"Corrupt chunk manifest {path}: {exc}") from exc
+        self._chunk_path = chunk_path
+        self._offsets = []
+        offset = 0
+        for _, length in self.chunks:
+            self._offsets.append(offset)
+            offset += length
+        self._position = 0
+        self._index: Optional[int] = None
+        self._file: Optional[BinaryIO] = None
+
+    def _open_chunk(self, index: int) -> BinaryIO:
+        if self._index != index:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self._chunk_path(self.chunks[index][0]), "rb")
+            self._index = index
+        assert self._file is not None
+        return self._file
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._position = max(0, position)
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = self.size if size is None or size < 0 else min(self.size, self._position + size)
+        parts = []
+        while self._position < end:
+            index = bisect.bisect_right(self._offsets, self._position) - 1
+            chunk_offset = self._position - self._offsets[index]
+            wanted = min(end - self._position, self.chunks[index][1] - chunk_offset)
+            chunk_file = self._open_chunk(index)
+            chunk_file.seek(chunk_offset)
+            data = chunk_file.read(wanted)
+            if len(data) != wanted:
+                raise OSError(f"Chunk {self.chunks[index][0]} of {self.name} is truncated")
+            parts.append(data)
+            self._position += wanted
+        return b"".join(parts)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+__all__ = [
+    "CHUNK_DIRECTORY",
+    "ChunkedBlobReader",
+    "ChunkingPolicy",
+    "MANIFEST_SUFFIX",
+    "cut_point",
+    "is_manifest",
+    "iter_chunks",
+    "pack_manifest",
+    "read_manifest",
+    "read_manifest_size",
+]
@@ -0,0 +1,294 @@
+"""Optional per-blob compression for the file store.
+
+A compressed blob is stored next to where the raw one would be, as
+``<digest>.z``, and starts with a small header recording the codec and the
+uncompressed size. The digest always names the uncompressed content; read
+blobs through ``blob_store.open_blob``.
+"""
+
+from __future__ import annotations
+
+import io
+import lzma
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional, Union
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSED_SUFFIX = ".z"
+HEADER = struct.Struct(">4sBQ")
+MAGIC = b"PDMZ"
+CHUNK_SIZE = 1024 * 1024
+PROBE_SAMPLE_SIZE = 64 * 1024
+
+CODEC_IDS = {"zlib": 1, "lzma": 2, "zstd": 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+
+def available_codecs() -> list[str]:
+    codecs = ["zlib", "lzma"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    return codecs
+
+
+def _compressor(codec: str):
+    if codec == "zlib":
+        return zlib.compressobj(6)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=6)
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"Compression codec is not available: {codec}")
+
+
+class _Inflater:
+    """Decompress a stream a bounded piece at a time.
+
+    ``read(max_length)`` never returns more than ``max_length`` bytes;
+    compressed input the decompressor has not used yet is carried over to
+    the next call instead of being expanded at once.
+    """
+
+    def __init__(self, codec: str, file_obj: BinaryIO):
+        self._file = file_obj
+        self._codec = codec
+        self._pending = b""
+        if codec == "zlib":
+            self._decompressor = zlib.decompressobj()
+        elif codec == "lzma":
+            self._decompressor = lzma.LZMADecompressor()
+        elif codec == "zstd" and zstandard is not None:
+            self._decompressor = zstandard.ZstdDecompressor().stream_reader(
+                file_obj, read_size=CHUNK_SIZE, closefd=False
+            )
+        else:
+            raise ValueError(f"Compression codec is not available: {codec}")
+
+    def read(self, max_length: int) -> bytes:
+        """Return up to ``max_length`` decompressed bytes; ``b""`` at the end."""
+
+        if self._codec == "zstd":
+            return self._decompressor.read(max_length)
+        while not self._decompressor.eof:
+            if self._codec == "zlib":
+                data = self._pending or self._file.read(CHUNK_SIZE)
+                if not data:
+                    return self._decompressor.flush()
+                output = self._decompressor.decompress(data, max_length)
+                self._pending = self._decompressor.unconsumed_tail
+            else:
+                data = self._file.read(CHUNK_SIZE) if self._decompressor.needs_input else b""
+                if self._decompressor.needs_input and not data:
+                    return b""
+                output = self._decompressor.decompress(data, max_length)
+            if output:
+                return output
+        return b""
+
+
+class CompressionPolicy(NamedTuple):
+    """Which codec new blobs get, and when compressing is worth it."""
+
+    codec: Optional[str]
+    min_size: int = 4096
+    max_ratio: float = 0.9
+
+    @classmethod
+    def from_settings(cls) -> "CompressionPolicy":
+        """Build the policy from ``FILES_COMPRESSION`` and its thresholds.
+
+        ``FILES_COMPRESSION`` is empty (off), ``auto`` (zstd when installed,
+        otherwise zlib) or a codec name.
+        """
+
+        configured = (getattr(settings, "FILES_COMPRESSION", "") or "").lower()
+        if configured == "auto":
+            configured = "zstd" if zstandard is not None else "zlib"
+        if configured and configured not in available_codecs():
+            raise ValueError(f"Compression codec is not available: {configured}")
+        return cls(
+            codec=configured or None,
+            min_size=int(getattr(settings, "FILES_COMPRESSION_MIN_SIZE", 4096)),
+            max_ratio=float(getattr(settings, "FILES_COMPRESSION_MAX_RATIO", 0.9)),
+        )
+
+
+def is_compressed(path: Union[str, Path]) -> bool:
+    return str(path).endswith(COMPRESSED_SUFFIX)
+
+
+def probe(path: Union[str, Path], policy: CompressionPolicy) -> bool:
+    """Return whether the file at ``path`` looks worth compressing.
+
+    Samples from the start, middle and end are deflated at the fastest
+    level; already-compressed formats (images, archives) fail the ratio
+    test without the whole file being compressed.
+    """
+
+    if policy.codec is None:
+        return False
+    size = os.stat(path).st_size
+    if size < policy.min_size:
+        return False
+
+    offsets = sorted({0, max(0, size // 2 - PROBE_SAMPLE_SIZE // 2), max(0, size - PROBE_SAMPLE_SIZE)})
+    raw = compressed = 0
+    with open(path, "rb") as file_obj:
+        for offset in offsets:
+            file_obj.seek(offset)
+            sample = file_obj.read(PROBE_SAMPLE_SIZE)
+            raw += len(sample)
+            compressed += len(zlib.compress(sample, 1))
+    return compressed <= raw * policy.max_ratio
+
+
+def compress_file(source_path: Union[str, Path], directory: Union[str, Path], codec: str) -> Path:
+    """Write a compressed copy of ``source_path`` to a temporary file in ``directory``."""
+
+    size = os.stat(source_path).st_size
+    compressor = _compressor(codec)
+    file_descriptor, temp_name = tempfile.mkstemp(prefix=".compress-", dir=directory)
+    try:
+        with os.fdopen(file_descriptor, "wb") as output, open(source_path, "rb") as source:
+            output.write(HEADER.pack(MAGIC, CODEC_IDS[codec], size))
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                output.write(compressor.compress(chunk))
+            output.write(compressor.flush())
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+    return Path(temp_name)
+
+
+def read_header(file_obj: BinaryIO) -> tuple[str, int]:
+    """Read a compressed blob header and return ``(codec, uncompressed size)``."""
+
+    magic, codec_id, size = HEADER.unpack(file_obj.read(HEADER.size))
+    if magic != MAGIC or codec_id not in CODEC_NAMES:
+        raise ValueError("Not a compressed blob.")
+    return CODEC_NAMES[codec_id], size
+
+
+class CompressedBlobReader(io.RawIOBase):
+    """Seekable, read-only view of the uncompressed content of a ``.z`` blob.
+
+    Decompression is lazy: seeking only moves the position, and a read
+    after a backward seek starts decompressing again from the beginning.
+    Responses read front to back, so that normally never happens. There is
+    no ``fileno``, so servers cannot ``sendfile`` the compressed bytes.
+    """
+
+    def __init__(self, path: Union[str, Path], file_obj: Optional[BinaryIO] = None):
+        super().__init__()
+        self.name = str(path)
+        self._file = open(path, "rb") if file_obj is None else file_obj
+        self.codec, self.size = read_header(self._file)
+        self._position = 0
+        self._restart()
+
+    def _restart(self) -> None:
+        self._file.seek(HEADER.size)
+        self._inflater = _Inflater(self.codec, self._file)
+        # Decompressed bytes not read yet start at ``_start`` in ``_buffer``
+        # and at ``_offset`` in the content.
+        self._buffer = bytearray()
+        self._start = 0
+        self._offset = 0
+
+    def _available(self) -> int:
+        return len(self._buffer) - self._start
+
+    def _consume(self, count: int) -> None:
+        self._start += count
+        self._offset += count
+        # Compact only once a good part of the buffer has been read.
+        if self._start >= CHUNK_SIZE or self._start == len(self._buffer):
+            del self._buffer[: self._start]
+            self._start = 0
+
+    def _skip_to(self, position: int) -> None:
+        """Decompress and drop everything before ``position``."""
+
+        self._consume(min(position - self._offset, self._available()))
+        while self._offset < position:
+            data = self._inflater.read(min(CHUNK_SIZE, position - self._offset))
+            if not data:
+                return
+            self._offset += len(data)
+
+    def _fill(self, until: int) -> None:
+        while self._offset + self._available() < until:
+            data = self._inflater.read(min(CHUNK_SIZE, until - self._offset - self._available()))
+            if not data:
+                break
+            self._buffer += data
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._position = max(0, position)
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = self.size if size is None or size < 0 else min(self.size, self._position + size)
+        if self._position >= end:
+            return b""
+        if self._position < self._offset:
+            self._restart()
+        self._skip_to(self._position)
+        self._fill(end)
+        if self._offset + len(self._buffer) < end:
+            raise OSError(f"Compressed blob is truncated: {self.name}")
+
+        with memoryview(self._buffer) as view:
+            data = bytes(view[self._start : self._start + end - self._position])
+        self._consume(len(data))
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+__all__ = [
+    "COMPRESSED_SUFFIX",
+    "CompressedBlobReader",
+    "CompressionPolicy",
+    "available_codecs",
+    "compress_file",
+    "is_compressed",
+    "probe",
+    "read_header",
+]
@@ -0,0 +1,242 @@
+"""Binary deltas between blobs, and a cache for reconstructed content.
+
+A delta blob is stored as ``<digest>.d``: a header naming the base digest
+and the reconstructed size, followed by a zlib-compressed list of "copy
+from base" and "insert literal" operations.
+
+The encoder anchors on the byte after every newline (text, XML and most
+binary formats have plenty) instead of hashing every offset. Matching is
+then done with slice comparisons, which keeps it fast in pure Python.
+"""
+
+from __future__ import annotations
+
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+DELTA_SUFFIX = ".d"
+HEADER = struct.Struct(">4sB32sQ")
+MAGIC = b"PDMD"
+FORMAT_VERSION = 1
+ANCHOR_LENGTH = 32
+ANCHOR_PATTERN = re.compile(rb"\n")
+COPY = struct.Struct(">cQQ")
+INSERT = struct.Struct(">cQ")
+
+
+class DeltaPolicy(NamedTuple):
+    """Whether new versions turn their predecessor into a delta, and the limits."""
+
+    enabled: bool
+    keyframe_interval: int = 16
+    max_size: int = 32 * 1024 * 1024
+    max_ratio: float = 0.5
+
+    @classmethod
+    def from_settings(cls) -> "DeltaPolicy":
+        return cls(
+            enabled=bool(getattr(settings, "FILES_DELTA", False)),
+            keyframe_interval=int(getattr(settings, "FILES_DELTA_KEYFRAME_INTERVAL", 16)),
+            max_size=int(getattr(settings, "FILES_DELTA_MAX_SIZE", 32 * 1024 * 1024)),
+            max_ratio=float(getattr(settings, "FILES_DELTA_MAX_RATIO", 0.5)),
+        )
+
+    def is_keyframe(self, version_number: int) -> bool:
+        """Return whether ``version_number`` is always kept as a full blob."""
+
+        return self.keyframe_interval <= 1 or version_number % self.keyframe_interval == 0
+
+
+def _anchors(data: bytes) -> list[int]:
+    return [0] + [match.end() for match in ANCHOR_PATTERN.finditer(data)]
+
+
+def _common_prefix(a: memoryview, a_start: int, b: memoryview, b_start: int, limit: int) -> int:
+    """Return how many bytes from ``a_start`` and ``b_start`` match, up to ``limit``."""
+
+    matched = 0
+    step = 64
+    while matched < limit:
+        size = min(step, limit - matched)
+        if a[a_start + matched : a_start + matched + size] == b[b_start + matched : b_start + matched + size]:
+            matched += size
+            step *= 2
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return matched
+
+
+def _common_suffix(a: memoryview, a_end: int, b: memoryview, b_end: int, limit: int) -> int:
+    """Return how many bytes before ``a_end`` and ``b_end`` match, up to ``limit``."""
+
+    matched = 0
+    step = 64
+    while matched < limit:
+        size = min(step, limit - matched)
+        if a[a_end - matched - size : a_end - matched] == b[b_end - matched - size : b_end - matched]:
+            matched += size
+            step *= 2
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return matched
+
+
+def encode(base: bytes, target: bytes, max_size: Optional[int] = None) -> Optional[bytes]:
+    """Return the (uncompressed) operations rebuilding ``target`` from ``base``.
+
+    Returns ``None`` as soon as the operations grow past ``max_size``.
+    """
+
+    index: dict[bytes, int] = {}
+    for anchor in _anchors(base):
+        if anchor + ANCHOR_LENGTH <= len(base):
+            index.setdefault(base[anchor : anchor + ANCHOR_LENGTH], anchor)
+
+    base_view, target_view = memoryview(base), memoryview(target)
+    operations = bytearray()
+    literal_start = position = 0
+    for anchor in _anchors(target):
+        if anchor < position or anchor + ANCHOR_LENGTH > len(target):
+            continue
+        base_offset = index.get(target[anchor : anchor + ANCHOR_LENGTH])
+        if base_offset is None:
+            continue
+
+        back = _common_suffix(target_view, anchor, base_view, base_offset, min(anchor - literal_start, base_offset))
+        forward = _common_prefix(
+            target_view,
+            anchor,
+            base_view,
+            base_offset,
+            min(len(target) - anchor, len(base) - base_offset),
+        )
+        start = anchor - back
+        if start > literal_start:
+            operations += INSERT.pack(b"I", start - literal_start)
+            operations += target_view[literal_start:start]
+        operations += COPY.pack(b"C", base_offset - back, back + forward)
+        position = literal_start = anchor + forward
+        if max_size is not None and len(operations) > max_size:
+            return None
+
+    if literal_start < len(target):
+        operations += INSERT.pack(b"I", len(target) - literal_start)
+        operations += target_view[literal_start:]
+    if max_size is not None and len(operations) > max_size:
+        return None
+    return bytes(operations)
+
+
+def decode(base: bytes, operations: bytes) -> bytes:
+    output = bytearray()
+    offset = 0
+    while offset < len(operations):
+        kind = operations[offset : offset + 1]
+        if kind == b"C":
+            _, base_offset, length = COPY.unpack_from(operations, offset)
+            offset += COPY.size
+            if base_offset + length > len(base):
+                raise ValueError("Delta copies past the end of its base.")
+            output += base[base_offset : base_offset + length]
+        elif kind == b"I":
+            _, length = INSERT.unpack_from(operations, offset)
+            offset += INSERT.size
+            output += operations[offset : offset + length]
+            offset += length
+        else:
+            raise ValueError("Corrupt delta operation.")
+    return bytes(output)
+
+
+def pack_delta(base_digest: str, target_size: int, operations: bytes) -> bytes:
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, bytes.fromhex(base_digest), target_size)
+    return header + zlib.compress(operations, 6)
+
+
+def read_delta_header(data: bytes) -> tuple[str, int]:
+    """Return ``(base digest, reconstructed size)`` from the start of a delta blob."""
+
+    magic, version, base_digest, size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Not a delta blob.")
+    return base_digest.hex(), size
+
+
+def unpack_delta(data: bytes, base: bytes) -> bytes:
+    _, size = read_delta_header(data)
+    content = decode(base, zlib.decompress(data[HEADER.size :]))
+    if len(content) != size:
+        raise ValueError("Delta produced the wrong size.")
+    return content
+
+
+class ReconstructionCache:
+    """Thread-safe LRU of reconstructed blob contents, bounded in bytes.
+
+    The bound defaults to ``FILES_DELTA_CACHE_SIZE``. Blobs are immutable,
+    so entries never go stale.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self._max_bytes = max_bytes
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return int(getattr(settings, "FILES_DELTA_CACHE_SIZE", 64 * 1024 * 1024))
+
+    def get(self, digest_hex: str) -> Optional[bytes]:
+        with self.lock:
+            content = self.entries.get(digest_hex)
+            if content is not None:
+                self.entries.move_to_end(digest_hex)
+            return content
+
+    def put(self, digest_hex: str, content: bytes) -> None:
+        max_bytes = self.max_bytes
+        if len(content) > max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(digest_hex, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[digest_hex] = content
+            self.size += len(content)
+            while self.size > max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+reconstruction_cache = ReconstructionCache()
+
+
+__all__ = [
+    "DELTA_SUFFIX",
+    "DeltaPolicy",
+    "ReconstructionCache",
+    "decode",
+    "encode",
+    "pack_delta",
+    "read_delta_header",
+    "reconstruction_cache",
+    "unpack_delta",
+]
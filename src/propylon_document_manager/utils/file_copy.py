@@ -0,0 +1,188 @@
+"""Copy files with the cheapest mechanism the filesystems involved support.
+
+``copy_file`` tries each strategy named in ``FILES_COPY_STRATEGIES`` in
+order and falls through on "not supported here" errors:
+
+``reflink``
+    ``FICLONE`` ioctl: the copy shares extents with the source (XFS, Btrfs).
+``hardlink``
+    ``os.link``. Only used for sources with no write permission bits, since
+    an in-place edit of either name would change both files.
+``copy_file_range``
+    In-kernel copy, offloaded to the server on NFS 4.2 and SMB.
+``sendfile``
+    In-kernel copy for older kernels.
+``copy``
+    Plain read/write through user space; always works.
+"""
+
+from __future__ import annotations
+
+import errno
+import logging
+import os
+import shutil
+import sys
+import uuid
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("reflink", "hardlink", "copy_file_range", "sendfile", "copy")
+DEFAULT_STRATEGIES = ("reflink", "copy_file_range", "sendfile", "copy")
+COPY_CHUNK_SIZE = 1024 * 1024
+# _IOW(0x94, 9, int) from linux/fs.h.
+FICLONE = 0x40049409
+
+# Strategies that share the source's data instead of copying it.
+SHARING_STRATEGIES = ("reflink", "hardlink")
+
+# Errors meaning "this strategy does not apply to these files", as opposed to
+# real failures such as permission or descriptor errors, which are raised.
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS}
+
+# First strategy that worked for each (source device, destination device).
+_preferred: dict[tuple[int, int], str] = {}
+
+
+def copy_strategies() -> tuple[str, ...]:
+    """Return the configured strategy chain, validated."""
+
+    configured = tuple(getattr(settings, "FILES_COPY_STRATEGIES", DEFAULT_STRATEGIES))
+    unknown = [name for name in configured if name not in STRATEGIES]
+    if unknown:
+        raise ValueError(f"Unknown copy strategies: {', '.join(unknown)}")
+    return configured
+
+
+def _reflink(source_fd: int, destination_fd: int) -> None:
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOTSUP, "FICLONE is Linux only")
+    import fcntl
+
+    fcntl.ioctl(destination_fd, FICLONE, source_fd)
+
+
+def _copy_file_range(source_fd: int, destination_fd: int) -> None:
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    while os.copy_file_range(source_fd, destination_fd, COPY_CHUNK_SIZE * 64):
+        pass
+
+
+def _sendfile(source_fd: int, destination_fd: int) -> None:
+    offset = 0
+    while True:
+        sent = os.sendfile(destination_fd, source_fd, offset, COPY_CHUNK_SIZE * 64)
+        if not sent:
+            break
+        offset += sent
+
+
+def _copy(source_fd: int, destination_fd: int) -> None:
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        read = os.readv(source_fd, [buffer])
+        if not read:
+            break
+        written = 0
+        while written < read:
+            written += os.write(destination_fd, view[written:read])
+
+
+FD_STRATEGIES = {
+    "reflink": _reflink,
+    "copy_file_range": _copy_file_range,
+    "sendfile": _sendfile,
+    "copy": _copy,
+}
+
+
+def _hardlink(source: Path, destination: Path, source_stat: os.stat_result) -> bool:
+    if source_stat.st_mode & 0o222:
+        return False
+    # Link under a temporary name and rename over ``destination``, which may exist.
+    temp_name = destination.parent / f".link-{uuid.uuid4().hex}"
+    try:
+        os.link(source, temp_name)
+    except OSError as exc:
+        # link(2) also reports a filesystem without hard links, or a source
+        # protected by fs.protected_hardlinks, as EPERM.
+        if exc.errno in UNSUPPORTED_ERRNOS or exc.errno in (errno.EMLINK, errno.EPERM):
+            return False
+        raise
+    os.replace(temp_name, destination)
+    return True
+
+
+def copy_file(
+    source: Union[str, Path],
+    destination: Union[str, Path],
+    strategies: Optional[Sequence[str]] = None,
+    copy_metadata: bool = False,
+) -> Optional[str]:
+    """Copy ``source`` to ``destination`` and return the name of the strategy used.
+
+    ``strategies`` defaults to ``FILES_COPY_STRATEGIES``. Returns ``None``,
+    leaving ``destination`` empty, when none of them applies (only possible
+    without ``copy``). With ``copy_metadata`` the permission bits and
+    timestamps are copied too, like ``shutil.copy2``.
+    """
+
+    chain = copy_strategies() if strategies is None else tuple(strategies)
+    source, destination = Path(source), Path(destination)
+    source_stat = os.stat(source)
+    device_pair = (source_stat.st_dev, os.stat(destination.parent).st_dev)
+    preferred = _preferred.get(device_pair)
+    if preferred in chain:
+        # Skip the strategies already known not to work for these devices;
+        # whether a hardlink applies depends on each source, so keep it.
+        start = chain.index(preferred)
+        chain = tuple(name for index, name in enumerate(chain) if index >= start or name == "hardlink")
+
+    used = None
+    source_fd = destination_fd = -1
+    try:
+        for name in chain:
+            if name == "hardlink":
+                if _hardlink(source, destination, source_stat):
+                    used = name
+                    break
+                continue
+
+            if source_fd < 0:
+                source_fd = os.open(source, os.O_RDONLY)
+                destination_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                FD_STRATEGIES[name](source_fd, destination_fd)
+            except OSError as exc:
+                if exc.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                os.ftruncate(destination_fd, 0)
+                os.lseek(source_fd, 0, os.SEEK_SET)
+                os.lseek(destination_fd, 0, os.SEEK_SET)
+                continue
+            used = name
+            break
+    finally:
+        if source_fd >= 0:
+            os.close(source_fd)
+        if destination_fd >= 0:
+            os.close(destination_fd)
+
+    if used is None:
+        return None
+    if used != "hardlink" and _preferred.get(device_pair) != used:
+        _preferred[device_pair] = used
+        logger.info("Copying files from device %s to device %s with %s", *device_pair, used)
+    logger.debug("Copied %s to %s with %s", source, destination, used)
+    if copy_metadata and used != "hardlink":
+        shutil.copystat(source, destination)
+    return used
+
+
+__all__ = ["SHARING_STRATEGIES", "copy_file", "copy_strategies"]
@@ -9,12 +9,23 @@ from typing import TYPE_CHECKING, Any, Mapping, Optional, Union
 from django.conf import settings
 from django.db.models import Max
 
+from .blob_store import INGEST_CHUNK_SIZE, is_encoded, locate_blob, open_blob
+from .file_copy import copy_file
+from .metadata_cache import blob_scope, file_scope, metadata_cache, user_scope, version_scope
+
 if TYPE_CHECKING:
+    from django.db.models import QuerySet
+
     from propylon_document_manager.file_versions.models import User
 
 
 class FileDownload:
-    """Fetch metadata for stored file versions."""
+    """Fetch metadata for stored file versions.
+
+    Version rows, by file and version, by id and by digest, latest
+    pointers and the first rows of each user's list are read through
+    ``metadata_cache``.
+    """
 
     def __init__(
         self,
@@ -34,57 +45,92 @@ class FileDownload:
             self.version = None
         self.user = user
 
-    def get_files_of_user(self, user: Optional["User"] = None) -> list[int]:
-        """Return IDs of file versions owned by the provided or configured user."""
+    def user_files(self, user: Optional["User"] = None) -> "QuerySet[Any]":
+        """Return an unevaluated queryset of the versions available to the user.
 
-        from propylon_document_manager.file_versions.models import UserFileVersion
+        It is a single join on the user's ``UserFileVersion`` rows, which
+        are unique per version, so no list of ids passes through Python and
+        the database chooses how to read it.
+        """
+
+        from propylon_document_manager.file_versions.models import FileVersion
 
         target_user = user if user is not None else self.user
-        if target_user is None or not getattr(target_user, "is_authenticated", False):
-            return []
+        if target_user is None or not getattr(target_user, "is_authenticated", False) or target_user.pk is None:
+            versions = FileVersion.objects.none()
+        else:
+            versions = FileVersion.objects.filter(userfileversion__user_id=target_user.pk)
+        return versions.values("id", "file_name", "version_number").order_by("file_name", "version_number", "id")
 
-        if getattr(target_user, "pk", None) is None:
-            return []
+    def first_user_files(self, limit: int, user: Optional["User"] = None) -> list[Mapping[str, Any]]:
+        """Return the first ``limit`` records of ``user_files``, cached per user.
+
+        ``UserFileVersion`` writes and renames of shared versions bump the
+        user's scope; bulk writes of ``UserFileVersion`` rows must do so
+        themselves.
+        """
 
-        return list(
-            UserFileVersion.objects.filter(user=target_user)
-            .values_list("fileversion_id", flat=True)
-            .distinct()
+        target_user = user if user is not None else self.user
+        if target_user is None or not getattr(target_user, "is_authenticated", False) or target_user.pk is None:
+            return []
+        return metadata_cache.get_or_set(
+            user_scope(target_user.pk), f"first:{limit}", lambda: list(self.user_files(target_user)[:limit])
         )
 
+    @staticmethod
+    def file_list_entry(record: Mapping[str, Any]) -> dict[str, Any]:
+        """Return the public representation of a ``user_files`` record."""
+
+        return {"file_name": record["file_name"], "version": record["version_number"]}
+
     def file_list(self, user: Optional["User"] = None) -> list[dict[str, Any]]:
         """Return metadata for all file versions available to the current user."""
 
-        from propylon_document_manager.file_versions.models import FileVersion
-
-        file_version_ids = self.get_files_of_user(user=user)
-        if not file_version_ids:
+        target_user = user if user is not None else self.user
+        user_id = getattr(target_user, "pk", None)
+        if user_id is None or not getattr(target_user, "is_authenticated", False):
             return []
+        return [self.file_list_entry(record) for record in self.user_files(user=target_user)]
 
-        records = (
-            FileVersion.objects.filter(id__in=file_version_ids)
-            .values("file_name", "version_number")
-            .order_by("file_name", "version_number")
-        )
+    @staticmethod
+    def all_files() -> "QuerySet[Any]":
+        """Return an unevaluated queryset of metadata for every stored file version."""
+
+        from propylon_document_manager.file_versions.models import FileVersion
 
-        return [
-            {"file_name": record["file_name"], "version": record["version_number"]}
-            for record in records
-        ]
+        return (
+            FileVersion.objects.all()
+            .values("id", "file_name", "version_number", "digest_hex")
+            .order_by("file_name", "version_number", "id")
+        )
 
     @staticmethod
     def get_all_files() -> list[Mapping[str, Any]]:
         """Return metadata for every stored file version."""
 
+        return list(FileDownload.all_files())
+
+    @staticmethod
+    def get_version(version_id: int) -> Optional[Mapping[str, Any]]:
+        """Return the row of the version with ``version_id``, or ``None``."""
+
         from propylon_document_manager.file_versions.models import FileVersion
 
-        records = (
-            FileVersion.objects.all()
-            .values("id", "file_name", "version_number", "digest_hex")
-            .order_by("file_name", "version_number", "id")
+        return metadata_cache.get_or_set(
+            version_scope(version_id), "row", lambda: FileVersion.objects.values().filter(pk=version_id).first()
         )
 
-        return list(records)
+    @staticmethod
+    def get_blob_name(digest_hex: str) -> Optional[str]:
+        """Return the name of a version stored as ``digest_hex``, or ``None``."""
+
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        return metadata_cache.get_or_set(
+            blob_scope(digest_hex),
+            "name",
+            lambda: FileVersion.objects.filter(digest_hex=digest_hex).values_list("file_name", flat=True).first(),
+        )
 
     def get_file_data(self) -> Mapping[str, Any]:
         """Return metadata for the configured file path and version."""
@@ -98,36 +144,44 @@ class FileDownload:
 
         target_path = self.filepath if filepath is None else str(filepath)
         result = (
-            FileVersion.objects.filter(file_name=target_path)
-            .aggregate(max_version=Max("version_number"))
-            .get("max_version")
+            FileVersion.objects.filter(head__file_name=target_path).values_list("version_number", flat=True).first()
         )
-
         if result is None:
-            raise FileVersion.DoesNotExist(
-                f"No versions found for file: {target_path}"
+            # Rows created outside ``create_next_version`` have no head yet.
+            result = (
+                FileVersion.objects.filter(file_name=target_path)
+                .aggregate(max_version=Max("version_number"))
+                .get("max_version")
             )
 
+        if result is None:
+            raise FileVersion.DoesNotExist(f"No versions found for file: {target_path}")
+
         return int(result)
 
-    def _get_file_data(
-        self, filepath: Union[str, Path], version: Optional[int]
-    ) -> Mapping[str, Any]:
+    def _get_file_data(self, filepath: Union[str, Path], version: Optional[int]) -> Mapping[str, Any]:
         """Return the database row for the requested file version."""
 
-        from propylon_document_manager.file_versions.models import FileVersion
-
         target_path = str(filepath)
-        resolved_version = (
-            self._get_latest_version(target_path)
-            if version is None
-            else int(version)
+        return metadata_cache.get_or_set(
+            file_scope(target_path),
+            "latest" if version is None else f"version:{int(version)}",
+            lambda: self._load_file_data(target_path, version),
         )
 
+    def _load_file_data(self, target_path: str, version: Optional[int]) -> Mapping[str, Any]:
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        if version is None:
+            # Latest-version lookups go through the head pointer in one query.
+            latest = FileVersion.objects.values().filter(head__file_name=target_path).first()
+            if latest is not None:
+                return latest
+
+        resolved_version = self._get_latest_version(target_path) if version is None else int(version)
+
         try:
-            return FileVersion.objects.values().get(
-                file_name=target_path, version_number=resolved_version
-            )
+            return FileVersion.objects.values().get(file_name=target_path, version_number=resolved_version)
         except FileVersion.DoesNotExist as exc:
             raise FileVersion.DoesNotExist(
                 f"No file version found for {target_path} with version {resolved_version}."
@@ -150,17 +204,19 @@ class FileDownload:
         if not digest_hex:
             return "That file does not exist on the server"
 
-        storage_directory = Path(settings.FILES_ROOT)
-        source_path = storage_directory / digest_hex
-
-        if not source_path.exists() or not source_path.is_file():
+        source_path = locate_blob(digest_hex, settings.FILES_ROOT)
+        if source_path is None:
             return "That file does not exist on the server"
 
         destination_path = Path(self.filepath)
         destination_path.parent.mkdir(parents=True, exist_ok=True)
 
         try:
-            shutil.copy2(source_path, destination_path)
+            if is_encoded(source_path):
+                with open_blob(source_path) as source, destination_path.open("wb") as destination:
+                    shutil.copyfileobj(source, destination, INGEST_CHUNK_SIZE)
+            else:
+                copy_file(source_path, destination_path, copy_metadata=True)
         except OSError as exc:
             return f"Error downloading {destination_path}: {exc}"
 
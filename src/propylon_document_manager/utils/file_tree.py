@@ -0,0 +1,38 @@
+"""Walking directory trees for bulk ingestion."""
+
+import os
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+
+def walk_files(
+    root: Union[str, Path], skip: Optional[Union[str, Path]] = None
+) -> Iterator[tuple[str, os.stat_result]]:
+    """Yield ``(path, stat)`` for every regular file below ``root``.
+
+    Symlinks are not followed and the ``skip`` directory (the blob store,
+    should it live inside the tree) is not entered. Entries that vanish
+    while the tree is walked are left out.
+    """
+
+    skip_path = Path(skip) if skip is not None else None
+    pending = [Path(root)]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if Path(entry.path) != skip_path:
+                        pending.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+
+__all__ = ["walk_files"]
@@ -3,16 +3,96 @@
 from __future__ import annotations
 
 import hashlib
-import shutil
+import logging
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Sequence, Union
 
 from django.conf import settings
 from django.db.models import Max
 
+from .blob_store import (
+    INGEST_CHUNK_SIZE,
+    BlobWriter,
+    deltify,
+    ingest_file,
+    is_valid_digest,
+    locate_blob,
+    prepare_blob,
+    store_blob,
+)
+from .chunking import ChunkingPolicy
+from .compression import CompressionPolicy
+from .delta import DeltaPolicy
+from .file_copy import copy_strategies
+
+if TYPE_CHECKING:
+    from propylon_document_manager.file_versions.models import FileVersion
+
+logger = logging.getLogger(__name__)
+
+# Id of the last version ``FileUpload.deltify_pending`` has handled, kept in FILES_ROOT.
+DELTA_CHECKPOINT_NAME = ".delta-checkpoint"
+DELTA_BATCH_SIZE = 100
+
+
+def spool_file(
+    filepath: str,
+    storage_directory: str,
+    strategies: Sequence[str],
+    policy: CompressionPolicy,
+    chunking: ChunkingPolicy,
+) -> tuple[str, str, str]:
+    """Copy one file into the store and return its digest, spooled path and
+    blob suffix (see ``prepare_blob``).
+
+    Runs in worker processes for ``FileUpload.upload_many``, so it takes and
+    returns only plain, picklable values and never touches the database or
+    settings.
+    """
+
+    writer = ingest_file(filepath, storage_directory, strategies=strategies)
+    digest_hex = writer.close()
+    try:
+        path, suffix = prepare_blob(writer.temp_path, policy, chunking, storage_directory)
+    except OSError:
+        writer.discard()
+        raise
+    return digest_hex, str(path), suffix
+
+
+def in_import_roots(filepath: Union[str, Path]) -> bool:
+    """Return whether ``filepath`` lies below one of ``FILES_IMPORT_ROOTS``.
+
+    The path is resolved first, so neither ``..`` nor a symlink can lead
+    out of a root.
+    """
+
+    path = Path(filepath).resolve()
+    return any(path.is_relative_to(Path(root).resolve()) for root in settings.FILES_IMPORT_ROOTS)
+
+
+class InlineExecutor(Executor):
+    """Run batch work in the calling process (used for ``workers=0``)."""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+# The executor shared by requests in this process, with its worker count.
+_shared_executor: Optional[tuple[Optional[int], Executor]] = None
+_shared_executor_lock = threading.Lock()
+
 
 class FileUpload:
-    """Read a file and calculate its SHA-256 digest."""
+    """Read a file, calculate its SHA-256 digest and store it by digest."""
 
     def __init__(self, filepath: Union[str, Path]):
         if not filepath:
@@ -24,12 +104,20 @@ class FileUpload:
         if not self.filepath.is_file():
             raise ValueError(f"The path does not point to a file: {self.filepath}")
 
-        self.digest_hex = self._calculate_digest()
+        self._digest_hex: Optional[str] = None
+
+    @property
+    def digest_hex(self) -> str:
+        """Return the SHA-256 digest of the file, hashing it on first access."""
+
+        if self._digest_hex is None:
+            self._digest_hex = self._calculate_digest()
+        return self._digest_hex
 
     def _calculate_digest(self) -> str:
         hasher = hashlib.sha256()
         with self.filepath.open("rb") as file_obj:
-            for chunk in iter(lambda: file_obj.read(8192), b""):
+            for chunk in iter(lambda: file_obj.read(INGEST_CHUNK_SIZE), b""):
                 hasher.update(chunk)
         return hasher.hexdigest()
 
@@ -44,7 +132,10 @@ class FileUpload:
         return FileVersion.objects.filter(digest_hex=self.digest_hex).exists()
 
     def get_latest_version(self) -> int:
-        """Return the next version number for the current file."""
+        """Return the next version number for the current file.
+
+        This is only a preview; ``upload`` allocates the number atomically.
+        """
 
         from propylon_document_manager.file_versions.models import FileVersion
 
@@ -59,34 +150,294 @@ class FileUpload:
 
         return latest_version + 1
 
-    def upload(self) -> str:
-        """Store the uploaded file and create its database record."""
+    @staticmethod
+    def finalize(writer: BlobWriter, file_name: str) -> Optional["FileVersion"]:
+        """Commit a spooled blob and record it as the next version of ``file_name``.
+
+        Returns ``None`` (and discards the spooled copy) when the content is
+        already stored. ``OSError`` from moving the blob into place is left
+        to the caller.
+        """
 
         from propylon_document_manager.file_versions.models import FileVersion
 
-        if self.check_duplicate():
-            return "File already exists."
+        digest_hex = writer.close()
+        if FileVersion.objects.filter(digest_hex=digest_hex).exists() or locate_blob(
+            digest_hex, writer.storage_directory
+        ):
+            writer.discard()
+            return None
+
+        if not writer.store():
+            return None
+
+        return FileVersion.objects.create_next_version(file_name=file_name, digest_hex=digest_hex)
+
+    @staticmethod
+    def deltify_previous(file_version: "FileVersion", policy: Optional[DeltaPolicy] = None) -> bool:
+        """Store the version before ``file_version`` as a delta against it.
+
+        Reads of the newest version therefore stay full speed. Does nothing
+        unless ``FILES_DELTA`` is on, and keyframe versions stay full so
+        chains stay short. Storage errors are logged rather than raised,
+        since the new version is already safely stored. Called by
+        ``deltify_pending``, never during an upload.
+        """
+
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        policy = DeltaPolicy.from_settings() if policy is None else policy
+        previous = file_version.version_number - 1
+        if not policy.enabled or previous < 0 or policy.is_keyframe(previous):
+            return False
+
+        previous_digest = (
+            FileVersion.objects.filter(file_name=file_version.file_name, version_number=previous)
+            .values_list("digest_hex", flat=True)
+            .first()
+        )
+        if not is_valid_digest(previous_digest) or previous_digest == file_version.digest_hex:
+            return False
+
+        try:
+            return deltify(previous_digest, file_version.digest_hex, policy)
+        except (OSError, ValueError) as exc:
+            logger.warning("Could not store %s as a delta: %s", previous_digest, exc)
+            return False
+
+    @staticmethod
+    def delta_checkpoint_path() -> Path:
+        return Path(settings.FILES_ROOT) / DELTA_CHECKPOINT_NAME
+
+    @staticmethod
+    def delta_checkpoint() -> int:
+        """Return the id of the last version ``deltify_pending`` handled, or 0."""
+
+        try:
+            return int(FileUpload.delta_checkpoint_path().read_text().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @staticmethod
+    def _save_delta_checkpoint(version_id: int) -> None:
+        path = FileUpload.delta_checkpoint_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(DELTA_CHECKPOINT_NAME + ".tmp")
+        temp_path.write_text(str(version_id))
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def deltify_pending(
+        policy: Optional[DeltaPolicy] = None, limit: Optional[int] = None, restart: bool = False
+    ) -> tuple[int, int]:
+        """Run ``deltify_previous`` for the versions created since the last call.
+
+        Uploads only record new versions; this does the delta work out of
+        band. Progress is saved to a checkpoint in ``FILES_ROOT`` after every
+        batch, so each version is handled once. ``restart`` goes back over
+        every version. Returns how many versions were checked and how many
+        deltas were stored.
+        """
+
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        policy = DeltaPolicy.from_settings() if policy is None else policy
+        last_id = 0 if restart else FileUpload.delta_checkpoint()
+        checked = stored = 0
+        while limit is None or checked < limit:
+            size = DELTA_BATCH_SIZE if limit is None else min(DELTA_BATCH_SIZE, limit - checked)
+            batch = list(FileVersion.objects.filter(pk__gt=last_id).order_by("pk")[:size])
+            if not batch:
+                break
+            for file_version in batch:
+                stored += FileUpload.deltify_previous(file_version, policy)
+            checked += len(batch)
+            last_id = batch[-1].pk
+            FileUpload._save_delta_checkpoint(last_id)
+        return checked, stored
+
+    @staticmethod
+    def stored_digests(digests: Iterable[str]) -> set[str]:
+        """Return which of ``digests`` are recorded and present in the store."""
+
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        candidates = {digest for digest in digests if is_valid_digest(digest)}
+        if not candidates:
+            return set()
+
+        recorded = (
+            FileVersion.objects.filter(digest_hex__in=candidates).values_list("digest_hex", flat=True).distinct()
+        )
+        return {digest for digest in recorded if locate_blob(digest) is not None}
+
+    @staticmethod
+    def create_by_reference(digest_hex: str, file_name: str) -> tuple[Optional["FileVersion"], bool]:
+        """Record already-stored content as the next version of ``file_name``.
+
+        No bytes are transferred or copied. Returns ``(version, created)``
+        like ``get_or_create``: ``(None, False)`` when the digest is not in
+        the store, and the existing latest version when it already has this
+        content.
+        """
+
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        if digest_hex not in FileUpload.stored_digests([digest_hex]):
+            return None, False
+
+        latest = FileVersion.objects.filter(head__file_name=file_name).first()
+        if latest is not None and latest.digest_hex == digest_hex:
+            return latest, False
+
+        file_version = FileVersion.objects.create_next_version(file_name=file_name, digest_hex=digest_hex)
+        return file_version, True
+
+    @staticmethod
+    def batch_executor(workers: Optional[int] = None) -> Executor:
+        """Return the executor ``upload_many`` hashes with: a process pool, or inline for ``0``."""
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        return ProcessPoolExecutor(max_workers=workers) if workers > 0 else InlineExecutor()
+
+    @classmethod
+    def shared_executor(cls) -> Executor:
+        """Return this process's executor of ``FILES_BATCH_UPLOAD_WORKERS`` workers, created on first use.
+
+        Concurrent batches queue for the same workers instead of each
+        starting a pool. It is replaced if the setting changes or a worker
+        died, and is never shut down by ``upload_many``.
+        """
+
+        global _shared_executor
+        workers = getattr(settings, "FILES_BATCH_UPLOAD_WORKERS", None)
+        with _shared_executor_lock:
+            if _shared_executor is not None:
+                current_workers, executor = _shared_executor
+                if current_workers == workers and not getattr(executor, "_broken", False):
+                    return executor
+                executor.shutdown(wait=False)
+            executor = cls.batch_executor(workers)
+            _shared_executor = (workers, executor)
+            return executor
+
+    @classmethod
+    def upload_many(
+        cls,
+        filepaths: Sequence[Union[str, Path]],
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ) -> list[dict[str, Any]]:
+        """Store many files and create all their versions in one transaction.
+
+        Files are hashed and spooled into the store by a process pool of
+        ``workers`` processes (``0`` runs inline), moved into place, and the
+        new ``FileVersion`` rows are written with one ``bulk_create``. A
+        caller uploading several batches can pass its own ``executor``, which
+        is left open. The result has one entry per path, in order, with the
+        same ``detail`` messages ``upload`` returns.
+        """
+
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        results: list[dict[str, Any]] = [{"filepath": str(filepath)} for filepath in filepaths]
+        uploads: dict[int, FileUpload] = {}
+        for index, filepath in enumerate(filepaths):
+            try:
+                uploads[index] = cls(filepath)
+            except (ValueError, OSError) as exc:
+                results[index].update(status="error", detail=str(exc))
 
         storage_directory = Path(settings.FILES_ROOT)
-        destination_path = storage_directory / self.digest_hex
+        storage_directory.mkdir(parents=True, exist_ok=True)
+        strategies = copy_strategies()
+        policy = CompressionPolicy.from_settings()
+        chunking = ChunkingPolicy.from_settings()
+        owns_executor = executor is None
+        if executor is None:
+            executor = cls.batch_executor(workers)
+
+        spooled: dict[int, tuple[str, str, str]] = {}
+        try:
+            futures = {
+                index: executor.submit(
+                    spool_file, str(upload.filepath), str(storage_directory), strategies, policy, chunking
+                )
+                for index, upload in uploads.items()
+            }
+            for index, future in futures.items():
+                try:
+                    spooled[index] = future.result()
+                except OSError as exc:
+                    results[index].update(status="error", detail=f"Error saving {uploads[index].filepath}: {exc}")
+        finally:
+            if owns_executor:
+                executor.shutdown()
+
+        recorded = set(
+            FileVersion.objects.filter(digest_hex__in={digest for digest, _, _ in spooled.values()})
+            .values_list("digest_hex", flat=True)
+            .distinct()
+        )
+        to_create: list[int] = []
+        for index, (digest_hex, temp_path, suffix) in spooled.items():
+            upload = uploads[index]
+            upload._digest_hex = digest_hex
+            results[index]["digest_hex"] = digest_hex
+            try:
+                stored = digest_hex not in recorded and store_blob(temp_path, digest_hex, storage_directory, suffix)
+            except OSError as exc:
+                results[index].update(status="error", detail=f"Error saving {upload.filepath}: {exc}")
+                continue
+
+            if not stored:
+                Path(temp_path).unlink(missing_ok=True)
+                results[index].update(status="exists", detail="File already exists.")
+                continue
+
+            # Later files in this batch with the same content are duplicates.
+            recorded.add(digest_hex)
+            to_create.append(index)
+
+        created = FileVersion.objects.bulk_create_versions(
+            [(str(uploads[index].filepath), {"digest_hex": uploads[index].digest_hex}) for index in to_create]
+        )
+        for index, file_version in zip(to_create, created):
+            results[index].update(
+                status="created",
+                detail=f"File {uploads[index].filepath} saved successfully",
+                id=file_version.pk,
+                version_number=file_version.version_number,
+            )
+
+        return results
 
-        if destination_path.exists():
+    def upload(self) -> str:
+        """Store the uploaded file and create its database record."""
+
+        # The digest is only known up front if a caller already asked for it;
+        # otherwise it is computed while the file is copied into the store.
+        if self._digest_hex is not None and self.check_duplicate():
             return "File already exists."
 
+        storage_directory = Path(settings.FILES_ROOT)
+
         try:
-            storage_directory.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(self.filepath, destination_path)
+            writer = ingest_file(self.filepath, storage_directory)
         except OSError as exc:
             return f"Error saving {self.filepath}: {exc}"
 
-        version_number = self.get_latest_version()
-        FileVersion.objects.create(
-            file_name=str(self.filepath),
-            version_number=version_number,
-            digest_hex=self.digest_hex,
-        )
+        self._digest_hex = writer.close()
+        try:
+            file_version = self.finalize(writer, str(self.filepath))
+        except OSError as exc:
+            return f"Error saving {self.filepath}: {exc}"
+
+        if file_version is None:
+            return "File already exists."
 
         return f"File {self.filepath} saved successfully"
 
 
-__all__ = ["FileUpload"]
+__all__ = ["FileUpload", "in_import_roots"]
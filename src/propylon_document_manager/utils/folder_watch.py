@@ -0,0 +1,177 @@
+"""Store files written into watched directories as new versions."""
+
+from __future__ import annotations
+
+import fnmatch
+import logging
+import os
+import time
+from pathlib import Path
+from stat import S_ISREG
+from typing import Iterable, Optional, Union
+
+from django.conf import settings
+
+from . import inotify
+from .file_tree import walk_files
+from .file_upload import FileUpload
+
+logger = logging.getLogger(__name__)
+
+# A file is queued once a writer closes it or it is renamed into a watched
+# directory; new and moved-in directories are watched and scanned.
+WATCH_MASK = (
+    inotify.IN_CLOSE_WRITE
+    | inotify.IN_MOVED_TO
+    | inotify.IN_MOVED_FROM
+    | inotify.IN_CREATE
+    | inotify.IN_ONLYDIR
+    | inotify.IN_DONT_FOLLOW
+)
+
+
+class FolderWatcher:
+    """Watch directory trees with inotify and upload the files written there.
+
+    Events are debounced per path: a file is stored once it has been quiet
+    for ``debounce`` seconds, so a burst of saves produces one version.
+    Files whose stat still matches ``FileStatCache`` are never rehashed.
+    """
+
+    def __init__(
+        self,
+        directories: Iterable[Union[str, Path]],
+        debounce: Optional[float] = None,
+        ignore: Optional[Iterable[str]] = None,
+    ):
+        self.roots = [Path(directory).resolve() for directory in directories]
+        self.debounce = settings.FILES_WATCH_DEBOUNCE if debounce is None else debounce
+        self.ignore = list(settings.FILES_WATCH_IGNORE if ignore is None else ignore)
+        self.storage_directory = Path(settings.FILES_ROOT).resolve()
+        self.inotify = inotify.Inotify()
+        self.watches: dict[int, Path] = {}
+        self.pending: dict[str, float] = {}
+
+    def close(self) -> None:
+        self.inotify.close()
+
+    def __enter__(self) -> "FolderWatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Watch every root and queue the files already in it.
+
+        Files left unchanged since the last run only cost a ``stat``.
+        """
+
+        for root in self.roots:
+            self.watch_tree(root)
+
+    def run(self, stop_after: Optional[float] = None) -> None:
+        """Process events until interrupted, or for ``stop_after`` seconds."""
+
+        self.start()
+        deadline = None if stop_after is None else time.monotonic() + stop_after
+        while deadline is None or time.monotonic() < deadline:
+            self.poll(timeout=1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic())))
+        self.flush(force=True)
+
+    def poll(self, timeout: Optional[float] = None) -> list[str]:
+        """Handle queued events and store the files that have settled."""
+
+        if self.pending:
+            wait = max(0.0, min(self.pending.values()) - time.monotonic())
+            timeout = wait if timeout is None else min(timeout, wait)
+        for event in self.inotify.read_events(timeout):
+            self.handle_event(event)
+        return self.flush()
+
+    def watch_tree(self, directory: Path) -> None:
+        """Watch ``directory`` and every directory below it, queuing their files."""
+
+        for current, subdirectories, _ in os.walk(directory):
+            current_path = Path(current)
+            if current_path == self.storage_directory:
+                subdirectories[:] = []
+                continue
+            try:
+                self.watches[self.inotify.add_watch(current_path, WATCH_MASK)] = current_path
+            except OSError as exc:
+                logger.warning("Cannot watch %s: %s", current_path, exc)
+        for path, _ in walk_files(directory, self.storage_directory):
+            self.queue(path)
+
+    def unwatch_tree(self, directory: Path) -> None:
+        for wd, path in list(self.watches.items()):
+            if path == directory or directory in path.parents:
+                self.inotify.remove_watch(wd)
+                del self.watches[wd]
+
+    def handle_event(self, event: inotify.InotifyEvent) -> None:
+        if event.mask & inotify.IN_Q_OVERFLOW:
+            logger.warning("inotify queue overflowed; rescanning watched directories")
+            for root in self.roots:
+                self.watch_tree(root)
+            return
+        if event.mask & inotify.IN_IGNORED:
+            self.watches.pop(event.wd, None)
+            return
+
+        directory = self.watches.get(event.wd)
+        if directory is None or not event.name:
+            return
+        path = directory / event.name
+
+        if event.mask & inotify.IN_ISDIR:
+            if event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                self.watch_tree(path)
+            elif event.mask & inotify.IN_MOVED_FROM:
+                self.unwatch_tree(path)
+        elif event.mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO):
+            self.queue(str(path))
+
+    def queue(self, path: str) -> None:
+        if any(fnmatch.fnmatch(os.path.basename(path), pattern) for pattern in self.ignore):
+            return
+        self.pending[path] = time.monotonic() + self.debounce
+
+    def flush(self, force: bool = False) -> list[str]:
+        """Upload the queued files that have been quiet long enough.
+
+        Returns the paths that were stored as new versions.
+        """
+
+        from propylon_document_manager.file_versions.models import FileStatCache
+
+        now = time.monotonic()
+        ready = [path for path, due in self.pending.items() if force or due <= now]
+        entries = []
+        for path in ready:
+            del self.pending[path]
+            try:
+                stat = os.stat(path, follow_symlinks=False)
+            except OSError:
+                continue
+            if S_ISREG(stat.st_mode):
+                entries.append((path, stat))
+
+        stored = []
+        for path, stat in FileStatCache.objects.changed(entries):
+            try:
+                upload = FileUpload(path)
+            except (ValueError, OSError):
+                continue
+            message = upload.upload()
+            logger.info("%s: %s", path, message)
+            if message.startswith("Error saving"):
+                continue
+            FileStatCache.objects.record([(path, stat, upload.digest_hex)])
+            if message.endswith("saved successfully"):
+                stored.append(path)
+        return stored
+
+
+__all__ = ["FolderWatcher"]
@@ -0,0 +1,398 @@
+"""Mark-and-sweep garbage collection for the file store.
+
+The mark phase streams every ``digest_hex`` from the database, in index
+order, into a ``DigestSet``, then adds the bases of live deltas, read into
+a ``DeltaBases`` of prefix pairs. Chunks are marked after the sweep from
+a second scan for the manifests that survived it. The sweep phase
+scans the store with a thread per shard directory and removes whatever
+was not marked, unless it changed within the grace period, which covers
+uploads whose blob is in place before their ``FileVersion`` row is.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+from django.conf import settings
+
+from .blob_store import HEADER_PEEK_SIZE, is_valid_digest, open_stored, parse_blob_name, repack_lock
+from .chunking import CHUNK_DIRECTORY, MANIFEST_SUFFIX, read_manifest
+from .delta import read_delta_header
+from .packs import PACK_DIRECTORY, pack_set, remove_pack, write_pack
+
+logger = logging.getLogger(__name__)
+
+# Digests are kept as their first 8 bytes. Two digests sharing a prefix
+# can only keep garbage alive, never delete a live blob.
+PREFIX_BYTES = 8
+SORT_RUN = 1 << 20
+RECHECK_BATCH = 1000
+
+
+def digest_prefix(digest_hex: str) -> int:
+    return int(digest_hex[: PREFIX_BYTES * 2], 16)
+
+
+class DigestSet:
+    """Compact, immutable set of digests: 8 bytes each in a sorted array."""
+
+    def __init__(self, prefixes: Optional[array] = None):
+        self._prefixes = prefixes if prefixes is not None else array("Q")
+
+    @classmethod
+    def from_sorted(cls, digests: Iterable[str]) -> "DigestSet":
+        """Build the set from digests that arrive in ascending order."""
+
+        prefixes = array("Q")
+        last = -1
+        ordered = True
+        for digest_hex in digests:
+            if not is_valid_digest(digest_hex):
+                continue
+            prefix = digest_prefix(digest_hex)
+            if prefix != last:
+                ordered = ordered and prefix > last
+                prefixes.append(prefix)
+                last = prefix
+        # A database collation may order differently; sorting again is safe.
+        return cls(prefixes) if ordered else cls.from_unsorted(prefixes)
+
+    @classmethod
+    def from_unsorted(cls, prefixes: array) -> "DigestSet":
+        """Build the set from an array of prefixes in any order.
+
+        The array is sorted in runs that are merged, so memory stays close
+        to the size of the array.
+        """
+
+        runs = [array("Q", sorted(prefixes[start : start + SORT_RUN])) for start in range(0, len(prefixes), SORT_RUN)]
+        return cls(cls._merge(*runs))
+
+    @staticmethod
+    def _merge(*runs: Iterable[int]) -> array:
+        merged = array("Q")
+        last = -1
+        for prefix in heapq.merge(*runs):
+            if prefix != last:
+                merged.append(prefix)
+                last = prefix
+        return merged
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+    def __contains__(self, digest_hex: str) -> bool:
+        return self.has_prefix(digest_prefix(digest_hex))
+
+    def has_prefix(self, prefix: int) -> bool:
+        index = bisect_left(self._prefixes, prefix)
+        return index < len(self._prefixes) and self._prefixes[index] == prefix
+
+    def union(self, digests: Iterable[str]) -> "DigestSet":
+        return self.union_prefixes(digest_prefix(digest_hex) for digest_hex in digests)
+
+    def union_prefixes(self, prefixes: Iterable[int]) -> "DigestSet":
+        extra = sorted(prefixes)
+        if not extra:
+            return self
+        return DigestSet(self._merge(self._prefixes, extra))
+
+
+class DeltaBases:
+    """Compact map from each delta to its base: two arrays of prefixes, sorted by delta."""
+
+    def __init__(self) -> None:
+        self._deltas = array("Q")
+        self._bases = array("Q")
+        self._sorted = True
+
+    def add(self, delta_hex: str, base_hex: str) -> None:
+        delta = digest_prefix(delta_hex)
+        self._sorted = self._sorted and (not self._deltas or self._deltas[-1] <= delta)
+        self._deltas.append(delta)
+        self._bases.append(digest_prefix(base_hex))
+
+    def _sort(self) -> None:
+        """Sort the pairs in runs that are merged, like ``DigestSet.from_unsorted``."""
+
+        runs = [
+            sorted(zip(self._deltas[start : start + SORT_RUN], self._bases[start : start + SORT_RUN]))
+            for start in range(0, len(self._deltas), SORT_RUN)
+        ]
+        deltas, bases = array("Q"), array("Q")
+        for delta, base in heapq.merge(*runs):
+            deltas.append(delta)
+            bases.append(base)
+        self._deltas, self._bases, self._sorted = deltas, bases, True
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    def base(self, prefix: int) -> Optional[int]:
+        """Return the base prefix of the delta with ``prefix``, if there is one."""
+
+        if not self._sorted:
+            self._sort()
+        index = bisect_left(self._deltas, prefix)
+        if index < len(self._deltas) and self._deltas[index] == prefix:
+            return self._bases[index]
+        return None
+
+    def bases_of(self, live: DigestSet) -> set[int]:
+        """Return the prefixes live deltas depend on, through whole chains, that ``live`` lacks."""
+
+        if not self._sorted:
+            self._sort()
+        extra: set[int] = set()
+        for delta in self._deltas:
+            if not live.has_prefix(delta):
+                continue
+            base = self.base(delta)
+            while base is not None and not live.has_prefix(base) and base not in extra:
+                extra.add(base)
+                base = self.base(base)
+        return extra
+
+
+class Report(NamedTuple):
+    live: int
+    blobs: int
+    blob_bytes: int
+    packed: int
+    packed_bytes: int
+    chunks: int
+    chunk_bytes: int
+    recent: int
+
+
+def _list_blobs(directory: str) -> list[tuple[str, str, str]]:
+    found = []
+    for current, subdirectories, file_names in os.walk(directory):
+        subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+        for file_name in file_names:
+            parsed = parse_blob_name(file_name)
+            if parsed is not None:
+                found.append((*parsed, os.path.join(current, file_name)))
+    return found
+
+
+def scan_blobs(root: Path, workers: int, chunks: bool = False) -> Iterator[tuple[str, str, str]]:
+    """Yield ``(digest, suffix, path)`` for the loose blobs (or chunks) under ``root``.
+
+    Each top-level shard directory is listed by its own thread.
+    """
+
+    base = root / CHUNK_DIRECTORY if chunks else root
+    if not base.is_dir():
+        return
+    directories = []
+    with os.scandir(base) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if chunks or entry.name not in (CHUNK_DIRECTORY, PACK_DIRECTORY):
+                    directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                parsed = parse_blob_name(entry.name)
+                if parsed is not None:
+                    yield (*parsed, entry.path)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for found in executor.map(_list_blobs, directories):
+            yield from found
+
+
+class GarbageCollector:
+    """Find, and unless ``dry_run`` remove, blobs no ``FileVersion`` needs."""
+
+    def __init__(
+        self,
+        storage_directory: Optional[Union[str, Path]] = None,
+        grace_period: Optional[float] = None,
+        workers: Optional[int] = None,
+        dry_run: bool = False,
+    ):
+        self.root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+        self.grace_period = settings.FILES_GC_GRACE_PERIOD if grace_period is None else grace_period
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.dry_run = dry_run
+        self.cutoff = time.time() - self.grace_period
+        self.removed_manifests: set[str] = set()
+
+    def recorded_digests(self) -> DigestSet:
+        from propylon_document_manager.file_versions.models import FileVersion
+
+        digests = (
+            FileVersion.objects.exclude(digest_hex__isnull=True)
+            .order_by("digest_hex")
+            .values_list("digest_hex", flat=True)
+            .distinct()
+            .iterator(chunk_size=10_000)
+        )
+        return DigestSet.from_sorted(digests)
+
+    def _packed(self) -> Iterator[tuple[str, str, str]]:
+        for pack in pack_set(self.root).refresh():
+            for entry in pack.entries():
+                yield entry.digest_hex, entry.suffix, str(pack.path / (entry.digest_hex + entry.suffix))
+
+    def _stored(self) -> Iterator[tuple[str, str, str]]:
+        return itertools.chain(scan_blobs(self.root, self.workers), self._packed())
+
+    def mark(self) -> DigestSet:
+        """Return the live blobs: the recorded ones and the bases their deltas need."""
+
+        live = self.recorded_digests()
+        # Deltas can be as many as the blobs, so their bases are kept as
+        # 16-byte prefix pairs rather than in a dict.
+        bases = DeltaBases()
+        for digest_hex, suffix, path in self._stored():
+            if suffix != ".d":
+                continue
+            try:
+                with open_stored(path) as file_obj:
+                    bases.add(digest_hex, read_delta_header(file_obj.read(HEADER_PEEK_SIZE))[0])
+            except (OSError, ValueError) as exc:
+                logger.warning("Cannot read delta %s: %s", path, exc)
+        return live.union_prefixes(bases.bases_of(live))
+
+    def mark_chunks(self) -> DigestSet:
+        """Return the chunks listed by the manifests the sweep kept.
+
+        The store is scanned again rather than remembering every manifest
+        from ``mark``, so memory does not grow with the number of manifests.
+        Chunks shared between manifests are collected once per run of up to
+        ``SORT_RUN`` distinct prefixes, and the sorted runs are merged.
+        """
+
+        runs: list[array] = []
+        pending: set[int] = set()
+        for digest_hex, suffix, path in self._stored():
+            if suffix != MANIFEST_SUFFIX or digest_hex in self.removed_manifests:
+                continue
+            try:
+                with open_stored(path) as file_obj:
+                    _, chunks = read_manifest(file_obj)
+            except (OSError, ValueError) as exc:
+                raise OSError(f"Cannot read manifest {path}; not collecting chunks: {exc}") from exc
+            pending.update(digest_prefix(chunk_digest) for chunk_digest, _ in chunks)
+            if len(pending) >= SORT_RUN:
+                runs.append(array("Q", sorted(pending)))
+                pending = set()
+        runs.append(array("Q", sorted(pending)))
+        return DigestSet(DigestSet._merge(*runs))
+
+    def _still_unrecorded(self, digests: list[str]) -> set[str]:
+        """Return which of ``digests`` still have no ``FileVersion``."""
+
+        from propylon_document_manager.file_versions.models import FileStatCache, FileVersion
+
+        recorded = set(FileVersion.objects.filter(digest_hex__in=digests).values_list("digest_hex", flat=True))
+        unrecorded = set(digests) - recorded
+        if unrecorded and not self.dry_run:
+            FileStatCache.objects.filter(digest_hex__in=unrecorded).delete()
+        return unrecorded
+
+    def _sweep_paths(self, candidates: Iterator[tuple[str, str]], check_database: bool) -> tuple[int, int, int]:
+        removed = removed_bytes = recent = 0
+        batch: list[tuple[str, str]] = []
+
+        def flush() -> None:
+            nonlocal removed, removed_bytes
+            unrecorded = self._still_unrecorded([digest for digest, _ in batch]) if check_database else None
+            for digest_hex, path in batch:
+                if unrecorded is not None and digest_hex not in unrecorded:
+                    continue
+                try:
+                    size = os.stat(path).st_size
+                    if not self.dry_run:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                removed_bytes += size
+                if path.endswith(MANIFEST_SUFFIX):
+                    self.removed_manifests.add(digest_hex)
+            batch.clear()
+
+        for digest_hex, path in candidates:
+            try:
+                if os.stat(path).st_mtime > self.cutoff:
+                    recent += 1
+                    continue
+            except FileNotFoundError:
+                continue
+            batch.append((digest_hex, path))
+            if len(batch) >= RECHECK_BATCH:
+                flush()
+        flush()
+        return removed, removed_bytes, recent
+
+    def _sweep_packs(self, live: DigestSet) -> tuple[int, int]:
+        removed = removed_bytes = 0
+        with repack_lock(self.root):
+            for pack in pack_set(self.root).refresh():
+                if pack.index_path.stat().st_mtime > self.cutoff:
+                    continue
+                dead = {entry.digest_hex: entry for entry in pack.entries() if entry.digest_hex not in live}
+                if not dead:
+                    continue
+                unrecorded = self._still_unrecorded(list(dead))
+                self.removed_manifests.update(
+                    digest for digest in unrecorded if dead[digest].suffix == MANIFEST_SUFFIX
+                )
+                removed += len(unrecorded)
+                removed_bytes += sum(dead[digest].length for digest in unrecorded)
+                if self.dry_run or not unrecorded:
+                    continue
+                write_pack(
+                    (
+                        (entry.digest_hex, entry.suffix, pack.read(entry))
+                        for entry in pack.entries()
+                        if entry.digest_hex not in unrecorded
+                    ),
+                    self.root,
+                )
+                remove_pack(pack)
+        return removed, removed_bytes
+
+    def collect(self) -> Report:
+        live = self.mark()
+        blobs, blob_bytes, recent_blobs = self._sweep_paths(
+            ((digest, path) for digest, _, path in scan_blobs(self.root, self.workers) if digest not in live),
+            check_database=True,
+        )
+        packed, packed_bytes = self._sweep_packs(live)
+        # Chunks are marked from the manifests that survived the sweep, so a
+        # manifest kept by the grace period or the recheck keeps its chunks.
+        live_chunks = self.mark_chunks()
+        chunks, chunk_bytes, recent_chunks = self._sweep_paths(
+            (
+                (digest, path)
+                for digest, suffix, path in scan_blobs(self.root, self.workers, chunks=True)
+                if not suffix and digest not in live_chunks
+            ),
+            check_database=False,
+        )
+        return Report(
+            live=len(live),
+            blobs=blobs,
+            blob_bytes=blob_bytes,
+            packed=packed,
+            packed_bytes=packed_bytes,
+            chunks=chunks,
+            chunk_bytes=chunk_bytes,
+            recent=recent_blobs + recent_chunks,
+        )
+
+
+__all__ = ["DeltaBases", "DigestSet", "GarbageCollector", "Report", "scan_blobs"]
@@ -0,0 +1,187 @@
+"""Read-through cache for file version metadata, on Django's default cache.
+
+Entries live in scopes: one per file name (its versions and latest
+pointer), one per version id, one per blob digest and one per user. Of
+a user's file list only the first page is cached, the one every client
+loads; deeper pages are read with a keyset condition and are not cached.
+
+Each scope has a generation number that is part of every key in it, so
+invalidating a scope is a single ``incr``; entries of the old generation
+are never read again and simply expire. Generations are bumped
+once the writing transaction commits, so a reader cannot put back data it
+read before the commit under the new generation.
+
+A miss takes a short lock in the cache before computing the value, and
+concurrent readers of the same key wait for it instead of all querying
+the database at once. Hits, misses and waits are counted per process and
+added to shared counters in the cache every few seconds.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+T = TypeVar("T")
+
+KEY_PREFIX = "fvmeta"
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.02
+METRICS = ("hits", "misses", "waits")
+METRICS_FLUSH_INTERVAL = 5.0
+
+_missing = object()
+
+
+def file_scope(file_name: str) -> str:
+    return "file:" + hashlib.sha1(file_name.encode("utf-8")).hexdigest()
+
+
+def user_scope(user_id: Any) -> str:
+    return f"user:{user_id}"
+
+
+def version_scope(version_id: Any) -> str:
+    return f"version:{version_id}"
+
+
+def blob_scope(digest_hex: str) -> str:
+    return f"blob:{digest_hex}"
+
+
+class MetadataCache:
+    """Generation-scoped read-through cache with stampede protection."""
+
+    def __init__(self, timeout: Optional[int] = None):
+        self._timeout = timeout
+        self._counts: Counter = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> int:
+        if self._timeout is not None:
+            return self._timeout
+        return int(getattr(settings, "FILES_METADATA_CACHE_TIMEOUT", 300))
+
+    def _generation(self, scope: str) -> int:
+        key = f"{KEY_PREFIX}:gen:{scope}"
+        generation = cache.get(key)
+        if generation is None:
+            # A random start keeps an evicted counter from coming back at a
+            # generation whose entries are still cached.
+            cache.add(key, random.getrandbits(48), None)
+            generation = cache.get(key)
+        return generation
+
+    def get_or_set(self, scope: str, name: str, compute: Callable[[], T]) -> T:
+        """Return the cached value of ``name`` in ``scope``, computing it on a miss."""
+
+        if self.timeout <= 0:
+            return compute()
+        key = f"{KEY_PREFIX}:{scope}:{self._generation(scope)}:{name}"
+        value = cache.get(key, _missing)
+        if value is not _missing:
+            self._count("hits")
+            return value
+
+        lock_key = key + ":lock"
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(WAIT_INTERVAL)
+                value = cache.get(key, _missing)
+                if value is not _missing:
+                    self._count("waits")
+                    return value
+                if cache.get(lock_key) is None:
+                    break
+        self._count("misses")
+        try:
+            value = compute()
+            cache.set(key, value, self.timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    def invalidate(self, scopes: Iterable[str]) -> None:
+        """Drop every entry of ``scopes`` once the current transaction commits."""
+
+        scopes = set(scopes)
+        if scopes:
+            transaction.on_commit(lambda: self._bump(scopes))
+
+    def _bump(self, scopes: set[str]) -> None:
+        for scope in scopes:
+            key = f"{KEY_PREFIX}:gen:{scope}"
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, random.getrandbits(48), None)
+
+    def invalidate_files(self, file_names: Iterable[str]) -> None:
+        self.invalidate(file_scope(file_name) for file_name in file_names)
+
+    def invalidate_users(self, user_ids: Iterable[Any]) -> None:
+        self.invalidate(user_scope(user_id) for user_id in user_ids)
+
+    def invalidate_versions(self, version_ids: Iterable[Any], digests: Iterable[Optional[str]] = ()) -> None:
+        self.invalidate(
+            [
+                *(version_scope(version_id) for version_id in version_ids),
+                *(blob_scope(digest_hex) for digest_hex in digests if digest_hex),
+            ]
+        )
+
+    def _count(self, metric: str) -> None:
+        with self._lock:
+            self._counts[metric] += 1
+            due = time.monotonic() - self._flushed_at >= METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush_metrics()
+
+    def flush_metrics(self) -> None:
+        """Add this process's counts to the shared counters."""
+
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = time.monotonic()
+        for metric, count in counts.items():
+            key = f"{KEY_PREFIX}:metrics:{metric}"
+            if not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    cache.set(key, count, None)
+
+    def metrics(self) -> dict[str, int]:
+        """Return the shared hit, miss and wait counters, this process's included."""
+
+        self.flush_metrics()
+        return {metric: int(cache.get(f"{KEY_PREFIX}:metrics:{metric}") or 0) for metric in METRICS}
+
+    def reset_metrics(self) -> None:
+        with self._lock:
+            self._counts.clear()
+        cache.delete_many([f"{KEY_PREFIX}:metrics:{metric}" for metric in METRICS])
+
+
+metadata_cache = MetadataCache()
+
+
+__all__ = [
+    "MetadataCache",
+    "blob_scope",
+    "file_scope",
+    "metadata_cache",
+    "user_scope",
+    "version_scope",
+]
@@ -0,0 +1,315 @@
+"""Packfiles: many small blobs stored in one file.
+
+A pack is written once, by ``repack_blobs``, and never modified. It is a
+pair of files under ``FILES_ROOT/packs/``:
+
+``pack-<id>.pack``
+    A header, then each blob's stored bytes (raw, compressed, delta or
+    manifest), each preceded by a record naming its digest, so the index
+    can be rebuilt from the pack alone.
+``pack-<id>.idx``
+    A header, a 256-entry fan-out table and the entries sorted by digest,
+    so a lookup is a binary search over one fan-out bucket.
+
+Both are read through ``mmap``. ``locate_blob`` returns a packed blob as
+the virtual path ``packs/pack-<id>.pack/<digest><suffix>``, which
+``blob_store.open_blob`` and friends resolve through the index.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+from django.conf import settings
+
+PACK_DIRECTORY = "packs"
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".idx"
+LOCK_NAME = ".pack.lock"
+PACK_HEADER = struct.Struct(">4sB")
+PACK_MAGIC = b"PDMP"
+RECORD = struct.Struct(">32sBI")
+INDEX_HEADER = struct.Struct(">4sBI")
+INDEX_MAGIC = b"PDMI"
+FANOUT = struct.Struct(">256I")
+INDEX_ENTRY = struct.Struct(">32sQIB")
+FORMAT_VERSION = 1
+
+# Stored form of each entry, as the suffix its loose file would have.
+SUFFIXES = ("", ".z", ".d", ".m")
+
+
+class PackPolicy(NamedTuple):
+    """Which loose blobs ``repack_blobs`` moves into packs."""
+
+    max_blob_size: int = 64 * 1024
+    max_pack_size: int = 1024 * 1024 * 1024
+    min_age: float = 3600.0
+
+    @classmethod
+    def from_settings(cls) -> "PackPolicy":
+        return cls(
+            max_blob_size=int(getattr(settings, "FILES_PACK_MAX_BLOB_SIZE", 64 * 1024)),
+            max_pack_size=int(getattr(settings, "FILES_PACK_MAX_SIZE", 1024 * 1024 * 1024)),
+            min_age=float(getattr(settings, "FILES_PACK_MIN_AGE", 3600.0)),
+        )
+
+
+class PackEntry(NamedTuple):
+    digest_hex: str
+    offset: int
+    length: int
+    suffix: str
+
+
+def is_packed(path: Union[str, Path]) -> bool:
+    """Return whether ``path`` is the virtual path of a packed blob."""
+
+    return Path(path).parent.suffix == PACK_SUFFIX
+
+
+class Pack:
+    """A read-only pack and its index, both memory-mapped."""
+
+    def __init__(self, index_path: Union[str, Path]):
+        self.index_path = Path(index_path)
+        self.path = self.index_path.with_suffix(PACK_SUFFIX)
+        with open(self.index_path, "rb") as index_file:
+            self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = INDEX_HEADER.unpack_from(self._index)
+        if magic != INDEX_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not a pack index: {self.index_path}")
+        if len(self._index) < INDEX_HEADER.size + FANOUT.size + self.count * INDEX_ENTRY.size:
+            raise ValueError(f"Pack index is truncated: {self.index_path}")
+        self._fanout = FANOUT.unpack_from(self._index, INDEX_HEADER.size)
+        self._data: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _entry(self, position: int) -> PackEntry:
+        digest, offset, length, kind = INDEX_ENTRY.unpack_from(
+            self._index, INDEX_HEADER.size + FANOUT.size + position * INDEX_ENTRY.size
+        )
+        return PackEntry(digest.hex(), offset, length, SUFFIXES[kind])
+
+    def find(self, digest_hex: str) -> Optional[PackEntry]:
+        digest = bytes.fromhex(digest_hex)
+        low = self._fanout[digest[0] - 1] if digest[0] else 0
+        high = self._fanout[digest[0]]
+        base = INDEX_HEADER.size + FANOUT.size
+        while low < high:
+            middle = (low + high) // 2
+            start = base + middle * INDEX_ENTRY.size
+            candidate = self._index[start : start + 32]
+            if candidate < digest:
+                low = middle + 1
+            elif candidate > digest:
+                high = middle
+            else:
+                return self._entry(middle)
+        return None
+
+    def entries(self) -> Iterator[PackEntry]:
+        for position in range(self.count):
+            yield self._entry(position)
+
+    def read(self, entry: PackEntry) -> bytes:
+        """Return the stored bytes of ``entry``."""
+
+        with self._lock:
+            if self._data is None:
+                with open(self.path, "rb") as pack_file:
+                    self._data = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if entry.offset + entry.length > len(self._data):
+            raise OSError(f"Pack is truncated: {self.path}")
+        return self._data[entry.offset : entry.offset + entry.length]
+
+
+class PackSet:
+    """The packs in one storage directory, reloaded when the directory changes.
+
+    Packs removed by a consolidation stay readable through their existing
+    maps until every reader is done with them.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.packs: list[Pack] = []
+        self._mtime_ns: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> list[Pack]:
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        # Two changes within one timestamp tick leave the mtime unchanged,
+        # so a directory modified in the last couple of seconds is rescanned.
+        recent = mtime_ns is not None and time.time_ns() - mtime_ns < 2_000_000_000
+        with self._lock:
+            if mtime_ns != self._mtime_ns or recent:
+                known = {pack.index_path: pack for pack in self.packs}
+                packs = []
+                if mtime_ns is not None:
+                    for index_path in sorted(self.directory.glob(f"*{INDEX_SUFFIX}")):
+                        pack = known.get(index_path)
+                        if pack is None:
+                            try:
+                                pack = Pack(index_path)
+                            except (OSError, ValueError):
+                                continue
+                        packs.append(pack)
+                self.packs = packs
+                self._mtime_ns = mtime_ns
+            return self.packs
+
+    def find(self, digest_hex: str) -> Optional[tuple[Pack, PackEntry]]:
+        for pack in self.refresh():
+            entry = pack.find(digest_hex)
+            if entry is not None:
+                return pack, entry
+        return None
+
+
+_pack_sets: dict[Path, PackSet] = {}
+_pack_sets_lock = threading.Lock()
+
+
+def pack_directory(storage_directory: Optional[Union[str, Path]] = None) -> Path:
+    root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+    return root / PACK_DIRECTORY
+
+
+def pack_set(storage_directory: Optional[Union[str, Path]] = None) -> PackSet:
+    """Return the shared ``PackSet`` for a storage directory."""
+
+    directory = pack_directory(storage_directory).resolve()
+    with _pack_sets_lock:
+        packs = _pack_sets.get(directory)
+        if packs is None:
+            packs = _pack_sets[directory] = PackSet(directory)
+        return packs
+
+
+def packed_path(pack: Pack, entry: PackEntry) -> Path:
+    return pack.path / (entry.digest_hex + entry.suffix)
+
+
+def read_packed(path: Union[str, Path]) -> bytes:
+    """Return the stored bytes behind the virtual path of a packed blob."""
+
+    path = Path(path)
+    packs = pack_set(path.parent.parent.parent)
+    digest_hex = path.name[:64]
+    for pack in packs.refresh():
+        if pack.path == path.parent:
+            entry = pack.find(digest_hex)
+            if entry is not None:
+                return pack.read(entry)
+    # The pack was consolidated away since the path was located.
+    found = packs.find(digest_hex)
+    if found is None:
+        raise FileNotFoundError(f"Packed blob not found: {path}")
+    return found[0].read(found[1])
+
+
+def write_pack(
+    items: Iterable[tuple[str, str, Union[bytes, Path]]],
+    storage_directory: Optional[Union[str, Path]] = None,
+) -> Optional[Path]:
+    """Write a new pack of ``(digest, suffix, stored bytes or file)`` items.
+
+    The pack and its index are flushed to disk before the index appears
+    under its final name, so callers may delete the loose copies once this
+    returns. Returns the index path, or ``None`` when ``items`` is empty.
+    """
+
+    directory = pack_directory(storage_directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    entries: list[tuple[bytes, int, int, int]] = []
+    file_descriptor, pack_temp = tempfile.mkstemp(prefix=".pack-", dir=directory)
+    index_temp = None
+    try:
+        with os.fdopen(file_descriptor, "wb") as pack_file:
+            pack_file.write(PACK_HEADER.pack(PACK_MAGIC, FORMAT_VERSION))
+            offset = PACK_HEADER.size
+            seen = set()
+            for digest_hex, suffix, source in items:
+                if digest_hex in seen:
+                    continue
+                seen.add(digest_hex)
+                data = source if isinstance(source, bytes) else Path(source).read_bytes()
+                digest = bytes.fromhex(digest_hex)
+                kind = SUFFIXES.index(suffix)
+                pack_file.write(RECORD.pack(digest, kind, len(data)))
+                pack_file.write(data)
+                offset += RECORD.size
+                entries.append((digest, offset, len(data), kind))
+                offset += len(data)
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+        if not entries:
+            Path(pack_temp).unlink()
+            return None
+
+        entries.sort()
+        fanout = [0] * 256
+        for digest, *_ in entries:
+            fanout[digest[0]] += 1
+        for index in range(1, 256):
+            fanout[index] += fanout[index - 1]
+
+        file_descriptor, index_temp = tempfile.mkstemp(prefix=".pack-", dir=directory)
+        with os.fdopen(file_descriptor, "wb") as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, FORMAT_VERSION, len(entries)))
+            index_file.write(FANOUT.pack(*fanout))
+            for entry in entries:
+                index_file.write(INDEX_ENTRY.pack(*entry))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+        name = f"pack-{uuid.uuid4().hex}"
+        index_path = directory / (name + INDEX_SUFFIX)
+        os.replace(pack_temp, directory / (name + PACK_SUFFIX))
+        os.replace(index_temp, index_path)
+        directory_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+        return index_path
+    except BaseException:
+        Path(pack_temp).unlink(missing_ok=True)
+        if index_temp is not None:
+            Path(index_temp).unlink(missing_ok=True)
+        raise
+
+
+def remove_pack(pack: Pack) -> None:
+    """Delete a pack; the index goes first so no new reader finds it."""
+
+    pack.index_path.unlink(missing_ok=True)
+    pack.path.unlink(missing_ok=True)
+
+
+__all__ = [
+    "PACK_DIRECTORY",
+    "Pack",
+    "PackEntry",
+    "PackPolicy",
+    "PackSet",
+    "is_packed",
+    "pack_directory",
+    "pack_set",
+    "packed_path",
+    "read_packed",
+    "remove_pack",
+    "write_pack",
+]
@@ -0,0 +1,260 @@
+"""Integrity scrubbing: re-hash stored blobs to catch bit rot.
+
+Every recorded digest is read back through ``open_blob``, so compressed,
+delta, chunked and packed blobs are checked against the content they
+decode to, and hashed again. Deltas are rebuilt from disk, bypassing
+``reconstruction_cache``. Reads are shared out to a thread pool and
+throttled by a ``RateLimiter``, charged for the stored bytes read
+(including a delta's whole base chain), so a scrub does not starve
+requests of disk bandwidth. Digests are visited in order and the last one finished
+is saved to a checkpoint file after every batch, so an interrupted pass
+resumes where it stopped.
+
+A blob whose content no longer matches its digest is moved to
+``FILES_ROOT/.quarantine/`` so it is no longer served: for a chunked
+blob, the chunks that do not match their own digest; a delta is left in
+place when its base is the corrupt one, and packed blobs are only
+reported. Every outcome is recorded as a ``BlobVerification`` row.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+from django.conf import settings
+
+from .blob_store import (
+    HEADER_PEEK_SIZE,
+    MAX_DELTA_DEPTH,
+    blob_size,
+    chunk_path,
+    is_delta,
+    is_valid_digest,
+    locate_blob,
+    open_blob,
+    open_stored,
+    read_blob,
+    stored_size,
+)
+from .chunking import is_manifest, read_manifest
+from .delta import read_delta_header
+from .packs import is_packed
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+BATCH_SIZE = 100
+CHECKPOINT_NAME = ".scrub-checkpoint"
+QUARANTINE_DIRECTORY = ".quarantine"
+
+
+class RateLimiter:
+    """Token bucket shared by threads, in bytes per second; ``None`` is unlimited."""
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate if rate and rate > 0 else None
+        self.burst = burst if burst is not None else (self.rate or 0)
+        self._allowance = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        """Account for ``amount`` bytes, sleeping until the rate allows them."""
+
+        if self.rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.burst, self._allowance + (now - self._last) * self.rate)
+            self._last = now
+            self._allowance -= amount
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class ScrubResult(NamedTuple):
+    digest_hex: str
+    status: str
+    detail: str = ""
+
+
+class Scrubber:
+    """Re-hash the recorded blobs of one store; see the module docstring."""
+
+    def __init__(
+        self,
+        storage_directory: Optional[Union[str, Path]] = None,
+        rate: Optional[float] = None,
+        workers: Optional[int] = None,
+        quarantine: bool = True,
+    ):
+        """``rate`` is in bytes per second and defaults to ``FILES_SCRUB_RATE`` MB/s."""
+
+        self.root = Path(settings.FILES_ROOT if storage_directory is None else storage_directory)
+        if rate is None:
+            rate = settings.FILES_SCRUB_RATE * 1024 * 1024
+        self.limiter = RateLimiter(rate)
+        self.workers = max(1, workers or settings.FILES_SCRUB_WORKERS)
+        self.quarantine = quarantine
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.root / CHECKPOINT_NAME
+
+    def checkpoint(self) -> Optional[str]:
+        """Return the last digest of the interrupted pass, if there is one."""
+
+        try:
+            digest_hex = self.checkpoint_path.read_text().strip()
+        except FileNotFoundError:
+            return None
+        return digest_hex if is_valid_digest(digest_hex) else None
+
+    def _save_checkpoint(self, digest_hex: str) -> None:
+        temp_path = self.checkpoint_path.with_name(CHECKPOINT_NAME + ".tmp")
+        temp_path.write_text(digest_hex)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _hash(self, file_obj, scale: float = 1.0) -> str:
+        """Hash ``file_obj``, charging ``scale`` stored bytes per byte of content."""
+
+        hasher = hashlib.sha256()
+        for block in iter(lambda: file_obj.read(READ_SIZE), b""):
+            self.limiter.consume(round(len(block) * scale))
+            hasher.update(block)
+        return hasher.hexdigest()
+
+    def _stored_bytes(self, path: Path) -> int:
+        """Return how many stored bytes reading ``path`` takes, through its delta chain."""
+
+        total = 0
+        for _ in range(MAX_DELTA_DEPTH + 1):
+            total += stored_size(path)
+            if is_manifest(path):
+                # Chunks are stored as they are.
+                return total + blob_size(path)
+            if not is_delta(path):
+                return total
+            with open_stored(path) as file_obj:
+                base_digest = read_delta_header(file_obj.read(HEADER_PEEK_SIZE))[0]
+            base_path = locate_blob(base_digest, self.root)
+            if base_path is None:
+                return total
+            path = base_path
+        return total
+
+    def verify(self, digest_hex: str) -> ScrubResult:
+        """Re-hash one blob, quarantining it when it does not match."""
+
+        path = locate_blob(digest_hex, self.root)
+        if path is None:
+            return ScrubResult(digest_hex, "missing")
+        try:
+            size = blob_size(path)
+            scale = self._stored_bytes(path) / size if size else 0.0
+            with open_blob(path, self.root, cached=False) as file_obj:
+                actual = self._hash(file_obj, scale)
+        except FileNotFoundError as exc:
+            return ScrubResult(digest_hex, "missing", str(exc))
+        except Exception as exc:  # corrupt encodings raise zlib, lzma and delta errors alike
+            return ScrubResult(digest_hex, "unreadable", f"{path}: {exc}")
+        if actual == digest_hex:
+            return ScrubResult(digest_hex, "ok")
+
+        detail = f"{path} hashes to {actual}"
+        if self.quarantine:
+            moved = self._quarantine(path)
+            detail += "; quarantined " + ", ".join(moved) if moved else "; not quarantined"
+        logger.error("Blob %s is corrupt: %s", digest_hex, detail)
+        return ScrubResult(digest_hex, "mismatch", detail)
+
+    def _quarantine(self, path: Path) -> list[str]:
+        """Move the corrupt files behind ``path`` aside and return their names."""
+
+        targets = [] if is_packed(path) else [path]
+        if is_delta(path):
+            with open_stored(path) as file_obj:
+                base_digest = read_delta_header(file_obj.read(HEADER_PEEK_SIZE))[0]
+            # The delta is intact when its base is what is corrupt.
+            try:
+                if hashlib.sha256(read_blob(base_digest, self.root, cached=False)).hexdigest() != base_digest:
+                    return []
+            except Exception:
+                return []
+        elif is_manifest(path):
+            with open_stored(path) as file_obj:
+                _, chunks = read_manifest(file_obj)
+            bad_chunks = []
+            for chunk_digest, _ in dict.fromkeys(chunks):
+                candidate = chunk_path(chunk_digest, self.root)
+                try:
+                    with open(candidate, "rb") as chunk_file:
+                        if self._hash(chunk_file) != chunk_digest:
+                            bad_chunks.append(candidate)
+                except FileNotFoundError:
+                    continue
+            # A manifest that lists the right chunks is not itself at fault.
+            targets = bad_chunks or targets
+
+        directory = self.root / QUARANTINE_DIRECTORY
+        directory.mkdir(parents=True, exist_ok=True)
+        moved = []
+        for target in targets:
+            destination = directory / f"{target.name}.{time.time_ns()}"
+            try:
+                os.replace(target, destination)
+            except FileNotFoundError:
+                continue
+            moved.append(str(destination))
+        return moved
+
+    def run(self, restart: bool = False, limit: Optional[int] = None) -> Counter:
+        """Scrub the recorded blobs from the checkpoint on; return a count per status.
+
+        With ``limit``, stop after that many blobs and leave the checkpoint
+        for the next run. A completed pass removes the checkpoint.
+        """
+
+        from propylon_document_manager.file_versions.models import BlobVerification, FileVersion
+
+        start = None if restart else self.checkpoint()
+        digests = FileVersion.objects.exclude(digest_hex__isnull=True).exclude(digest_hex="")
+        if start is not None:
+            digests = digests.filter(digest_hex__gt=start)
+        digests = digests.order_by("digest_hex").values_list("digest_hex", flat=True).distinct()
+        if limit is not None:
+            digests = digests[:limit]
+
+        counts: Counter = Counter()
+        batch: list[str] = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            def flush() -> None:
+                results = list(executor.map(self.verify, batch))
+                BlobVerification.objects.record(results)
+                counts.update(result.status for result in results)
+                self._save_checkpoint(batch[-1])
+                batch.clear()
+
+            for digest_hex in digests.iterator(chunk_size=BATCH_SIZE * 10):
+                batch.append(digest_hex)
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+            if batch:
+                flush()
+
+        if limit is None or sum(counts.values()) < limit:
+            self.checkpoint_path.unlink(missing_ok=True)
+        return counts
+
+
+__all__ = ["RateLimiter", "ScrubResult", "Scrubber"]
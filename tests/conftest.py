@@ -1,12 +1,26 @@
+from pathlib import Path
+
 import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
 
 from propylon_document_manager.file_versions.models import User
+from propylon_document_manager.utils.delta import reconstruction_cache
+
 from .factories import UserFactory
 
+
 @pytest.fixture(autouse=True)
 def enable_db_access_for_all_tests(db):
     pass
 
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Database changes roll back between tests; cached metadata must too.
+    cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
@@ -28,3 +42,19 @@ def user_factory(db):
         return UserFactory(**kwargs)
 
     return factory
+
+
+@pytest.fixture
+def client(user) -> APIClient:
+    api_client = APIClient()
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def storage(tmp_path: Path, settings) -> Path:
+    """Point ``FILES_ROOT`` at an empty directory, with nothing reconstructed from an earlier one."""
+
+    settings.FILES_ROOT = tmp_path / "storage"
+    reconstruction_cache.clear()
+    return Path(settings.FILES_ROOT)
@@ -1,10 +1,14 @@
 from collections.abc import Sequence
-from typing import Any
+from typing import Any, Optional
 
 from django.contrib.auth import get_user_model
 from factory import Faker, post_generation
 from factory.django import DjangoModelFactory
 
+from propylon_document_manager.utils import BlobWriter
+from propylon_document_manager.utils.chunking import ChunkingPolicy
+from propylon_document_manager.utils.compression import CompressionPolicy
+
 
 class UserFactory(DjangoModelFactory):
     email = Faker("email")
@@ -29,3 +33,12 @@ class UserFactory(DjangoModelFactory):
     class Meta:
         model = get_user_model()
         django_get_or_create = ["email"]
+
+
+def store_content(content: bytes, codec: Optional[str] = None, chunking: Optional[ChunkingPolicy] = None) -> str:
+    """Store ``content`` under ``FILES_ROOT``, compressed with ``codec``, and return its digest."""
+
+    writer = BlobWriter()
+    writer.write(content)
+    writer.store(CompressionPolicy(codec), chunking=chunking)
+    return writer.digest_hex
@@ -0,0 +1,59 @@
+"""A minimal stand-in for the front proxy used with ``FILES_OFFLOAD``.
+
+It wraps a WSGI application the way nginx wraps an upstream: when the
+application answers with ``X-Accel-Redirect`` or ``X-Sendfile`` the body is
+discarded and the named file is sent instead, keeping the upstream's
+remaining headers.
+"""
+
+from pathlib import Path
+from urllib.parse import unquote
+from wsgiref.util import FileWrapper
+
+OFFLOAD_HEADERS = ("x-accel-redirect", "x-sendfile")
+
+
+class OffloadProxy:
+    def __init__(self, app, files_root: Path, internal_prefix: str = "/protected-files/"):
+        self.app = app
+        self.files_root = Path(files_root)
+        self.internal_prefix = internal_prefix
+        self.upstream_bytes = 0
+
+    def __call__(self, environ, start_response):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured["status"] = status
+            captured["headers"] = headers
+            return lambda data: None
+
+        upstream = self.app(environ, capture)
+        try:
+            upstream_body = b"".join(upstream)
+        finally:
+            if hasattr(upstream, "close"):
+                upstream.close()
+        self.upstream_bytes = len(upstream_body)
+
+        headers = captured["headers"]
+        offload = {name.lower(): value for name, value in headers if name.lower() in OFFLOAD_HEADERS}
+        if not offload:
+            start_response(captured["status"], headers)
+            return [upstream_body]
+
+        if "x-accel-redirect" in offload:
+            location = unquote(offload["x-accel-redirect"])
+            assert location.startswith(self.internal_prefix), location
+            path = self.files_root / location[len(self.internal_prefix) :]
+        else:
+            path = Path(offload["x-sendfile"])
+
+        kept = [
+            (name, value)
+            for name, value in headers
+            if name.lower() not in OFFLOAD_HEADERS and name.lower() != "content-length"
+        ]
+        kept.append(("Content-Length", str(path.stat().st_size)))
+        start_response("200 OK", kept)
+        return FileWrapper(path.open("rb"))
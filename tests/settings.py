@@ -15,6 +15,13 @@ SECRET_KEY = env(
 # https://docs.djangoproject.com/en/dev/ref/settings/#test-runner
 TEST_RUNNER = "django.test.runner.DiscoverRunner"
 
+# DATABASES
+# ------------------------------------------------------------------------------
+# A file-backed test database lets concurrent writers wait on SQLite's lock
+# instead of failing, as they do with the shared in-memory database.
+DATABASES["default"]["TEST"] = {"NAME": "test_propylon_document_manager.sqlite"}  # noqa: F405
+DATABASES["default"]["OPTIONS"] = {"timeout": 30}  # noqa: F405
+
 # PASSWORDS
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#password-hashers
@@ -1,7 +1,14 @@
+from datetime import timedelta
+
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
+from propylon_document_manager.accounts.authentication import USER_FIELDS, CachedTokenAuthentication, TokenCache
+
 User = get_user_model()
 
 
@@ -33,3 +40,110 @@ def test_user_can_login(user_factory):
     )
     assert response.status_code == 200
     assert "token" in response.json()
+
+
+def token_client(token: Token) -> APIClient:
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+@pytest.mark.django_db
+def test_token_lookup_is_cached(user, django_assert_num_queries):
+    client = token_client(Token.objects.create(user=user))
+
+    with django_assert_num_queries(2):
+        assert client.get("/api/accounts/me/").status_code == 200
+    with django_assert_num_queries(0):
+        assert client.get("/api/accounts/me/").json()["email"] == user.email
+
+
+@pytest.mark.django_db
+def test_logout_revokes_cached_token(user):
+    client = token_client(Token.objects.create(user=user))
+    assert client.get("/api/accounts/me/").status_code == 200
+
+    assert client.post("/api/accounts/logout/").status_code == 204
+    assert client.get("/api/accounts/me/").status_code in (401, 403)
+
+
+@pytest.mark.django_db
+def test_revocation_is_per_user(user_factory, django_assert_num_queries, django_capture_on_commit_callbacks):
+    revoked, kept = Token.objects.create(user=user_factory()), Token.objects.create(user=user_factory())
+    revoked_client, kept_client = token_client(revoked), token_client(kept)
+    assert revoked_client.get("/api/accounts/me/").status_code == 200
+    assert kept_client.get("/api/accounts/me/").status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        revoked.delete()
+
+    assert revoked_client.get("/api/accounts/me/").status_code in (401, 403)
+    with django_assert_num_queries(0):
+        assert kept_client.get("/api/accounts/me/").status_code == 200
+
+
+@pytest.mark.django_db
+def test_other_processes_recheck_revocations(user):
+    token = Token.objects.create(user=user)
+    fields = {"created": token.created, "user": {"id": user.pk}}
+    writer, reader = TokenCache(), TokenCache()
+    writer.put(token.key, TokenCache.stamp(user.pk), fields)
+    assert reader.get(token.key) == fields
+
+    writer.revoke(user.pk)
+
+    assert reader.get(token.key) is None
+    assert writer.get(token.key) is None
+
+
+@pytest.mark.django_db
+def test_cached_token_leaves_out_the_password(user, django_assert_num_queries):
+    token = Token.objects.create(user=user)
+    assert token_client(token).get("/api/accounts/me/").status_code == 200
+
+    stamp, fields = cache.get(TokenCache.cache_key(token.key))
+    assert set(fields["user"]) == set(USER_FIELDS)
+    cached_user, _ = CachedTokenAuthentication().authenticate_credentials(token.key)
+    # The password hash is deferred and only loaded when it is needed.
+    with django_assert_num_queries(1):
+        assert cached_user.check_password("not the password") is False
+
+
+@pytest.mark.django_db
+def test_password_change_revokes_cached_token(user):
+    client = token_client(Token.objects.create(user=user))
+    assert client.get("/api/accounts/me/").status_code == 200
+
+    user.set_password("AnotherPass456!")
+    user.save()
+
+    assert client.get("/api/accounts/me/").status_code in (401, 403)
+    assert not Token.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_expired_token_is_rejected(user, settings):
+    settings.AUTH_TOKEN_TTL = 60
+    token = Token.objects.create(user=user)
+    Token.objects.filter(pk=token.pk).update(created=timezone.now() - timedelta(seconds=61))
+
+    response = token_client(token).get("/api/accounts/me/")
+
+    assert response.status_code in (401, 403)
+    assert response.json()["detail"] == "Token has expired."
+
+
+@pytest.mark.django_db
+def test_login_rotates_old_token(user_factory, settings):
+    settings.AUTH_TOKEN_ROTATE_AFTER = 60
+    user = user_factory(password="StrongPass123!")
+    old = Token.objects.create(user=user)
+    credentials = {"email": user.email, "password": "StrongPass123!"}
+
+    assert APIClient().post("/api/accounts/login/", credentials, format="json").json()["token"] == old.key
+    Token.objects.filter(pk=old.pk).update(created=timezone.now() - timedelta(seconds=61))
+    response = APIClient().post("/api/accounts/login/", credentials, format="json")
+
+    assert response.json()["token"] != old.key
+    assert "expires_at" in response.json()
+    assert token_client(old).get("/api/accounts/me/").status_code in (401, 403)
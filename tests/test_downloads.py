@@ -0,0 +1,357 @@
+import hashlib
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+from django.core.signals import request_finished, request_started
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.api.downloads import blob_response, parse_range_header
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.utils import BlobWriter, blob_path, locate_blob
+from propylon_document_manager.utils.blob_store import deltify, repack
+from propylon_document_manager.utils.chunking import ChunkingPolicy
+from propylon_document_manager.utils.compression import CompressionPolicy
+from propylon_document_manager.utils.delta import DeltaPolicy
+from propylon_document_manager.utils.packs import PackPolicy, is_packed
+
+from .proxy import OffloadProxy
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        (None, None),
+        ("bytes=0-9", [(0, 9)]),
+        ("bytes=1000-", [(1000, 1023)]),
+        ("bytes=-24", [(1000, 1023)]),
+        ("bytes=0-5000", [(0, 1023)]),
+        ("bytes=0-9, 5-19, 100-109", [(0, 19), (100, 109)]),
+        ("bytes=2000-3000", []),
+        ("bytes=-0", []),
+        ("bytes=9-0", None),
+        ("items=0-9", None),
+        ("bytes=abc", None),
+    ],
+)
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, len(CONTENT)) == expected
+
+
+def test_parse_range_header_ignores_too_many_ranges():
+    header = "bytes=" + ",".join(f"{offset}-{offset}" for offset in range(0, 200, 2))
+
+    assert parse_range_header(header, len(CONTENT)) is None
+
+
+@pytest.fixture
+def stored_version(storage):
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    path = blob_path(digest)
+    path.parent.mkdir(parents=True)
+    path.write_bytes(CONTENT)
+    return FileVersion.objects.create(file_name="data.bin", version_number=0, digest_hex=digest)
+
+
+def test_download_advertises_range_support(client, stored_version):
+    response = client.get(f"/api/file_versions/{stored_version.id}/download/")
+
+    assert response.status_code == 200
+    assert response["Accept-Ranges"] == "bytes"
+    assert b"".join(response.streaming_content) == CONTENT
+
+
+def test_download_single_range(client, stored_version):
+    response = client.get(f"/api/file_versions/{stored_version.id}/download/", HTTP_RANGE="bytes=10-19")
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 10-19/{len(CONTENT)}"
+    assert response["Content-Length"] == "10"
+    assert b"".join(response.streaming_content) == CONTENT[10:20]
+
+
+def test_download_suffix_range(client, stored_version):
+    response = client.get(f"/api/file_versions/{stored_version.id}/download/", HTTP_RANGE="bytes=-4")
+
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == CONTENT[-4:]
+
+
+def test_download_multiple_ranges(client, stored_version):
+    response = client.get(f"/api/file_versions/{stored_version.id}/download/", HTTP_RANGE="bytes=0-3,100-103")
+
+    assert response.status_code == 206
+    content_type = response["Content-Type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=")[1]
+
+    body = b"".join(response.streaming_content)
+    assert int(response["Content-Length"]) == len(body)
+    parts = body.split(f"--{boundary}".encode())
+    assert parts[-1] == b"--\r\n"
+    assert f"Content-Range: bytes 0-3/{len(CONTENT)}".encode() in parts[1]
+    assert parts[1].endswith(b"\r\n\r\n" + CONTENT[0:4] + b"\r\n")
+    assert parts[2].endswith(b"\r\n\r\n" + CONTENT[100:104] + b"\r\n")
+
+
+def test_download_unsatisfiable_range(client, stored_version):
+    response = client.get(f"/api/file_versions/{stored_version.id}/download/", HTTP_RANGE="bytes=5000-")
+
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_download_sends_digest_etag(client, stored_version):
+    response = client.get(f"/api/file_versions/{stored_version.id}/download/")
+
+    assert response["ETag"] == f'"{stored_version.digest_hex}"'
+
+
+def test_download_honours_if_none_match(client, stored_version):
+    response = client.get(
+        f"/api/file_versions/{stored_version.id}/download/",
+        HTTP_IF_NONE_MATCH=f'"other", W/"{stored_version.digest_hex}"',
+    )
+
+    assert response.status_code == 304
+    assert response["ETag"] == f'"{stored_version.digest_hex}"'
+
+
+def test_download_ignores_range_when_if_range_is_stale(client, stored_version):
+    response = client.get(
+        f"/api/file_versions/{stored_version.id}/download/",
+        HTTP_RANGE="bytes=0-9",
+        HTTP_IF_RANGE='"stale"',
+    )
+
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == CONTENT
+
+
+def test_blob_endpoint_serves_immutable_content(client, stored_version, settings):
+    response = client.get(f"/api/blobs/{stored_version.digest_hex}/")
+
+    assert response.status_code == 200
+    assert response["Cache-Control"] == settings.FILES_BLOB_CACHE_CONTROL
+    assert "immutable" in response["Cache-Control"]
+    assert response["ETag"] == f'"{stored_version.digest_hex}"'
+    assert 'filename="data.bin"' in response["Content-Disposition"]
+    assert b"".join(response.streaming_content) == CONTENT
+
+
+def test_blob_endpoint_returns_304_without_touching_storage(client, stored_version, django_assert_num_queries):
+    blob_path(stored_version.digest_hex).unlink()
+
+    with django_assert_num_queries(0):
+        response = client.get(
+            f"/api/blobs/{stored_version.digest_hex}/",
+            HTTP_IF_NONE_MATCH=f'"{stored_version.digest_hex}"',
+        )
+
+    assert response.status_code == 304
+
+
+def test_blob_endpoint_supports_ranges(client, stored_version):
+    response = client.get(f"/api/blobs/{stored_version.digest_hex}/", HTTP_RANGE="bytes=0-0")
+
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == CONTENT[:1]
+
+
+@pytest.mark.parametrize("digest", ["../../etc/passwd", "A" * 64, "0" * 64])
+def test_blob_endpoint_rejects_unknown_digests(client, stored_version, digest):
+    response = client.get(f"/api/blobs/{digest}/")
+
+    assert response.status_code == 404
+
+
+def test_blob_endpoint_requires_authentication(stored_version):
+    response = APIClient().get(f"/api/blobs/{stored_version.digest_hex}/")
+
+    assert response.status_code in (401, 403)
+
+
+def _proxied_get(proxy, url, token):
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update(
+        {
+            "PATH_INFO": url,
+            "HTTP_HOST": "localhost",
+            "SERVER_NAME": "localhost",
+            "HTTP_AUTHORIZATION": f"Token {token.key}",
+        }
+    )
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"] = status
+        captured["headers"] = dict(headers)
+
+    # Like django.test.Client, keep the test's database connection open.
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        body = proxy(environ, start_response)
+        content = b"".join(body)
+        if hasattr(body, "close"):
+            body.close()
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+    return captured["status"], captured["headers"], content
+
+
+@pytest.mark.parametrize("mode", ["x-accel-redirect", "x-sendfile"])
+def test_download_offloads_transfer_to_proxy(user, stored_version, settings, mode):
+    settings.FILES_OFFLOAD = mode
+    settings.ALLOWED_HOSTS = ["localhost"]
+    token = Token.objects.create(user=user)
+    proxy = OffloadProxy(get_wsgi_application(), settings.FILES_ROOT, settings.FILES_OFFLOAD_PREFIX)
+
+    status, headers, content = _proxied_get(proxy, f"/api/file_versions/{stored_version.id}/download/", token)
+
+    assert status == "200 OK"
+    assert content == CONTENT
+    assert proxy.upstream_bytes == 0
+    assert headers["ETag"] == f'"{stored_version.digest_hex}"'
+    assert 'filename="data.bin"' in headers["Content-Disposition"]
+
+
+def test_offload_response_headers(client, stored_version, settings):
+    settings.FILES_OFFLOAD = "x-accel-redirect"
+    settings.FILES_OFFLOAD_PREFIX = "/internal/"
+
+    response = client.get(f"/api/blobs/{stored_version.digest_hex}/")
+
+    digest = stored_version.digest_hex
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response["X-Accel-Redirect"] == f"/internal/{digest[:2]}/{digest[2:4]}/{digest}"
+    assert response["Cache-Control"] == settings.FILES_BLOB_CACHE_CONTROL
+
+
+def test_offload_still_answers_conditional_requests(client, stored_version, settings):
+    settings.FILES_OFFLOAD = "x-accel-redirect"
+
+    response = client.get(
+        f"/api/file_versions/{stored_version.id}/download/",
+        HTTP_IF_NONE_MATCH=f'"{stored_version.digest_hex}"',
+    )
+
+    assert response.status_code == 304
+    assert "X-Accel-Redirect" not in response
+
+
+@pytest.fixture
+def compressed_version(storage):
+    content = b"compressible line of text\n" * 2000
+    writer = BlobWriter()
+    writer.write(content)
+    writer.store(CompressionPolicy("zlib"))
+    assert locate_blob(writer.digest_hex).name.endswith(".z")
+    version = FileVersion.objects.create(file_name="notes.txt", version_number=0, digest_hex=writer.digest_hex)
+    return version, content
+
+
+def test_download_decompresses_compressed_blob(client, compressed_version):
+    version, content = compressed_version
+
+    response = client.get(f"/api/file_versions/{version.id}/download/")
+
+    assert response.status_code == 200
+    assert int(response["Content-Length"]) == len(content)
+    assert b"".join(response.streaming_content) == content
+
+
+def test_download_ranges_of_compressed_blob(client, compressed_version):
+    version, content = compressed_version
+
+    response = client.get(f"/api/file_versions/{version.id}/download/", HTTP_RANGE="bytes=40000-40099")
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 40000-40099/{len(content)}"
+    assert b"".join(response.streaming_content) == content[40000:40100]
+
+
+def test_compressed_blob_is_never_offloaded(client, compressed_version, settings):
+    settings.FILES_OFFLOAD = "x-accel-redirect"
+    version, content = compressed_version
+
+    response = client.get(f"/api/blobs/{version.digest_hex}/")
+
+    assert "X-Accel-Redirect" not in response
+    assert b"".join(response.streaming_content) == content
+
+
+def test_download_rebuilds_delta_blob(client, storage, settings):
+    base = b"".join(b"line %d of the original text\n" % index for index in range(3000))
+    older = base.replace(b"line 10 ", b"line ten ")
+    digests = []
+    for content in (older, base):
+        writer = BlobWriter()
+        writer.write(content)
+        writer.store(CompressionPolicy(None))
+        digests.append(writer.digest_hex)
+    assert deltify(digests[0], digests[1], DeltaPolicy(enabled=True))
+    version = FileVersion.objects.create(file_name="text.txt", version_number=0, digest_hex=digests[0])
+    settings.FILES_OFFLOAD = "x-sendfile"
+
+    response = client.get(f"/api/file_versions/{version.id}/download/", HTTP_RANGE="bytes=200-299")
+
+    assert response.status_code == 206
+    assert "X-Sendfile" not in response
+    assert b"".join(response.streaming_content) == older[200:300]
+
+
+def test_download_streams_chunked_blob(client, storage, settings):
+    content = bytes(range(256)) * 400 + b"".join(b"line %d\n" % index for index in range(20000))
+    writer = BlobWriter()
+    writer.write(content)
+    writer.store(CompressionPolicy(None), ChunkingPolicy(enabled=True, min_size=512, avg_size=2048, max_size=8192))
+    assert locate_blob(writer.digest_hex).name.endswith(".m")
+    version = FileVersion.objects.create(file_name="chunked.txt", version_number=0, digest_hex=writer.digest_hex)
+    settings.FILES_OFFLOAD = "x-accel-redirect"
+
+    response = client.get(f"/api/file_versions/{version.id}/download/", HTTP_RANGE="bytes=100000-150000")
+
+    assert response.status_code == 206
+    assert "X-Accel-Redirect" not in response
+    assert b"".join(response.streaming_content) == content[100000:150001]
+
+
+def test_download_serves_packed_blob(client, storage, settings):
+    content = b"a small packed document\n" * 100
+    writer = BlobWriter()
+    writer.write(content)
+    writer.store(CompressionPolicy(None))
+    repack(policy=PackPolicy(min_age=0))
+    assert is_packed(locate_blob(writer.digest_hex))
+    version = FileVersion.objects.create(file_name="packed.txt", version_number=0, digest_hex=writer.digest_hex)
+    settings.FILES_OFFLOAD = "x-accel-redirect"
+
+    response = client.get(f"/api/file_versions/{version.id}/download/", HTTP_RANGE="bytes=24-47")
+
+    assert response.status_code == 206
+    assert "X-Accel-Redirect" not in response
+    assert b"".join(response.streaming_content) == content[24:48]
+
+
+def test_blob_response_serves_blob_packed_after_it_was_located(storage, rf):
+    content = b"packed while the request was routed\n" * 10
+    writer = BlobWriter()
+    writer.write(content)
+    writer.store(CompressionPolicy(None))
+    path = locate_blob(writer.digest_hex)
+    repack(policy=PackPolicy(min_age=0))
+    assert not path.exists()
+
+    response = blob_response(rf.get("/", HTTP_RANGE="bytes=0-5"), path, "late.txt")
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 0-5/{len(content)}"
+    assert b"".join(response.streaming_content) == content[:6]
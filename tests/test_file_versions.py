@@ -1,12 +1,18 @@
 import hashlib
+import json
+import threading
 
 import pytest
+from django.db import IntegrityError, connection, transaction
 from rest_framework.test import APIClient
 
-from propylon_document_manager.file_versions.models import FileVersion, UserFileVersion
-from propylon_document_manager.utils import FileUpload
+from propylon_document_manager.file_versions.api.pagination import KeysetPagination
+from propylon_document_manager.file_versions.models import FileVersion, FileVersionHead, UserFileVersion
+from propylon_document_manager.utils import FileUpload, blob_path
+
 from .factories import UserFactory
 
+
 def test_file_versions():
     file_name = "new_file"
     file_version = 1
@@ -166,3 +172,270 @@ def test_user_file_list_endpoint_returns_files_for_authenticated_user(user, user
         {"file_name": "alpha.txt", "version": 0},
         {"file_name": "beta.txt", "version": 1},
     ]
+
+
+@pytest.mark.django_db
+def test_file_upload_view_can_store_file(user, tmp_path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    settings.FILES_IMPORT_ROOTS = [str(tmp_path)]
+    file_path = tmp_path / "stored.txt"
+    file_path.write_text("store me")
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    response = client.post(
+        "/api/file-uploads/",
+        {"filepath": str(file_path), "store": True},
+        format="json",
+    )
+
+    digest = hashlib.sha256(b"store me").hexdigest()
+    assert response.status_code == 200
+    assert response.json() == {"digest_hex": digest, "detail": f"File {file_path} saved successfully"}
+    assert blob_path(digest).exists()
+    assert FileVersion.objects.filter(file_name=str(file_path), digest_hex=digest).exists()
+
+
+@pytest.mark.django_db
+def test_file_upload_view_stores_only_from_import_roots(user, tmp_path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    imports = tmp_path / "imports"
+    imports.mkdir()
+    settings.FILES_IMPORT_ROOTS = [str(imports)]
+    secret = tmp_path / "secret.txt"
+    secret.write_text("private")
+    (imports / "link.txt").symlink_to(secret)
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    for filepath in (secret, imports / "link.txt", imports / ".." / "secret.txt"):
+        response = client.post("/api/file-uploads/", {"filepath": str(filepath), "store": True}, format="json")
+        assert response.status_code == 403
+
+    assert not FileVersion.objects.exists()
+
+    settings.FILES_IMPORT_ROOTS = []
+    (imports / "own.txt").write_text("own")
+    response = client.post("/api/file-uploads/", {"filepath": str(imports / "own.txt"), "store": True}, format="json")
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_download_action_serves_sharded_blob(user, tmp_path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    digest = hashlib.sha256(b"downloadable").hexdigest()
+    stored = blob_path(digest)
+    stored.parent.mkdir(parents=True)
+    stored.write_bytes(b"downloadable")
+    file_version = FileVersion.objects.create(file_name="report.txt", version_number=0, digest_hex=digest)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    response = client.get(f"/api/file_versions/{file_version.id}/download/")
+
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b"downloadable"
+    assert 'filename="report.txt"' in response["Content-Disposition"]
+
+
+@pytest.mark.django_db
+def test_download_action_returns_404_without_blob(user, tmp_path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    file_version = FileVersion.objects.create(file_name="gone.txt", version_number=0, digest_hex="c" * 64)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    response = client.get(f"/api/file_versions/{file_version.id}/download/")
+
+    assert response.status_code == 404
+
+
+def test_file_version_numbers_are_unique_per_file():
+    FileVersion.objects.create(file_name="unique.txt", version_number=0)
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        FileVersion.objects.create(file_name="unique.txt", version_number=0)
+
+
+def test_file_version_is_shared_with_a_user_once():
+    user = UserFactory()
+    file_version = FileVersion.objects.create(file_name="shared.txt", version_number=0)
+    UserFileVersion.objects.create(fileversion=file_version, user=user)
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        UserFileVersion.objects.create(fileversion=file_version, user=user)
+
+
+def test_create_next_version_seeds_from_existing_rows():
+    FileVersion.objects.create(file_name="seeded.txt", version_number=0)
+    FileVersion.objects.create(file_name="seeded.txt", version_number=4)
+
+    created = FileVersion.objects.create_next_version("seeded.txt", digest_hex="a" * 64)
+    following = FileVersion.objects.create_next_version("seeded.txt")
+
+    assert created.version_number == 5
+    assert following.version_number == 6
+    head = FileVersionHead.objects.get(file_name="seeded.txt")
+    assert head.latest_version == 6
+    assert head.fileversion == following
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_next_version_under_concurrent_writers():
+    writers = 8
+    versions_per_writer = 10
+    barrier = threading.Barrier(writers)
+    errors = []
+
+    def write_versions():
+        try:
+            barrier.wait()
+            for _ in range(versions_per_writer):
+                FileVersion.objects.create_next_version("contended.txt")
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=write_versions) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    numbers = sorted(FileVersion.objects.filter(file_name="contended.txt").values_list("version_number", flat=True))
+    assert numbers == list(range(writers * versions_per_writer))
+
+
+def _follow_pages(client, url):
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(response.json())
+        link = response.get("Link")
+        url = link[1 : link.index(">")] if link else None
+    return pages
+
+
+@pytest.mark.django_db
+def test_file_list_endpoint_paginates_with_keyset_cursor(user):
+    for file_name in ("beta.txt", "alpha.txt"):
+        for version_number in range(3):
+            FileVersion.objects.create(file_name=file_name, version_number=version_number)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    pages = _follow_pages(client, "/api/files/?page_size=4")
+
+    assert [len(page) for page in pages] == [4, 2]
+    assert [(row["file_name"], row["version_number"]) for page in pages for row in page] == [
+        ("alpha.txt", 0),
+        ("alpha.txt", 1),
+        ("alpha.txt", 2),
+        ("beta.txt", 0),
+        ("beta.txt", 1),
+        ("beta.txt", 2),
+    ]
+
+
+@pytest.mark.django_db
+def test_file_list_endpoints_paginate_by_default(user, monkeypatch):
+    monkeypatch.setattr(KeysetPagination, "page_size", 2)
+    for version_number in range(3):
+        file_version = FileVersion.objects.create(file_name="all.txt", version_number=version_number)
+        UserFileVersion.objects.create(fileversion=file_version, user=user)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    for url in ("/api/files/", "/api/files/user/", "/api/file_versions/"):
+        pages = _follow_pages(client, url)
+        assert [len(page) for page in pages] == [2, 1]
+    response = client.get("/api/files/?page_size=100000")
+    assert len(response.json()) == 3
+    assert "Link" not in response
+
+
+@pytest.mark.django_db
+def test_file_list_endpoint_rejects_invalid_cursor(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    response = client.get("/api/files/?cursor=not-a-cursor")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_user_file_list_endpoint_paginates(user):
+    for version_number in range(3):
+        file_version = FileVersion.objects.create(file_name="shared.txt", version_number=version_number)
+        UserFileVersion.objects.create(fileversion=file_version, user=user)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    pages = _follow_pages(client, "/api/files/user/?page_size=2")
+
+    assert pages == [
+        [{"file_name": "shared.txt", "version": 0}, {"file_name": "shared.txt", "version": 1}],
+        [{"file_name": "shared.txt", "version": 2}],
+    ]
+
+
+@pytest.mark.django_db
+def test_user_file_list_endpoint_skips_versions_of_other_users(user, user_factory):
+    other = user_factory()
+    for file_name in ("a.txt", "b.txt", "c.txt", "d.txt"):
+        file_version = FileVersion.objects.create(file_name=file_name, version_number=0)
+        UserFileVersion.objects.create(fileversion=file_version, user=other)
+        if file_name != "b.txt":
+            UserFileVersion.objects.create(fileversion=file_version, user=user)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    pages = _follow_pages(client, "/api/files/user/?page_size=2")
+
+    assert pages == [
+        [{"file_name": "a.txt", "version": 0}, {"file_name": "c.txt", "version": 0}],
+        [{"file_name": "d.txt", "version": 0}],
+    ]
+
+
+@pytest.mark.django_db
+def test_file_versions_endpoint_paginates(user):
+    created = [
+        FileVersion.objects.create(file_name="doc.txt", version_number=version_number) for version_number in range(3)
+    ]
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    pages = _follow_pages(client, "/api/file_versions/?page_size=2")
+
+    assert [row["id"] for page in pages for row in page] == [file_version.id for file_version in created]
+
+
+@pytest.mark.django_db
+def test_file_list_endpoint_streams_ndjson(user):
+    for version_number in range(3):
+        FileVersion.objects.create(file_name="export.txt", version_number=version_number, digest_hex="f" * 64)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    response = client.get("/api/files/?stream=1&page_size=1")
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert "Link" not in response
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row["version_number"] for row in rows] == [0, 1, 2]
+    assert all(row["digest_hex"] == "f" * 64 for row in rows)
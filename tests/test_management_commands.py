@@ -0,0 +1,239 @@
+import os
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from propylon_document_manager.file_versions.models import FileStatCache, FileVersion, FileVersionHead
+from propylon_document_manager.utils import BlobWriter, blob_path, locate_blob
+from propylon_document_manager.utils.compression import CompressionPolicy
+from propylon_document_manager.utils.metadata_cache import metadata_cache
+
+
+def test_migrate_file_layout_moves_flat_blobs(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    storage_dir = Path(settings.FILES_ROOT)
+    storage_dir.mkdir()
+    digests = ["a" * 64, "b" * 64]
+    for digest in digests:
+        (storage_dir / digest).write_text(digest)
+    (storage_dir / "notes.txt").write_text("not a blob")
+
+    out = StringIO()
+    call_command("migrate_file_layout", "--workers", "2", stdout=out)
+
+    for digest in digests:
+        assert not (storage_dir / digest).exists()
+        assert blob_path(digest).read_text() == digest
+    assert (storage_dir / "notes.txt").exists()
+    assert "Moved 2 blobs" in out.getvalue()
+
+
+def test_migrate_file_layout_is_resumable(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    storage_dir = Path(settings.FILES_ROOT)
+    digest = "c" * 64
+    migrated = blob_path(digest)
+    migrated.parent.mkdir(parents=True)
+    migrated.write_text("content")
+    # Left behind by an interrupted run that copied but did not clean up.
+    (storage_dir / digest).write_text("content")
+
+    out = StringIO()
+    call_command("migrate_file_layout", stdout=out)
+
+    assert not (storage_dir / digest).exists()
+    assert migrated.read_text() == "content"
+    assert "1 duplicates removed" in out.getvalue()
+
+
+def test_migrate_file_layout_dry_run(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    storage_dir = Path(settings.FILES_ROOT)
+    storage_dir.mkdir()
+    (storage_dir / ("d" * 64)).write_text("content")
+
+    out = StringIO()
+    call_command("migrate_file_layout", "--dry-run", stdout=out)
+
+    assert (storage_dir / ("d" * 64)).exists()
+    assert "1 blobs would be moved" in out.getvalue()
+
+
+def test_rebuild_latest_versions_points_heads_at_newest_rows():
+    FileVersion.objects.create(file_name="alpha.txt", version_number=0)
+    newest_alpha = FileVersion.objects.create(file_name="alpha.txt", version_number=2)
+    newest_beta = FileVersion.objects.create(file_name="beta.txt", version_number=0)
+    FileVersionHead.objects.create(file_name="alpha.txt", latest_version=0)
+
+    out = StringIO()
+    call_command("rebuild_latest_versions", "--batch-size", "1", stdout=out)
+
+    heads = {head.file_name: head for head in FileVersionHead.objects.all()}
+    assert heads["alpha.txt"].fileversion == newest_alpha
+    assert heads["alpha.txt"].latest_version == 2
+    assert heads["beta.txt"].fileversion == newest_beta
+    assert "Rebuilt 2 latest-version pointers" in out.getvalue()
+
+
+def test_ingest_tree_skips_unchanged_files(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    tree = tmp_path / "tree"
+    (tree / "nested").mkdir(parents=True)
+    (tree / "one.txt").write_text("one")
+    (tree / "nested" / "two.txt").write_text("two")
+
+    out = StringIO()
+    call_command("ingest_tree", str(tree), "--workers", "0", "--batch-size", "1", stdout=out)
+
+    assert "Ingested 2 new files (0 already stored, 0 unchanged, 0 errors)" in out.getvalue()
+    assert "files/s" in out.getvalue()
+    assert FileStatCache.objects.count() == 2
+    assert blob_path(FileStatCache.objects.get(path=str(tree / "one.txt")).digest_hex).exists()
+
+    (tree / "one.txt").write_text("changed")
+    out = StringIO()
+    call_command("ingest_tree", str(tree), "--workers", "0", stdout=out)
+
+    assert "Ingested 1 new files (0 already stored, 1 unchanged, 0 errors)" in out.getvalue()
+    versions = FileVersion.objects.filter(file_name=str(tree / "one.txt")).order_by("version_number")
+    assert list(versions.values_list("version_number", flat=True)) == [0, 1]
+
+
+def test_ingest_tree_with_process_pool(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "tree" / "storage"
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    for index in range(5):
+        (tree / f"{index}.txt").write_text(f"content {index}")
+    (tree / "copy.txt").write_text("content 0")
+
+    out = StringIO()
+    call_command("ingest_tree", str(tree), "--workers", "2", stdout=out)
+
+    assert "Ingested 5 new files (1 already stored, 0 unchanged, 0 errors)" in out.getvalue()
+    assert not FileVersion.objects.filter(file_name__startswith=str(tree / "storage")).exists()
+
+
+def test_watch_folder_requires_directories(settings):
+    settings.FILES_WATCH_DIRECTORIES = []
+
+    with pytest.raises(CommandError, match="No directories to watch"):
+        call_command("watch_folder")
+
+
+def test_compression_report(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    for content, codec in [(b"text " * 10000, "zlib"), (b"raw", None)]:
+        writer = BlobWriter()
+        writer.write(content)
+        writer.store(CompressionPolicy(codec))
+
+    out = StringIO()
+    call_command("compression_report", stdout=out)
+
+    lines = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[1:]}
+    assert lines["zlib"][1:3] == ["1", "50000"]
+    assert lines["none"][1:4] == ["1", "3", "3"]
+    assert lines["total"][1:3] == ["2", "50003"]
+
+
+def test_chunking_benchmark(tmp_path: Path):
+    content = bytes(range(256)) * 200 + b"".join(b"paragraph %d\n" % index for index in range(5000))
+    (tmp_path / "a.txt").write_bytes(content)
+    (tmp_path / "b.txt").write_bytes(content[:30000] + b"edit" + content[30000:])
+
+    out = StringIO()
+    call_command(
+        "chunking_benchmark", str(tmp_path), "--min-size=256", "--avg-size=1024", "--max-size=4096", stdout=out
+    )
+
+    lines = {line.split(":")[0]: line for line in out.getvalue().splitlines()}
+    assert lines["files"].split()[1] == "2"
+    assert lines["whole-file"].split()[-3] == "1.00x"
+    assert float(lines["chunked"].split()[-3][:-1]) > 1.8
+    assert "MB/s" in out.getvalue()
+
+
+def test_repack_blobs(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    for content in (b"one", b"two", os.urandom(100_000)):
+        writer = BlobWriter()
+        writer.write(content)
+        writer.store(CompressionPolicy(None))
+
+    out = StringIO()
+    call_command("repack_blobs", "--min-age=0", stdout=out)
+
+    assert "Packed 2 loose blobs (6 bytes); wrote 1 packs" in out.getvalue()
+    report = StringIO()
+    call_command("compression_report", stdout=report)
+    assert report.getvalue().splitlines()[-1].split()[1] == "3"
+
+
+@pytest.mark.django_db
+def test_collect_garbage(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    writer = BlobWriter()
+    writer.write(b"orphan")
+    writer.store(CompressionPolicy(None))
+
+    out = StringIO()
+    call_command("collect_garbage", "--dry-run", "--grace-period=0", stdout=out)
+    assert "Would remove 1 blobs (6 bytes)" in out.getvalue()
+    call_command("collect_garbage", "--grace-period=0", stdout=out)
+    assert "Removed 1 blobs (6 bytes)" in out.getvalue()
+    assert locate_blob(writer.digest_hex) is None
+
+
+@pytest.mark.django_db
+def test_scrub_blobs(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    writer = BlobWriter()
+    writer.write(b"content")
+    writer.store(CompressionPolicy(None))
+    FileVersion.objects.create_next_version("file.txt", digest_hex=writer.digest_hex)
+    FileVersion.objects.create_next_version("gone.txt", digest_hex="0" * 64)
+
+    out, err = StringIO(), StringIO()
+    call_command("scrub_blobs", "--rate=100", stdout=out, stderr=err)
+
+    assert "Scrubbed 2 blobs" in out.getvalue()
+    assert "1 ok, 0 mismatched, 1 missing" in out.getvalue()
+    assert f"missing: {'0' * 64}" in err.getvalue()
+
+
+def test_metadata_cache_stats():
+    metadata_cache.reset_metrics()
+    metadata_cache.get_or_set("scope", "key", lambda: 1)
+    metadata_cache.get_or_set("scope", "key", lambda: 1)
+
+    out = StringIO()
+    call_command("metadata_cache_stats", "--reset", stdout=out)
+
+    assert out.getvalue().strip() == "hits 1, misses 1, waits 0 (50.0% served from cache)"
+    assert metadata_cache.metrics()["hits"] == 0
+
+
+@pytest.mark.django_db
+def test_user_listing_benchmark():
+    out = StringIO()
+    call_command(
+        "user_listing_benchmark", "--versions=50", "--shares=5,50", "--page-size=10", "--repeat=1", stdout=out
+    )
+
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "versions: 50, page size: 10"
+    assert [line.split(":")[0] for line in lines[1:]] == ["shares         5", "shares        50"]
+    assert not FileVersion.objects.exists()
+
+
+@pytest.mark.django_db
+def test_user_listing_benchmark_refuses_a_database_with_files():
+    FileVersion.objects.create(file_name="real.txt", version_number=0)
+
+    with pytest.raises(CommandError, match="empty scratch database"):
+        call_command("user_listing_benchmark", "--versions=5", "--shares=5", stdout=StringIO())
+    assert FileVersion.objects.count() == 1
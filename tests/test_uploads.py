@@ -0,0 +1,384 @@
+import errno
+import hashlib
+import io
+import os
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.models import FileVersion, UploadSession, UserFileVersion
+from propylon_document_manager.utils import ChunkedUpload, ChunkTooLarge, FileUpload, blob_path
+
+from .factories import store_content
+
+
+def stored_files(storage: Path) -> list[Path]:
+    return sorted(path for path in storage.rglob("*") if path.is_file())
+
+
+def test_content_upload_streams_into_store(client, storage, user, settings):
+    payload = b"multipart payload " * 100000
+    settings.FILE_UPLOAD_MAX_MEMORY_SIZE = 0
+
+    response = client.post(
+        "/api/file-uploads/content/",
+        {"file": SimpleUploadedFile("bill.txt", payload), "file_name": "bills/bill.txt"},
+        format="multipart",
+    )
+
+    digest = hashlib.sha256(payload).hexdigest()
+    assert response.status_code == 201
+    assert response.json()["digest_hex"] == digest
+    assert response.json()["file_name"] == "bills/bill.txt"
+    assert response.json()["version_number"] == 0
+    assert stored_files(storage) == [blob_path(digest)]
+    assert blob_path(digest).read_bytes() == payload
+    assert UserFileVersion.objects.filter(user=user, fileversion__digest_hex=digest).exists()
+
+
+def test_content_upload_creates_next_version(client, storage):
+    FileVersion.objects.create(file_name="bill.txt", version_number=0, digest_hex="a" * 64)
+
+    response = client.post(
+        "/api/file-uploads/content/",
+        {"file": SimpleUploadedFile("bill.txt", b"second draft")},
+        format="multipart",
+    )
+
+    assert response.status_code == 201
+    assert response.json()["version_number"] == 1
+
+
+def test_content_upload_deduplicates_and_cleans_up(client, storage):
+    FileVersion.objects.create(
+        file_name="original.txt",
+        version_number=0,
+        digest_hex=hashlib.sha256(b"same").hexdigest(),
+    )
+
+    response = client.post(
+        "/api/file-uploads/content/",
+        {"file": SimpleUploadedFile("copy.txt", b"same")},
+        format="multipart",
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"detail": "File already exists.", "digest_hex": hashlib.sha256(b"same").hexdigest()}
+    assert stored_files(storage) == []
+
+
+def test_content_upload_requires_file(client, storage):
+    response = client.post("/api/file-uploads/content/", {"file_name": "x.txt"}, format="multipart")
+
+    assert response.status_code == 400
+    assert stored_files(storage) == []
+
+
+def test_chunked_upload_session_round_trip(client, storage, user):
+    payload = b"".join(bytes([index]) * 1000 for index in range(5))
+    chunks = [payload[offset : offset + 1000] for offset in range(0, len(payload), 1000)]
+
+    created = client.post("/api/upload-sessions/", {"file_name": "amendment.pdf"}, format="json")
+    assert created.status_code == 201
+    session_id = created.json()["id"]
+
+    # Chunks arrive out of order, and one is retried.
+    for index in (3, 0, 4, 1, 1):
+        response = client.put(
+            f"/api/upload-sessions/{session_id}/chunks/{index}/",
+            chunks[index],
+            content_type="application/octet-stream",
+        )
+        assert response.status_code == 200
+        assert response.json() == {"index": index, "size": 1000}
+
+    status = client.get(f"/api/upload-sessions/{session_id}/")
+    assert status.json()["received_chunks"] == [0, 1, 3, 4]
+
+    incomplete = client.post(f"/api/upload-sessions/{session_id}/commit/", {"chunk_count": 5}, format="json")
+    assert incomplete.status_code == 400
+    assert incomplete.json()["missing_chunks"] == [2]
+
+    client.put(f"/api/upload-sessions/{session_id}/chunks/2/", chunks[2], content_type="application/octet-stream")
+    committed = client.post(f"/api/upload-sessions/{session_id}/commit/", {"chunk_count": 5}, format="json")
+
+    digest = hashlib.sha256(payload).hexdigest()
+    assert committed.status_code == 201
+    assert committed.json()["digest_hex"] == digest
+    assert committed.json()["file_name"] == "amendment.pdf"
+    assert stored_files(storage) == [blob_path(digest)]
+    assert blob_path(digest).read_bytes() == payload
+    assert not UploadSession.objects.filter(id=session_id).exists()
+    assert UserFileVersion.objects.filter(user=user, fileversion__digest_hex=digest).exists()
+
+
+def test_chunked_upload_rejects_oversized_chunk(client, storage, settings):
+    settings.FILES_UPLOAD_MAX_CHUNK_SIZE = 10
+    session_id = client.post("/api/upload-sessions/", {"file_name": "big.bin"}, format="json").json()["id"]
+
+    response = client.put(
+        f"/api/upload-sessions/{session_id}/chunks/0/",
+        b"x" * 11,
+        content_type="application/octet-stream",
+    )
+
+    assert response.status_code == 413
+    assert ChunkedUpload(session_id).received_chunks() == []
+
+
+def test_chunked_upload_enforces_session_limits(client, storage, settings):
+    settings.FILES_UPLOAD_MAX_CHUNKS = 3
+    settings.FILES_UPLOAD_MAX_SESSION_SIZE = 10
+    session_id = client.post("/api/upload-sessions/", {"file_name": "capped.bin"}, format="json").json()["id"]
+
+    def put(index, data):
+        return client.put(
+            f"/api/upload-sessions/{session_id}/chunks/{index}/", data, content_type="application/octet-stream"
+        )
+
+    assert put(3, b"x").status_code == 400
+    assert put(0, b"x" * 6).status_code == 200
+    assert put(1, b"x" * 5).status_code == 413
+    # A retried chunk only counts once.
+    assert put(0, b"x" * 6).status_code == 200
+    assert put(2, b"x" * 4).status_code == 200
+
+    commit = f"/api/upload-sessions/{session_id}/commit/"
+    assert client.post(commit, {"chunk_count": 10**10}, format="json").status_code == 400
+    incomplete = client.post(commit, {"chunk_count": 3}, format="json")
+    assert incomplete.status_code == 400
+    assert incomplete.json()["missing_chunks"] == [1]
+    assert ChunkedUpload(session_id).missing_chunks(3) == [1]
+    assert ChunkedUpload(session_id).stored_bytes() == 10
+
+
+def test_concurrent_chunks_share_the_session_limit(storage, settings):
+    settings.FILES_UPLOAD_MAX_SESSION_SIZE = 10
+    upload = ChunkedUpload("concurrent")
+
+    class Racing(io.BytesIO):
+        def read(self, size=-1):
+            # Another request stores chunk 0 after this one's first check.
+            if not upload.received_chunks():
+                upload.write_chunk(0, io.BytesIO(b"x" * 6))
+            return super().read(size)
+
+    with pytest.raises(ChunkTooLarge):
+        upload.write_chunk(1, Racing(b"y" * 6))
+    assert upload.received_chunks() == [0]
+    assert upload.stored_bytes() == 6
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (FileNotFoundError(errno.ENOENT, "gone"), 409),
+        (OSError(errno.ENOSPC, "No space left on device"), 507),
+        (OSError(errno.EIO, "Input/output error"), 500),
+    ],
+)
+def test_chunked_upload_commit_reports_storage_errors(client, storage, monkeypatch, error, expected):
+    session_id = client.post("/api/upload-sessions/", {"file_name": "failing.txt"}, format="json").json()["id"]
+    client.put(f"/api/upload-sessions/{session_id}/chunks/0/", b"data", content_type="application/octet-stream")
+
+    def fail(self, chunk_count):
+        raise error
+
+    monkeypatch.setattr(ChunkedUpload, "assemble", fail)
+    response = client.post(f"/api/upload-sessions/{session_id}/commit/", {"chunk_count": 1}, format="json")
+
+    assert response.status_code == expected
+    assert UploadSession.objects.filter(id=session_id).exists()
+
+
+def test_upload_sessions_are_private(client, storage, user_factory):
+    other = UploadSession.objects.create(user=user_factory(), file_name="theirs.txt")
+
+    response = client.put(
+        f"/api/upload-sessions/{other.id}/chunks/0/",
+        b"data",
+        content_type="application/octet-stream",
+    )
+
+    assert response.status_code == 404
+
+
+def test_delete_upload_session_removes_chunks(client, storage):
+    session_id = client.post("/api/upload-sessions/", {"file_name": "drop.txt"}, format="json").json()["id"]
+    client.put(f"/api/upload-sessions/{session_id}/chunks/0/", b"data", content_type="application/octet-stream")
+
+    response = client.delete(f"/api/upload-sessions/{session_id}/")
+
+    assert response.status_code == 204
+    assert stored_files(storage) == []
+
+
+def test_expire_upload_sessions(storage, user):
+    stale = UploadSession.objects.create(user=user, file_name="stale.txt")
+    fresh = UploadSession.objects.create(user=user, file_name="fresh.txt")
+    UploadSession.objects.filter(id=stale.id).update(updated_at=timezone.now() - timedelta(days=2))
+    ChunkedUpload(stale.id).write_chunk(0, io.BytesIO(b"old"))
+    ChunkedUpload(fresh.id).write_chunk(0, io.BytesIO(b"new"))
+    orphan = ChunkedUpload("orphan")
+    orphan.write_chunk(0, io.BytesIO(b"lost"))
+    old = time.time() - 3 * 24 * 60 * 60
+    os.utime(orphan.directory, (old, old))
+
+    out = StringIO()
+    call_command("expire_upload_sessions", stdout=out)
+
+    assert list(UploadSession.objects.values_list("id", flat=True)) == [fresh.id]
+    assert not ChunkedUpload(stale.id).directory.exists()
+    assert not orphan.directory.exists()
+    assert ChunkedUpload(fresh.id).received_chunks() == [0]
+    assert "Expired 1 upload sessions and removed 1 orphaned" in out.getvalue()
+
+
+def _store_blob(content: bytes, file_name: str = "stored.txt") -> str:
+    digest = store_content(content)
+    FileVersion.objects.create_next_version(file_name, digest_hex=digest)
+    return digest
+
+
+def test_preflight_reports_stored_digests(client, storage):
+    stored = _store_blob(b"known content")
+    recorded_but_missing = "b" * 64
+    FileVersion.objects.create(file_name="ghost.txt", version_number=0, digest_hex=recorded_but_missing)
+    unknown = "c" * 64
+
+    response = client.post(
+        "/api/file-uploads/preflight/",
+        {
+            "items": [
+                {"digest_hex": stored, "file_name": "new.txt"},
+                {"digest_hex": recorded_but_missing},
+                {"digest_hex": unknown, "file_name": "other.txt"},
+            ]
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200
+    assert response.json()["items"] == [
+        {"digest_hex": stored, "file_name": "new.txt", "exists": True},
+        {"digest_hex": recorded_but_missing, "file_name": None, "exists": False},
+        {"digest_hex": unknown, "file_name": "other.txt", "exists": False},
+    ]
+
+
+def test_preflight_validates_digests(client, storage):
+    response = client.post("/api/file-uploads/preflight/", {"items": [{"digest_hex": "xyz"}]}, format="json")
+
+    assert response.status_code == 400
+
+
+def test_reference_creates_version_without_bytes(client, storage, user):
+    digest = _store_blob(b"shared content", file_name="original.txt")
+
+    response = client.post(
+        "/api/file-uploads/reference/",
+        {"digest_hex": digest, "file_name": "copy.txt"},
+        format="json",
+    )
+
+    assert response.status_code == 201
+    assert response.json()["file_name"] == "copy.txt"
+    assert response.json()["version_number"] == 0
+    assert response.json()["digest_hex"] == digest
+    assert stored_files(storage) == [blob_path(digest)]
+    assert UserFileVersion.objects.filter(user=user, fileversion__file_name="copy.txt").exists()
+
+
+def test_reference_does_not_repeat_latest_content(client, storage):
+    digest = _store_blob(b"unchanged", file_name="same.txt")
+
+    response = client.post(
+        "/api/file-uploads/reference/",
+        {"digest_hex": digest, "file_name": "same.txt"},
+        format="json",
+    )
+
+    assert response.status_code == 200
+    assert FileVersion.objects.filter(file_name="same.txt").count() == 1
+
+
+def test_reference_rejects_unknown_digest(client, storage):
+    response = client.post(
+        "/api/file-uploads/reference/",
+        {"digest_hex": "d" * 64, "file_name": "missing.txt"},
+        format="json",
+    )
+
+    assert response.status_code == 404
+    assert not FileVersion.objects.filter(file_name="missing.txt").exists()
+
+
+def test_batch_upload_stores_each_file(client, storage, user, tmp_path, settings):
+    settings.FILES_BATCH_UPLOAD_WORKERS = 0
+    settings.FILES_IMPORT_ROOTS = [str(tmp_path / "source")]
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_bytes(b"alpha")
+    (source / "b.txt").write_bytes(b"alpha")
+
+    response = client.post(
+        "/api/file-uploads/batch/",
+        {"filepaths": [str(source / "a.txt"), str(source / "b.txt"), str(source / "c.txt")]},
+        format="json",
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "exists", "error"]
+    assert stored_files(storage) == [blob_path(hashlib.sha256(b"alpha").hexdigest())]
+    assert list(UserFileVersion.objects.filter(user=user).values_list("fileversion_id", flat=True)) == [
+        results[0]["id"]
+    ]
+
+
+def test_batch_upload_records_versions_and_ownership_together(client, storage, tmp_path, settings, monkeypatch):
+    settings.FILES_BATCH_UPLOAD_WORKERS = 0
+    settings.FILES_IMPORT_ROOTS = [str(tmp_path)]
+    (tmp_path / "a.txt").write_bytes(b"alpha")
+    executor = FileUpload.shared_executor()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("ownership insert failed")
+
+    monkeypatch.setattr(UserFileVersion.objects, "bulk_create", fail)
+    with pytest.raises(RuntimeError):
+        client.post("/api/file-uploads/batch/", {"filepaths": [str(tmp_path / "a.txt")]}, format="json")
+
+    assert not FileVersion.objects.exists()
+    assert FileUpload.shared_executor() is executor
+
+
+def test_batch_upload_rejects_paths_outside_import_roots(client, storage, tmp_path, settings):
+    settings.FILES_BATCH_UPLOAD_WORKERS = 0
+    settings.FILES_IMPORT_ROOTS = [str(tmp_path / "source")]
+    (tmp_path / "source").mkdir()
+    (tmp_path / "source" / "a.txt").write_bytes(b"alpha")
+    (tmp_path / "secret.txt").write_bytes(b"secret")
+
+    response = client.post(
+        "/api/file-uploads/batch/",
+        {"filepaths": [str(tmp_path / "source" / "a.txt"), str(tmp_path / "source" / ".." / "secret.txt")]},
+        format="json",
+    )
+
+    assert response.status_code == 400
+    assert "secret.txt" in response.json()["filepaths"][0]
+    assert not FileVersion.objects.exists()
+    assert stored_files(storage) == []
+
+
+def test_batch_upload_requires_paths(client, storage):
+    response = client.post("/api/file-uploads/batch/", {"filepaths": []}, format="json")
+
+    assert response.status_code == 400
@@ -0,0 +1,57 @@
+import hashlib
+import io
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.utils import BlobWriter, ingest_file, ingest_stream
+
+
+def test_ingest_stream_hashes_and_commits(tmp_path: Path):
+    storage_dir = tmp_path / "storage"
+    payload = b"x" * 3000 + b"tail"
+
+    writer = ingest_stream(io.BytesIO(payload), storage_dir, chunk_size=1024)
+    digest = hashlib.sha256(payload).hexdigest()
+
+    assert writer.digest_hex == digest
+    assert writer.size == len(payload)
+    assert writer.temp_path.parent == storage_dir
+
+    assert writer.commit(storage_dir / digest) is True
+    assert (storage_dir / digest).read_bytes() == payload
+    assert not writer.temp_path.exists()
+
+
+def test_ingest_file_does_not_overwrite_existing_blob(tmp_path: Path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"content")
+    storage_dir = tmp_path / "storage"
+    storage_dir.mkdir()
+    digest = hashlib.sha256(b"content").hexdigest()
+    (storage_dir / digest).write_bytes(b"content")
+
+    writer = ingest_file(source, storage_dir)
+
+    assert writer.commit(storage_dir / digest) is False
+    assert sorted(path.name for path in storage_dir.iterdir()) == [digest]
+
+
+def test_blob_writer_discards_on_error(tmp_path: Path):
+    storage_dir = tmp_path / "storage"
+
+    with pytest.raises(RuntimeError):
+        with BlobWriter(storage_dir) as writer:
+            writer.write(b"partial")
+            raise RuntimeError("client went away")
+
+    assert list(storage_dir.iterdir()) == []
+
+
+def test_blob_writer_defaults_to_files_root(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "files"
+
+    writer = BlobWriter()
+    writer.discard()
+
+    assert writer.storage_directory == tmp_path / "files"
@@ -0,0 +1,110 @@
+import hashlib
+import io
+import random
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.utils import FileUpload, locate_blob
+from propylon_document_manager.utils.blob_store import deltify, open_blob, read_blob
+from propylon_document_manager.utils.chunking import ChunkingPolicy, iter_chunks
+from propylon_document_manager.utils.delta import DeltaPolicy
+
+from .factories import store_content
+
+POLICY = ChunkingPolicy(enabled=True, min_size=512, avg_size=2048, max_size=8192)
+
+
+def document(seed: int = 3, size: int = 200_000) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def chunk_digests(content: bytes) -> list[str]:
+    return [hashlib.sha256(chunk).hexdigest() for chunk in iter_chunks(io.BytesIO(content), POLICY, read_size=1)]
+
+
+@pytest.fixture
+def storage(storage: Path, settings) -> Path:
+    settings.FILES_CHUNKING = True
+    settings.FILES_CHUNK_MIN_SIZE = POLICY.min_size
+    settings.FILES_CHUNK_AVG_SIZE = POLICY.avg_size
+    settings.FILES_CHUNK_MAX_SIZE = POLICY.max_size
+    return storage
+
+
+@pytest.mark.parametrize("content", [b"", b"short", document(), b"\0" * 50_000])
+def test_chunks_cover_content_within_bounds(content: bytes):
+    chunks = list(iter_chunks(io.BytesIO(content), POLICY))
+
+    assert b"".join(chunks) == content
+    assert all(len(chunk) <= POLICY.max_size for chunk in chunks)
+    assert all(len(chunk) >= POLICY.min_size for chunk in chunks[:-1])
+
+
+def test_boundaries_are_content_defined():
+    content = document()
+    edited = content[:1000] + b"inserted text" + content[1000:]
+
+    before, after = chunk_digests(content), chunk_digests(edited)
+
+    assert len(set(before) - set(after)) <= 2
+    assert 2000 < len(content) / len(before) < 8192
+
+
+def test_policy_rejects_inconsistent_sizes():
+    with pytest.raises(ValueError):
+        ChunkingPolicy(enabled=True, min_size=4096, avg_size=1024, max_size=8192).validate()
+
+
+def test_similar_blobs_share_chunks(storage: Path):
+    content = document()
+    first = store_content(content)
+    second = store_content(content[:150_000] + b"appended" + content[150_000:])
+
+    assert locate_blob(first).name.endswith(".m")
+    assert read_blob(first) == content
+    chunk_files = [path for path in (storage / "chunks").rglob("*") if path.is_file()]
+    assert sum(path.stat().st_size for path in chunk_files) < len(content) * 1.2
+    assert not any(path.name.startswith(".") for path in storage.iterdir())
+    assert deltify(first, second, DeltaPolicy(enabled=True)) is False
+
+
+def test_small_blobs_are_not_chunked(storage: Path):
+    digest_hex = store_content(b"small file")
+
+    assert locate_blob(digest_hex).name == digest_hex
+    assert not (storage / "chunks").exists()
+
+
+def test_chunked_blob_reads_and_seeks(storage: Path):
+    content = document()
+    path = locate_blob(store_content(content))
+
+    with open_blob(path) as file_obj:
+        assert file_obj.size == len(content)
+        file_obj.seek(123_456)
+        assert file_obj.read(10_000) == content[123_456:133_456]
+        file_obj.seek(5)
+        assert file_obj.read(3) == content[5:8]
+        assert file_obj.read() == content[8:]
+
+
+def test_missing_chunk_raises_os_error(storage: Path):
+    path = locate_blob(store_content(document()))
+    next(path for path in (storage / "chunks").rglob("*") if path.is_file()).unlink()
+
+    with pytest.raises(OSError):
+        with open_blob(path) as file_obj:
+            file_obj.read()
+
+
+def test_upload_many_chunks_in_workers(storage: Path, tmp_path: Path):
+    source = tmp_path / "bill.bin"
+    content = document(seed=9)
+    source.write_bytes(content)
+
+    [result] = FileUpload.upload_many([source], workers=0)
+
+    assert result["status"] == "created"
+    assert locate_blob(result["digest_hex"]).name.endswith(".m")
+    assert read_blob(result["digest_hex"]) == content
@@ -0,0 +1,121 @@
+import hashlib
+import io
+import os
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.utils import BlobWriter, FileDownload, FileUpload, blob_path, locate_blob
+from propylon_document_manager.utils.blob_store import blob_size, compressed_blob_path, open_blob
+from propylon_document_manager.utils.compression import CompressedBlobReader, CompressionPolicy, probe
+
+from .factories import store_content
+
+TEXT = b"".join(b"<row id='%d'>some repetitive xml content</row>\n" % index for index in range(5000))
+
+
+def test_probe_detects_compressible_content(tmp_path: Path):
+    text = tmp_path / "text.xml"
+    text.write_bytes(TEXT)
+    noise = tmp_path / "noise.bin"
+    noise.write_bytes(os.urandom(200_000))
+    small = tmp_path / "small.txt"
+    small.write_bytes(b"a" * 100)
+    policy = CompressionPolicy("zlib")
+
+    assert probe(text, policy)
+    assert not probe(noise, policy)
+    assert not probe(small, policy)
+    assert not probe(text, CompressionPolicy(None))
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_store_compresses_but_keeps_raw_digest(storage: Path, codec):
+    digest = store_content(TEXT, codec)
+
+    assert digest == hashlib.sha256(TEXT).hexdigest()
+    assert locate_blob(digest) == compressed_blob_path(digest)
+    assert not blob_path(digest).exists()
+    assert compressed_blob_path(digest).stat().st_size < len(TEXT) / 5
+    assert blob_size(locate_blob(digest)) == len(TEXT)
+    with open_blob(locate_blob(digest)) as blob:
+        assert blob.read() == TEXT
+
+
+def test_incompressible_content_stays_raw(storage: Path):
+    content = os.urandom(100_000)
+    digest = store_content(content, "zlib")
+
+    assert locate_blob(digest) == blob_path(digest)
+    assert blob_path(digest).read_bytes() == content
+
+
+def test_store_skips_digest_stored_in_either_form(storage: Path):
+    store_content(TEXT, "zlib")
+    writer = BlobWriter()
+    writer.write(TEXT)
+
+    assert not writer.store(CompressionPolicy(None))
+    assert not writer.temp_path.exists()
+    assert not blob_path(writer.digest_hex).exists()
+
+
+def test_reader_supports_random_access(storage: Path):
+    digest = store_content(TEXT, "zlib")
+    reader = CompressedBlobReader(locate_blob(digest))
+
+    assert reader.seek(0, io.SEEK_END) == len(TEXT)
+    for offset, length in [(100_000, 50), (10, 20), (len(TEXT) - 5, 100), (0, 1)]:
+        reader.seek(offset)
+        assert reader.read(length) == TEXT[offset : offset + length]
+    reader.close()
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_reader_decompresses_in_bounded_pieces(storage: Path, codec):
+    content = bytes(32 * 1024 * 1024)
+    digest = store_content(content, codec)
+    reader = CompressedBlobReader(locate_blob(digest))
+
+    total = 0
+    for block in iter(lambda: reader.read(64 * 1024), b""):
+        assert len(reader._buffer) <= 2 * 1024 * 1024
+        total += len(block)
+    assert total == len(content)
+    reader.close()
+
+
+def test_reader_reports_truncated_blob(storage: Path):
+    digest = store_content(TEXT, "zlib")
+    path = locate_blob(digest)
+    path.write_bytes(path.read_bytes()[:200])
+
+    with open_blob(path) as blob, pytest.raises(OSError, match="truncated"):
+        blob.read()
+
+
+def test_upload_and_download_round_trip_compressed(storage: Path, tmp_path: Path, settings):
+    settings.FILES_COMPRESSION = "auto"
+    source = tmp_path / "report.xml"
+    source.write_bytes(TEXT)
+
+    assert FileUpload(source).upload() == f"File {source} saved successfully"
+    digest = FileVersion.objects.get(file_name=str(source)).digest_hex
+    assert locate_blob(digest).name.endswith(".z")
+
+    source.unlink()
+    assert FileDownload(source).download() == f"File {source} downloaded successfully"
+    assert source.read_bytes() == TEXT
+
+
+def test_upload_many_compresses_in_workers(storage: Path, tmp_path: Path, settings):
+    settings.FILES_COMPRESSION = "zlib"
+    source = tmp_path / "batch.xml"
+    source.write_bytes(TEXT)
+
+    results = FileUpload.upload_many([source], workers=0)
+
+    assert results[0]["status"] == "created"
+    assert locate_blob(results[0]["digest_hex"]) == compressed_blob_path(results[0]["digest_hex"])
+    assert [path.name for path in storage.rglob("*") if path.is_file()] == [results[0]["digest_hex"] + ".z"]
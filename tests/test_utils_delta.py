@@ -0,0 +1,179 @@
+import hashlib
+import os
+import random
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.utils import FileDownload, FileUpload, blob_path, locate_blob
+from propylon_document_manager.utils.blob_store import delta_blob_path, delta_chain, deltify, is_delta, read_blob
+from propylon_document_manager.utils.delta import (
+    HEADER,
+    DeltaPolicy,
+    ReconstructionCache,
+    decode,
+    encode,
+    reconstruction_cache,
+)
+
+
+def bill(revision: int, clauses: int = 2000) -> bytes:
+    generator = random.Random(7)
+    lines = [
+        b"<clause n='%d'>%s</clause>\n" % (index, generator.randbytes(30).hex().encode()) for index in range(clauses)
+    ]
+    for edit in range(revision):
+        lines[(edit * 97) % clauses] = b"<clause amended='%d'/>\n" % edit
+        lines.insert(edit * 13, b"<inserted revision='%d'/>\n" % revision)
+    return b"".join(lines)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    reconstruction_cache.clear()
+    yield
+    reconstruction_cache.clear()
+
+
+@pytest.fixture
+def storage(storage: Path, settings) -> Path:
+    settings.FILES_DELTA = True
+    return storage
+
+
+@pytest.mark.parametrize(
+    ("base", "target"),
+    [
+        (bill(0), bill(3)),
+        (bill(5), bill(0)),
+        (b"", bill(1)),
+        (bill(1), b""),
+        (b"no newline at all" * 100, b"no newline at all" * 99 + b"!"),
+        (os.urandom(5000), os.urandom(5000)),
+    ],
+)
+def test_encode_decode_round_trip(base: bytes, target: bytes):
+    assert decode(base, encode(base, target)) == target
+
+
+def test_encode_is_compact_for_small_edits():
+    base, target = bill(0), bill(2)
+
+    assert len(encode(base, target)) < len(target) / 20
+
+
+def test_encode_gives_up_past_max_size():
+    assert encode(os.urandom(10_000), os.urandom(10_000), max_size=5_000) is None
+
+
+def test_reconstruction_cache_evicts_least_recently_used():
+    cache = ReconstructionCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    cache.put("huge", b"x" * 11)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.get("huge") is None
+    assert cache.size == 8
+
+
+def upload_revisions(tmp_path: Path, revisions: list[bytes]) -> tuple[Path, list[str]]:
+    source = tmp_path / "bill.xml"
+    digests = []
+    for content in revisions:
+        source.write_bytes(content)
+        assert FileUpload(source).upload() == f"File {source} saved successfully"
+        digests.append(hashlib.sha256(content).hexdigest())
+    return source, digests
+
+
+def deltify_versions(*args: str) -> str:
+    stdout = StringIO()
+    call_command("deltify_versions", *args, stdout=stdout)
+    return stdout.getvalue()
+
+
+def test_previous_version_becomes_delta_against_latest(storage: Path, tmp_path: Path):
+    revisions = [bill(revision) for revision in range(4)]
+    source, digests = upload_revisions(tmp_path, revisions)
+    assert not any(is_delta(locate_blob(digest)) for digest in digests)
+    assert "Checked 4 new versions; stored 2 deltas" in deltify_versions()
+
+    assert locate_blob(digests[0]) == blob_path(digests[0])
+    assert [is_delta(locate_blob(digest)) for digest in digests[1:]] == [True, True, False]
+    assert delta_blob_path(digests[1]).stat().st_size < len(revisions[1]) / 20
+    assert delta_chain(digests[1]) == [digests[2], digests[3]]
+
+    for version, content in enumerate(revisions):
+        source.unlink()
+        assert FileDownload(source, version=version).download() == f"File {source} downloaded successfully"
+        assert source.read_bytes() == content
+    assert reconstruction_cache.get(digests[1]) == revisions[1]
+
+
+def test_keyframes_bound_chain_length(storage: Path, tmp_path: Path, settings):
+    settings.FILES_DELTA_KEYFRAME_INTERVAL = 3
+    revisions = [bill(revision) for revision in range(8)]
+    _, digests = upload_revisions(tmp_path, revisions)
+    deltify_versions()
+
+    kept_full = [index for index, digest in enumerate(digests) if not is_delta(locate_blob(digest))]
+    assert kept_full == [0, 3, 6, 7]
+    assert max(len(delta_chain(digest)) for digest in digests) <= 2
+    assert [read_blob(digest) for digest in digests] == revisions
+
+
+def test_deltify_refuses_cycles_and_unhelpful_deltas(storage: Path, tmp_path: Path):
+    noise = tmp_path / "noise.bin"
+    noise.write_bytes(os.urandom(50_000))
+    FileUpload(noise).upload()
+    _, digests = upload_revisions(tmp_path, [bill(0), bill(1)])
+    policy = DeltaPolicy(enabled=True)
+    noise_digest = FileVersion.objects.get(file_name=str(noise)).digest_hex
+
+    assert deltify(digests[0], digests[1], policy)
+    assert not deltify(digests[1], digests[0], policy)
+    assert not deltify(noise_digest, digests[1], policy)
+    assert read_blob(digests[1]) == bill(1)
+    assert read_blob(digests[0]) == bill(0)
+
+
+def test_corrupt_delta_is_reported_as_os_error(storage: Path, tmp_path: Path):
+    _, digests = upload_revisions(tmp_path, [bill(0), bill(1)])
+    assert deltify(digests[0], digests[1], DeltaPolicy(enabled=True))
+    path = delta_blob_path(digests[0])
+    path.write_bytes(path.read_bytes()[: HEADER.size] + b"not zlib")
+
+    with pytest.raises(OSError, match="Corrupt delta blob"):
+        read_blob(digests[0], cached=False)
+
+
+def test_delta_disabled_by_default(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    _, digests = upload_revisions(tmp_path, [bill(0), bill(1), bill(2)])
+
+    with pytest.raises(CommandError):
+        deltify_versions()
+    assert not any(is_delta(locate_blob(digest)) for digest in digests)
+
+
+def test_deltify_versions_resumes_from_checkpoint(storage: Path, tmp_path: Path):
+    source, digests = upload_revisions(tmp_path, [bill(0), bill(1)])
+    assert "Checked 1 new versions; stored 0 deltas" in deltify_versions("--limit", "1")
+    # Version 0 is a keyframe and stays full.
+    assert "Checked 1 new versions; stored 0 deltas" in deltify_versions()
+    assert "Checked 0 new versions" in deltify_versions()
+
+    source.write_bytes(bill(2))
+    FileUpload(source).upload()
+    assert not is_delta(locate_blob(digests[1]))
+    assert "Checked 1 new versions; stored 1 deltas" in deltify_versions()
+    assert [is_delta(locate_blob(digest)) for digest in digests] == [False, True]
+    assert "Checked 3 new versions; stored 0 deltas" in deltify_versions("--all")
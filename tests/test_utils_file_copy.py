@@ -0,0 +1,131 @@
+import errno
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.utils import file_copy
+from propylon_document_manager.utils.blob_store import ingest_file
+from propylon_document_manager.utils.file_copy import copy_file
+
+
+@pytest.fixture(autouse=True)
+def forget_preferred_strategies():
+    file_copy._preferred.clear()
+    yield
+    file_copy._preferred.clear()
+
+
+@pytest.fixture
+def source(tmp_path: Path) -> Path:
+    path = tmp_path / "source.bin"
+    path.write_bytes(os.urandom(300_000))
+    return path
+
+
+def unsupported(code):
+    def strategy(source_fd, destination_fd):
+        os.write(destination_fd, b"partial")
+        raise OSError(code, os.strerror(code))
+
+    return strategy
+
+
+def test_copy_file_uses_first_working_strategy(source: Path, tmp_path: Path, monkeypatch, caplog):
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "reflink", unsupported(errno.EOPNOTSUPP))
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "copy_file_range", unsupported(errno.EXDEV))
+    destination = tmp_path / "copy.bin"
+
+    with caplog.at_level(logging.INFO, logger="propylon_document_manager.utils.file_copy"):
+        used = copy_file(source, destination)
+
+    assert used == "sendfile"
+    assert destination.read_bytes() == source.read_bytes()
+    assert "with sendfile" in caplog.text
+
+
+def test_copy_file_remembers_strategy_per_device(source: Path, tmp_path: Path, monkeypatch):
+    calls = []
+
+    def failing_reflink(source_fd, destination_fd):
+        calls.append("reflink")
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "reflink", failing_reflink)
+    copy_file(source, tmp_path / "first.bin")
+    copy_file(source, tmp_path / "second.bin")
+
+    assert calls == ["reflink"]
+
+
+def test_copy_file_raises_real_errors(source: Path, tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "reflink", unsupported(errno.EIO))
+
+    with pytest.raises(OSError) as excinfo:
+        copy_file(source, tmp_path / "copy.bin")
+    assert excinfo.value.errno == errno.EIO
+
+
+def test_copy_file_raises_permission_errors(source: Path, tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "reflink", unsupported(errno.EPERM))
+
+    with pytest.raises(PermissionError):
+        copy_file(source, tmp_path / "copy.bin")
+
+
+def test_copy_file_returns_none_without_applicable_strategy(source: Path, tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "reflink", unsupported(errno.EOPNOTSUPP))
+    destination = tmp_path / "copy.bin"
+
+    assert copy_file(source, destination, strategies=["reflink"]) is None
+    assert destination.read_bytes() == b""
+
+
+def test_hardlink_only_for_read_only_sources(source: Path, tmp_path: Path):
+    assert copy_file(source, tmp_path / "writable.bin", strategies=["hardlink", "copy"]) == "copy"
+
+    source.chmod(0o444)
+    linked = tmp_path / "linked.bin"
+    linked.write_bytes(b"replaced")
+    assert copy_file(source, linked, strategies=["hardlink", "copy"]) == "hardlink"
+    assert linked.stat().st_ino == source.stat().st_ino
+
+
+def test_copy_file_can_copy_metadata(source: Path, tmp_path: Path):
+    os.utime(source, ns=(1_000_000_000, 1_000_000_000))
+    destination = tmp_path / "copy.bin"
+
+    copy_file(source, destination, strategies=["copy"], copy_metadata=True)
+
+    assert destination.stat().st_mtime_ns == 1_000_000_000
+
+
+def test_unknown_strategy_is_rejected(source: Path, tmp_path: Path, settings):
+    settings.FILES_COPY_STRATEGIES = ["teleport"]
+
+    with pytest.raises(ValueError, match="Unknown copy strategies: teleport"):
+        copy_file(source, tmp_path / "copy.bin")
+
+
+@pytest.mark.parametrize("strategies", [["copy_file_range"], ["copy"]])
+def test_ingest_file_hashes_the_stored_copy(source: Path, tmp_path: Path, strategies):
+    writer = ingest_file(source, tmp_path / "storage", strategies=strategies)
+
+    assert writer.digest_hex == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert writer.size == source.stat().st_size
+    assert writer.temp_path.read_bytes() == source.read_bytes()
+    writer.discard()
+    assert not writer.temp_path.exists()
+
+
+def test_ingest_file_streams_when_reflink_is_unsupported(source: Path, tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(file_copy.FD_STRATEGIES, "reflink", unsupported(errno.EOPNOTSUPP))
+    for name in ("copy_file_range", "sendfile", "copy"):
+        monkeypatch.setitem(file_copy.FD_STRATEGIES, name, unsupported(errno.EIO))
+
+    writer = ingest_file(source, tmp_path / "storage", strategies=file_copy.DEFAULT_STRATEGIES)
+
+    assert writer.digest_hex == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert writer.temp_path.read_bytes() == source.read_bytes()
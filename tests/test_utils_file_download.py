@@ -27,32 +27,6 @@ def test_get_latest_version_returns_highest_value(tmp_path: Path):
     assert downloader._get_latest_version() == 3
 
 
-@pytest.mark.django_db
-def test_get_files_of_user_returns_ids_for_authenticated_user(
-    tmp_path: Path, user, user_factory
-):
-    first_version = FileVersion.objects.create(file_name="first.txt", version_number=0)
-    second_version = FileVersion.objects.create(file_name="second.txt", version_number=2)
-    other_user = user_factory()
-
-    UserFileVersion.objects.create(fileversion=first_version, user=user)
-    UserFileVersion.objects.create(fileversion=second_version, user=user)
-    UserFileVersion.objects.create(fileversion=second_version, user=other_user)
-
-    downloader = FileDownload(filepath=str(tmp_path / "example.txt"), user=user)
-
-    result = downloader.get_files_of_user()
-
-    assert set(result) == {first_version.id, second_version.id}
-
-
-@pytest.mark.django_db
-def test_get_files_of_user_returns_empty_without_user(tmp_path: Path):
-    downloader = FileDownload(filepath=str(tmp_path / "unassigned.txt"))
-
-    assert downloader.get_files_of_user() == []
-
-
 @pytest.mark.django_db
 def test_file_list_returns_metadata_for_user(tmp_path: Path, user):
     first_version = FileVersion.objects.create(file_name="alpha.txt", version_number=0)
@@ -72,6 +46,22 @@ def test_file_list_returns_metadata_for_user(tmp_path: Path, user):
     assert result == expected
 
 
+@pytest.mark.django_db
+def test_user_files_is_a_single_query(user, user_factory, django_assert_num_queries):
+    other = user_factory()
+    for version_number in range(3):
+        file_version = FileVersion.objects.create(file_name="doc.txt", version_number=version_number)
+        UserFileVersion.objects.create(fileversion=file_version, user=other)
+        if version_number != 1:
+            UserFileVersion.objects.create(fileversion=file_version, user=user)
+    downloader = FileDownload(filepath="placeholder.txt", user=user)
+
+    with django_assert_num_queries(1):
+        rows = list(downloader.user_files())
+
+    assert [row["version_number"] for row in rows] == [0, 2]
+
+
 @pytest.mark.django_db
 def test_file_list_returns_empty_when_user_has_no_files(tmp_path: Path, user):
     downloader = FileDownload(filepath=str(tmp_path / "placeholder.txt"), user=user)
@@ -138,6 +128,22 @@ def test_get_file_data_defaults_to_latest_version(tmp_path: Path):
     assert record["version_number"] == 1
 
 
+@pytest.mark.django_db
+def test_get_file_data_uses_latest_pointer(tmp_path: Path, django_assert_num_queries):
+    file_path = tmp_path / "pointer.txt"
+    FileVersion.objects.create_next_version(str(file_path), digest_hex="a" * 64)
+    latest = FileVersion.objects.create_next_version(str(file_path), digest_hex="b" * 64)
+
+    downloader = FileDownload(filepath=str(file_path))
+
+    with django_assert_num_queries(1):
+        record = downloader.get_file_data()
+
+    assert record["id"] == latest.id
+    assert record["version_number"] == 1
+    assert downloader._get_latest_version() == 1
+
+
 @pytest.mark.django_db
 def test_get_file_data_respects_requested_version(tmp_path: Path):
     file_path = tmp_path / "specific.txt"
@@ -197,6 +203,22 @@ def test_download_returns_file(tmp_path: Path, settings):
     assert file_path.read_text() == "example content"
 
 
+@pytest.mark.django_db
+def test_download_returns_sharded_file(tmp_path: Path, settings):
+    file_path = tmp_path / "restored.txt"
+    settings.FILES_ROOT = tmp_path / "storage"
+    digest_hex = "e" * 64
+
+    stored_file = Path(settings.FILES_ROOT) / "ee" / "ee" / digest_hex
+    stored_file.parent.mkdir(parents=True)
+    stored_file.write_text("sharded content")
+
+    FileVersion.objects.create(file_name=str(file_path), version_number=0, digest_hex=digest_hex)
+
+    assert FileDownload(filepath=str(file_path)).download() == f"File {file_path} downloaded successfully"
+    assert file_path.read_text() == "sharded content"
+
+
 @pytest.mark.django_db
 def test_download_returns_message_when_missing(tmp_path: Path, settings):
     settings.FILES_ROOT = tmp_path / "storage"
@@ -239,9 +261,7 @@ def test_download_returns_message_when_source_missing(tmp_path: Path, settings):
 
 
 @pytest.mark.django_db
-def test_download_returns_error_when_copy_fails(
-    tmp_path: Path, settings, monkeypatch
-):
+def test_download_returns_error_when_copy_fails(tmp_path: Path, settings, monkeypatch):
     file_path = tmp_path / "error.txt"
     storage_dir = tmp_path / "storage"
     digest_hex = "d" * 64
@@ -264,7 +284,7 @@ def test_download_returns_error_when_copy_fails(
         raise OSError("permission denied")
 
     monkeypatch.setattr(
-        "propylon_document_manager.utils.file_download.shutil.copy2",
+        "propylon_document_manager.utils.file_download.copy_file",
         raise_oserror,
     )
 
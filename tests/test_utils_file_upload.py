@@ -2,9 +2,11 @@ import hashlib
 from pathlib import Path
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from propylon_document_manager.file_versions.models import FileVersion
-from propylon_document_manager.utils import FileUpload
+from propylon_document_manager.utils import FileDownload, FileUpload, blob_path
 
 
 def create_temp_file(tmp_path: Path, filename: str, content: str = "test content") -> Path:
@@ -18,13 +20,11 @@ def test_file_upload_requires_filepath():
         FileUpload("")
 
 
-
 def test_file_upload_raises_file_not_found(tmp_path: Path):
     with pytest.raises(FileNotFoundError):
         FileUpload(tmp_path / "missing.txt")
 
 
-
 def test_file_upload_requires_actual_file(tmp_path: Path):
     directory_path = tmp_path / "subdir"
     directory_path.mkdir()
@@ -85,6 +85,20 @@ def test_upload_detects_existing_file_on_disk(tmp_path: Path, settings):
     assert FileVersion.objects.filter(file_name=str(file_path)).count() == 0
 
 
+@pytest.mark.django_db
+def test_upload_detects_existing_sharded_file(tmp_path: Path, settings):
+    file_path = create_temp_file(tmp_path, "sharded.txt", "sharded data")
+    settings.FILES_ROOT = tmp_path / "storage"
+
+    digest = hashlib.sha256(b"sharded data").hexdigest()
+    destination_path = blob_path(digest)
+    destination_path.parent.mkdir(parents=True)
+    destination_path.write_text("sharded data")
+
+    assert FileUpload(file_path).upload() == "File already exists."
+    assert not FileVersion.objects.filter(file_name=str(file_path)).exists()
+
+
 @pytest.mark.django_db
 def test_upload_saves_file_and_creates_record(tmp_path: Path, settings):
     file_path = create_temp_file(tmp_path, "fresh.txt", "fresh data")
@@ -93,7 +107,7 @@ def test_upload_saves_file_and_creates_record(tmp_path: Path, settings):
     uploader = FileUpload(file_path)
     message = uploader.upload()
 
-    expected_path = Path(settings.FILES_ROOT) / uploader.digest_hex
+    expected_path = blob_path(uploader.digest_hex)
 
     assert message == f"File {file_path} saved successfully"
     assert expected_path.exists()
@@ -138,11 +152,96 @@ def test_upload_handles_copy_error(tmp_path: Path, settings, monkeypatch):
     def raise_os_error(*args, **kwargs):
         raise OSError("disk full")
 
-    monkeypatch.setattr("propylon_document_manager.utils.file_upload.shutil.copy2", raise_os_error)
+    monkeypatch.setattr("propylon_document_manager.utils.file_upload.ingest_file", raise_os_error)
 
     message = uploader.upload()
-    expected_path = Path(settings.FILES_ROOT) / uploader.digest_hex
+    expected_path = blob_path(uploader.digest_hex)
 
     assert message == f"Error saving {file_path}: disk full"
     assert not expected_path.exists()
     assert not FileVersion.objects.filter(file_name=str(file_path)).exists()
+
+
+@pytest.mark.django_db
+def test_upload_reads_source_once(tmp_path: Path, settings, monkeypatch):
+    file_path = create_temp_file(tmp_path, "single_pass.txt", "read me once")
+    settings.FILES_ROOT = tmp_path / "storage"
+
+    def fail_on_digest(self):
+        raise AssertionError("upload should hash while copying")
+
+    monkeypatch.setattr(FileUpload, "_calculate_digest", fail_on_digest)
+
+    uploader = FileUpload(file_path)
+    message = uploader.upload()
+
+    assert message == f"File {file_path} saved successfully"
+    assert uploader.digest_hex == hashlib.sha256(b"read me once").hexdigest()
+    stored_files = [path for path in Path(settings.FILES_ROOT).rglob("*") if path.is_file()]
+    assert stored_files == [blob_path(uploader.digest_hex)]
+    assert stored_files[0].read_text() == "read me once"
+
+
+@pytest.mark.django_db
+def test_upload_discards_temp_file_for_duplicate_content(tmp_path: Path, settings):
+    file_path = create_temp_file(tmp_path, "again.txt", "same bytes")
+    settings.FILES_ROOT = tmp_path / "storage"
+
+    FileVersion.objects.create(
+        file_name="original.txt",
+        version_number=0,
+        digest_hex=hashlib.sha256(b"same bytes").hexdigest(),
+    )
+
+    assert FileUpload(file_path).upload() == "File already exists."
+    assert list(Path(settings.FILES_ROOT).iterdir()) == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("workers", [0, 2])
+def test_upload_many_reports_per_item_results(tmp_path: Path, settings, workers):
+    settings.FILES_ROOT = tmp_path / "storage"
+    first = create_temp_file(tmp_path, "first.txt", "first content")
+    second = create_temp_file(tmp_path, "second.txt", "second content")
+    copy_of_first = create_temp_file(tmp_path, "copy.txt", "first content")
+    known = create_temp_file(tmp_path, "known.txt", "known content")
+    FileVersion.objects.create(
+        file_name="elsewhere.txt",
+        version_number=0,
+        digest_hex=hashlib.sha256(b"known content").hexdigest(),
+    )
+    FileVersion.objects.create(file_name=str(second), version_number=0, digest_hex="a" * 64)
+
+    results = FileUpload.upload_many([first, second, copy_of_first, known, tmp_path / "missing.txt"], workers=workers)
+
+    assert [result["status"] for result in results] == ["created", "created", "exists", "exists", "error"]
+    assert results[0]["detail"] == f"File {first} saved successfully"
+    assert results[1]["version_number"] == 1
+    assert results[2]["detail"] == "File already exists."
+    assert "File not found" in results[4]["detail"]
+
+    first_digest = hashlib.sha256(b"first content").hexdigest()
+    assert results[0]["digest_hex"] == first_digest
+    assert FileVersion.objects.get(id=results[0]["id"]).file_name == str(first)
+    assert FileDownload(filepath=str(second)).get_file_data()["id"] == results[1]["id"]
+
+    stored = sorted(path for path in Path(settings.FILES_ROOT).rglob("*") if path.is_file())
+    assert stored == sorted([blob_path(first_digest), blob_path(hashlib.sha256(b"second content").hexdigest())])
+
+
+@pytest.mark.django_db
+def test_upload_many_uses_one_bulk_insert(tmp_path: Path, settings):
+    settings.FILES_ROOT = tmp_path / "storage"
+    paths = [create_temp_file(tmp_path, f"doc{index}.txt", f"content {index}") for index in range(20)]
+
+    with CaptureQueriesContext(connection) as context:
+        results = FileUpload.upload_many(paths, workers=0)
+
+    inserts = [
+        query["sql"]
+        for query in context.captured_queries
+        if query["sql"].startswith('INSERT INTO "file_versions_fileversion"')
+    ]
+    assert len(inserts) == 1
+    assert {result["status"] for result in results} == {"created"}
+    assert FileVersion.objects.count() == 20
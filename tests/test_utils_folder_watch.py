@@ -0,0 +1,77 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.file_versions.models import FileStatCache, FileVersion
+from propylon_document_manager.utils import FileUpload
+from propylon_document_manager.utils.folder_watch import FolderWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+
+def poll_until(watcher: FolderWatcher, expected: int, timeout: float = 5.0) -> list[str]:
+    stored: list[str] = []
+    deadline = time.monotonic() + timeout
+    while len(stored) < expected and time.monotonic() < deadline:
+        stored += watcher.poll(timeout=0.1)
+    return stored
+
+
+@pytest.fixture
+def tree(tmp_path: Path, settings) -> Path:
+    settings.FILES_ROOT = tmp_path / "storage"
+    root = tmp_path / "share"
+    root.mkdir()
+    return root
+
+
+def test_watcher_stores_existing_and_new_files(tree: Path):
+    (tree / "existing.txt").write_text("existing")
+
+    with FolderWatcher([tree], debounce=0) as watcher:
+        watcher.start()
+        assert watcher.flush(force=True) == [str(tree / "existing.txt")]
+
+        (tree / "new.txt").write_text("new")
+        (tree / "nested").mkdir()
+        (tree / "nested" / "inner.txt").write_text("inner")
+        (tree / "draft").write_text("renamed")
+        (tree / "draft").rename(tree / "final.txt")
+        (tree / ".hidden").write_text("ignored")
+
+        stored = poll_until(watcher, 3)
+
+    assert sorted(stored) == sorted(str(tree / name) for name in ["new.txt", "nested/inner.txt", "final.txt"])
+    assert not FileVersion.objects.filter(file_name=str(tree / ".hidden")).exists()
+
+
+def test_watcher_debounces_bursts(tree: Path):
+    with FolderWatcher([tree], debounce=0.3) as watcher:
+        watcher.start()
+        for index in range(5):
+            (tree / "busy.txt").write_text(f"save {index}")
+            watcher.poll(timeout=0.01)
+
+        assert watcher.pending
+        stored = poll_until(watcher, 1)
+
+    assert stored == [str(tree / "busy.txt")]
+    assert FileVersion.objects.filter(file_name=str(tree / "busy.txt")).count() == 1
+
+
+def test_watcher_skips_files_matching_stat_cache(tree: Path, monkeypatch):
+    (tree / "report.txt").write_text("report")
+    with FolderWatcher([tree], debounce=0) as watcher:
+        watcher.start()
+        watcher.flush(force=True)
+    assert FileStatCache.objects.filter(path=str(tree / "report.txt")).exists()
+
+    def fail_upload(self):
+        raise AssertionError(f"{self.filepath} was rehashed")
+
+    monkeypatch.setattr(FileUpload, "upload", fail_upload)
+    with FolderWatcher([tree], debounce=0) as watcher:
+        watcher.start()
+        assert watcher.flush(force=True) == []
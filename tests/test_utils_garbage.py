@@ -0,0 +1,133 @@
+import os
+import random
+import time
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.utils import garbage, locate_blob
+from propylon_document_manager.utils.blob_store import deltify, read_blob, repack
+from propylon_document_manager.utils.chunking import CHUNK_DIRECTORY, ChunkingPolicy
+from propylon_document_manager.utils.delta import DeltaPolicy
+from propylon_document_manager.utils.garbage import DeltaBases, DigestSet, GarbageCollector, digest_prefix
+from propylon_document_manager.utils.packs import PackPolicy, is_packed
+
+from .factories import store_content
+
+CHUNKING = ChunkingPolicy(enabled=True, min_size=512, avg_size=2048, max_size=8192)
+
+
+def store(content: bytes, chunking=None, age: float = 2 * 24 * 60 * 60) -> str:
+    digest_hex = store_content(content, chunking=chunking)
+    # Everything stored so far ages, as if uploaded long ago.
+    old = time.time() - age
+    for path in Path(settings.FILES_ROOT).rglob("*"):
+        if age and path.is_file():
+            os.utime(path, (old, old))
+    return digest_hex
+
+
+def record(digest_hex: str, name: str = "file.txt") -> None:
+    FileVersion.objects.create(file_name=name, version_number=FileVersion.objects.count(), digest_hex=digest_hex)
+
+
+def test_digest_set():
+    digests = ["%064x" % random.Random(seed).getrandbits(256) for seed in range(1000)]
+    recorded = DigestSet.from_sorted(reversed(sorted(digests[:500])))
+
+    assert len(recorded) == 500
+    assert all(digest in recorded for digest in digests[:500])
+    assert not any(digest in recorded for digest in digests[500:])
+    assert all(digest in recorded.union(digests[500:]) for digest in digests)
+
+
+def test_delta_bases_follow_chains_from_live_deltas():
+    digests = ["%064x" % random.Random(seed).getrandbits(256) for seed in range(6)]
+    bases = DeltaBases()
+    # 0 -> 1 -> 2 is a chain from a live delta; 3 -> 4 hangs off a dead one.
+    for delta, base in ((2, 5), (0, 1), (3, 4), (1, 2)):
+        bases.add(digests[delta], digests[base])
+
+    assert len(bases) == 4
+    assert bases.base(digest_prefix(digests[1])) == digest_prefix(digests[2])
+    assert bases.base(digest_prefix(digests[4])) is None
+    live = DigestSet.from_sorted(sorted(digests[:1]))
+    assert bases.bases_of(live) == {digest_prefix(digests[index]) for index in (1, 2, 5)}
+
+
+@pytest.mark.django_db
+def test_collect_removes_only_orphans(storage: Path):
+    live = store(b"live")
+    orphan = store(b"orphan")
+    recent = store(b"recent", age=0)
+    record(live)
+
+    report = GarbageCollector().collect()
+
+    assert (report.blobs, report.blob_bytes, report.recent) == (1, 6, 1)
+    assert locate_blob(orphan) is None
+    assert read_blob(live) == b"live"
+    assert read_blob(recent) == b"recent"
+
+
+@pytest.mark.django_db
+def test_dry_run_removes_nothing(storage: Path):
+    orphan = store(b"orphan")
+
+    report = GarbageCollector(dry_run=True).collect()
+
+    assert report.blobs == 1
+    assert read_blob(orphan) == b"orphan"
+
+
+def test_mark_chunks_collects_shared_chunks_once(storage: Path, monkeypatch):
+    monkeypatch.setattr(garbage, "SORT_RUN", 4)
+    content = random.Random(3).randbytes(100_000)
+    # The three blobs share every chunk but their last.
+    for suffix in (b"a", b"b", b"c"):
+        store(content + suffix, chunking=CHUNKING)
+    chunk_names = {path.name for path in (storage / CHUNK_DIRECTORY).rglob("*") if path.is_file()}
+
+    marked = GarbageCollector().mark_chunks()
+
+    assert len(marked) == len(chunk_names)
+    assert all(name in marked for name in chunk_names)
+
+
+@pytest.mark.django_db
+def test_collect_keeps_delta_bases_and_live_chunks(storage: Path):
+    content = random.Random(1).randbytes(100_000)
+    base = store(content + b"base")
+    latest = store(content + b"latest")
+    assert deltify(latest, base, DeltaPolicy(enabled=True))
+    chunked = store(content + b"chunked", chunking=CHUNKING)
+    orphan_chunked = store(random.Random(2).randbytes(100_000), chunking=CHUNKING)
+    record(latest)
+    record(chunked)
+
+    report = GarbageCollector().collect()
+
+    assert report.blobs == 1 and report.chunks > 0
+    assert locate_blob(orphan_chunked) is None
+    assert read_blob(latest) == content + b"latest"
+    assert read_blob(chunked) == content + b"chunked"
+
+
+@pytest.mark.django_db
+def test_collect_rewrites_packs_without_orphans(storage: Path):
+    live = store(b"live")
+    orphan = store(b"orphan")
+    repack(policy=PackPolicy(min_age=0))
+    old = time.time() - 2 * 24 * 60 * 60
+    for path in (storage / "packs").iterdir():
+        os.utime(path, (old, old))
+    record(live)
+
+    report = GarbageCollector().collect()
+
+    assert report.packed == 1
+    assert locate_blob(orphan) is None
+    assert is_packed(locate_blob(live))
+    assert read_blob(live) == b"live"
@@ -0,0 +1,121 @@
+import threading
+from pathlib import Path
+
+import pytest
+from django.core.cache import cache
+
+from propylon_document_manager.file_versions.models import FileVersion, UserFileVersion
+from propylon_document_manager.utils import FileDownload
+from propylon_document_manager.utils.metadata_cache import MetadataCache, metadata_cache
+
+
+@pytest.fixture(autouse=True)
+def metrics():
+    metadata_cache.reset_metrics()
+
+
+@pytest.mark.django_db
+def test_file_data_is_served_from_cache(tmp_path: Path, django_assert_num_queries):
+    file_name = str(tmp_path / "cached.txt")
+    FileVersion.objects.create_next_version(file_name, digest_hex="a" * 64)
+    downloader = FileDownload(filepath=file_name)
+
+    first = downloader.get_file_data()
+    with django_assert_num_queries(0):
+        assert downloader.get_file_data() == first
+
+    assert metadata_cache.metrics() == {"hits": 1, "misses": 1, "waits": 0}
+
+
+@pytest.mark.django_db
+def test_new_version_invalidates_latest(tmp_path: Path, django_capture_on_commit_callbacks):
+    file_name = str(tmp_path / "latest.txt")
+    FileVersion.objects.create_next_version(file_name, digest_hex="a" * 64)
+    downloader = FileDownload(filepath=file_name)
+    assert downloader.get_file_data()["version_number"] == 0
+    other = FileDownload(filepath=str(tmp_path / "other.txt"))
+    FileVersion.objects.create_next_version(other.filepath, digest_hex="c" * 64)
+    other.get_file_data()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        FileVersion.objects.create_next_version(file_name, digest_hex="b" * 64)
+
+    assert downloader.get_file_data()["version_number"] == 1
+    assert downloader._get_file_data(file_name, 0)["digest_hex"] == "a" * 64
+    other.get_file_data()
+    assert metadata_cache.metrics()["hits"] == 1
+
+
+@pytest.mark.django_db
+def test_user_first_page_invalidated_by_ownership_changes(
+    user, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    version = FileVersion.objects.create(file_name="owned.txt", version_number=0)
+    downloader = FileDownload(filepath="placeholder.txt", user=user)
+    assert downloader.first_user_files(10) == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ownership = UserFileVersion.objects.create(fileversion=version, user=user)
+    assert [record["file_name"] for record in downloader.first_user_files(10)] == ["owned.txt"]
+    with django_assert_num_queries(0):
+        assert [record["file_name"] for record in downloader.first_user_files(10)] == ["owned.txt"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        version.file_name = "renamed.txt"
+        version.save()
+    assert [record["file_name"] for record in downloader.first_user_files(10)] == ["renamed.txt"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ownership.delete()
+    assert downloader.first_user_files(10) == []
+
+
+@pytest.mark.django_db
+def test_version_and_blob_lookups_are_cached(django_assert_num_queries, django_capture_on_commit_callbacks):
+    version = FileVersion.objects.create_next_version("by-id.txt", digest_hex="d" * 64)
+    assert FileDownload.get_blob_name("e" * 64) is None
+    assert FileDownload.get_version(version.pk)["file_name"] == "by-id.txt"
+    assert FileDownload.get_blob_name("d" * 64) == "by-id.txt"
+
+    with django_assert_num_queries(0):
+        assert FileDownload.get_version(version.pk)["digest_hex"] == "d" * 64
+        assert FileDownload.get_blob_name("d" * 64) == "by-id.txt"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        FileVersion.objects.create_next_version("other.txt", digest_hex="e" * 64)
+        version_id = version.pk
+        version.delete()
+    assert FileDownload.get_blob_name("e" * 64) == "other.txt"
+    assert FileDownload.get_blob_name("d" * 64) is None
+    assert FileDownload.get_version(version_id) is None
+
+
+def test_concurrent_miss_waits_for_the_first_reader():
+    metadata = MetadataCache(timeout=60)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        calls.append("slow")
+        started.set()
+        release.wait(5)
+        return "value"
+
+    first = threading.Thread(target=lambda: metadata.get_or_set("scope", "key", slow))
+    first.start()
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    assert metadata.get_or_set("scope", "key", lambda: calls.append("second")) == "value"
+    first.join()
+    assert calls == ["slow"]
+    assert metadata.metrics() == {"hits": 0, "misses": 1, "waits": 1}
+
+
+def test_disabled_cache_always_computes():
+    metadata = MetadataCache(timeout=0)
+
+    assert metadata.get_or_set("scope", "key", lambda: 1) == 1
+    assert metadata.get_or_set("scope", "key", lambda: 2) == 2
+    assert cache.get("fvmeta:metrics:misses") is None
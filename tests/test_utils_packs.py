@@ -0,0 +1,136 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.utils import FileDownload, locate_blob
+from propylon_document_manager.utils.blob_store import (
+    blob_size,
+    deltify,
+    iter_loose_blobs,
+    open_blob,
+    read_blob,
+    repack,
+)
+from propylon_document_manager.utils.delta import DeltaPolicy, reconstruction_cache
+from propylon_document_manager.utils.packs import PackPolicy, is_packed, pack_set
+
+from .factories import store_content
+
+POLICY = PackPolicy(max_blob_size=64 * 1024, max_pack_size=1024 * 1024, min_age=0)
+
+
+def test_repack_moves_small_blobs_into_a_pack(storage: Path):
+    contents = [b"small blob %d" % index for index in range(300)]
+    digests = [store_content(content) for content in contents]
+    large = store_content(os.urandom(100_000))
+
+    counts = repack(policy=POLICY)
+
+    assert counts["packed"] == 300
+    assert counts["packs_written"] == 1
+    assert [digest for digest, *_ in iter_loose_blobs()] == [large]
+    for digest, content in zip(digests, contents):
+        path = locate_blob(digest)
+        assert is_packed(path)
+        assert blob_size(path) == len(content)
+        assert read_blob(digest) == content
+    assert not is_packed(locate_blob(large))
+    assert pack_set().find("0" * 64) is None
+
+
+def test_repack_keeps_recent_blobs_loose(storage: Path):
+    digest = store_content(b"just written")
+
+    assert repack(policy=POLICY._replace(min_age=3600))["packed"] == 0
+    assert not is_packed(locate_blob(digest))
+
+
+def test_packed_blobs_keep_their_stored_form(storage: Path):
+    text = b"".join(b"line %d of a compressible document\n" % index for index in range(1500))
+    compressed = store_content(text, "zlib")
+    base = store_content(text.replace(b"line 7 ", b"line seven "))
+    assert deltify(compressed, base, DeltaPolicy(enabled=True))
+
+    repack(policy=POLICY)
+
+    for digest, expected in ((compressed, text), (base, text.replace(b"line 7 ", b"line seven "))):
+        path = locate_blob(digest)
+        assert is_packed(path)
+        with open_blob(path) as file_obj:
+            file_obj.seek(100)
+            assert file_obj.read(50) == expected[100:150]
+        reconstruction_cache.clear()
+        assert read_blob(digest) == expected
+
+
+def test_packed_blob_can_become_a_delta(storage: Path):
+    text = b"".join(b"line %d of a packed document\n" % index for index in range(1500))
+    old = store_content(text)
+    repack(policy=POLICY)
+    new = store_content(text.replace(b"line 7 ", b"line seven "))
+    assert is_packed(locate_blob(old))
+
+    assert deltify(old, new, DeltaPolicy(enabled=True))
+
+    assert locate_blob(old).name.endswith(".d")
+    reconstruction_cache.clear()
+    assert read_blob(old) == text
+
+
+def test_repack_skips_blobs_deltified_after_the_scan(storage: Path, monkeypatch):
+    from propylon_document_manager.utils import blob_store
+
+    kept, replaced = store_content(b"kept"), store_content(b"replaced")
+    scan = blob_store.iter_loose_blobs
+
+    def scan_then_replace(root):
+        entries = list(scan(root))
+        locate_blob(replaced).unlink()
+        yield from entries
+
+    monkeypatch.setattr(blob_store, "iter_loose_blobs", scan_then_replace)
+    counts = repack(policy=POLICY)
+
+    assert counts["packed"] == 1
+    assert counts["packed_bytes"] == len(b"kept")
+    assert is_packed(locate_blob(kept))
+    assert locate_blob(replaced) is None
+
+
+def test_located_loose_path_still_reads_after_repack(storage: Path):
+    digest = store_content(b"read while repacking")
+    path = locate_blob(digest)
+
+    repack(policy=POLICY)
+
+    assert not path.exists()
+    with open_blob(path) as file_obj:
+        assert file_obj.read() == b"read while repacking"
+
+
+def test_consolidate_merges_packs(storage: Path):
+    first = store_content(b"first")
+    repack(policy=POLICY)
+    second = store_content(b"second")
+    repack(policy=POLICY)
+    assert len(pack_set().refresh()) == 2
+
+    counts = repack(policy=POLICY, consolidate=True)
+
+    assert counts["packs_removed"] == 2
+    assert len(pack_set().refresh()) == 1
+    assert read_blob(first) == b"first"
+    assert read_blob(second) == b"second"
+
+
+@pytest.mark.django_db
+def test_file_download_restores_packed_blob(storage: Path, tmp_path: Path):
+    digest = store_content(b"packed content")
+    repack(policy=POLICY)
+    destination = tmp_path / "restored.txt"
+    FileVersion.objects.create(file_name=str(destination), version_number=0, digest_hex=digest)
+
+    assert FileDownload(filepath=str(destination)).download() == f"File {destination} downloaded successfully"
+    assert destination.read_bytes() == b"packed content"
@@ -0,0 +1,96 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from propylon_document_manager.file_versions.models import BlobVerification, FileVersion
+from propylon_document_manager.utils import locate_blob
+from propylon_document_manager.utils.blob_store import deltify, read_blob
+from propylon_document_manager.utils.chunking import ChunkingPolicy
+from propylon_document_manager.utils.delta import DeltaPolicy, reconstruction_cache
+from propylon_document_manager.utils.scrub import RateLimiter, Scrubber
+
+from .factories import store_content
+
+
+def store(content: bytes, chunking=None) -> str:
+    digest_hex = store_content(content, chunking=chunking)
+    FileVersion.objects.create_next_version("file.txt", digest_hex=digest_hex)
+    return digest_hex
+
+
+def test_rate_limiter_sleeps_past_the_burst(monkeypatch):
+    slept = []
+    monkeypatch.setattr("propylon_document_manager.utils.scrub.time.sleep", slept.append)
+    limiter = RateLimiter(1000)
+
+    limiter.consume(1000)
+    limiter.consume(500)
+
+    assert len(slept) == 1 and 0.4 < slept[0] <= 0.5
+    RateLimiter(None).consume(10**9)
+
+
+@pytest.mark.django_db
+def test_scrub_quarantines_corrupt_blob(storage: Path):
+    good = store(b"good")
+    bad = store(b"bad")
+    path = locate_blob(bad)
+    path.write_bytes(b"rot")
+
+    counts = Scrubber(rate=None).run()
+
+    assert counts == {"ok": 1, "mismatch": 1}
+    assert BlobVerification.objects.get(digest_hex=good).status == BlobVerification.OK
+    assert "quarantined" in BlobVerification.objects.get(digest_hex=bad).detail
+    assert locate_blob(bad) is None
+    assert [moved.read_bytes() for moved in (storage / ".quarantine").iterdir()] == [b"rot"]
+    assert Scrubber().run() == {"ok": 1, "missing": 1}
+
+
+@pytest.mark.django_db
+def test_scrub_quarantines_only_the_corrupt_chunk(storage: Path):
+    content = random.Random(4).randbytes(50_000)
+    digest = store(content, ChunkingPolicy(enabled=True, min_size=512, avg_size=2048, max_size=8192))
+    chunk = next(path for path in (storage / "chunks").rglob("*") if path.is_file())
+    chunk.write_bytes(b"x" + chunk.read_bytes()[1:])
+
+    assert Scrubber().run() == {"mismatch": 1}
+    assert locate_blob(digest).name.endswith(".m")
+    assert not chunk.exists()
+
+
+@pytest.mark.django_db
+def test_scrub_resumes_from_checkpoint(storage: Path):
+    digests = sorted(store(b"content %d" % index) for index in range(5))
+    scrubber = Scrubber()
+
+    assert scrubber.run(limit=3) == {"ok": 3}
+    assert scrubber.checkpoint() == digests[2]
+    assert scrubber.run() == {"ok": 2}
+    assert scrubber.checkpoint() is None
+    assert BlobVerification.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_scrub_rereads_deltas_and_charges_stored_bytes(storage: Path):
+    text = b"".join(b"line %d of a scrubbed document\n" % index for index in range(2000))
+    old = store(text)
+    new = store(text.replace(b"line 7 ", b"line seven "))
+    assert deltify(old, new, DeltaPolicy(enabled=True))
+    reconstruction_cache.clear()
+    assert read_blob(old) == text
+    charged = []
+    scrubber = Scrubber()
+    scrubber.limiter.consume = charged.append
+
+    assert scrubber.verify(old).status == "ok"
+    stored = locate_blob(old).stat().st_size + locate_blob(new).stat().st_size
+    assert abs(sum(charged) - stored) <= len(charged)
+
+    # The base rots on disk while the rebuilt content is still cached.
+    base = locate_blob(new)
+    base.write_bytes(b"rot" + base.read_bytes()[3:])
+    assert reconstruction_cache.get(old) == text
+    assert scrubber.verify(old).status in ("mismatch", "unreadable")
+    assert reconstruction_cache.get(old) == text